@@ -0,0 +1,148 @@
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+import arcade
+from PIL import Image
+
+import atlas_pack
+import chunks
+import map_bundle
+
+# Кэш ресурсов на весь процесс: кадры персонажа, собранные уровни и звуки.
+# Ключ — путь и mtime всех файлов-источников, вытеснение LRU по оценке занимаемой памяти.
+
+asset_cache_bytes = 96 * 1024 * 1024
+
+
+def resolve_path(path):
+    path = str(path)
+    if path.startswith(":"):
+        return Path(arcade.resources.resolve(path))
+    return Path(path).resolve()
+
+
+def stamp(paths):
+    stamps = []
+    for path in paths:
+        try:
+            stamps.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            stamps.append(None)
+    return tuple(stamps)
+
+
+class AssetCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        # ключ → [файлы-источники, их mtime, значение, размер]
+        self.entries = OrderedDict()
+
+    def get(self, key, loader, sizer, sources):
+        # sources — список файлов или функция, получающая их из загруженного значения
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[1] == stamp(entry[0]):
+                self.entries.move_to_end(key)
+                return entry[2]
+            self.drop(key)
+        value = loader()
+        sources = list(sources(value) if callable(sources) else sources)
+        size = sizer(value)
+        self.entries[key] = [sources, stamp(sources), value, size]
+        self.total_bytes += size
+        self.evict()
+        return value
+
+    def evict(self):
+        # Последняя запись остаётся, даже если одна не влезает в лимит
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            self.drop(next(iter(self.entries)))
+
+    def drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[3]
+            # Значения со своими потоками и ресурсами (подгрузка чанков) освобождаются сразу
+            close = getattr(entry[2], "close", None)
+            if close is not None:
+                close()
+
+    def refresh(self, key):
+        # Значение обновлено на месте по новым файлам (горячая перезагрузка): снова считается свежим
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        entry[1] = stamp(entry[0])
+        return entry[2]
+
+    def invalidate(self, path=None):
+        # Без пути — сбросить всё; с путём — записи, которые от него зависят
+        if path is None:
+            for key in list(self.entries):
+                self.drop(key)
+            return
+        path = resolve_path(path)
+        for key in [key for key, entry in self.entries.items() if path in entry[0]]:
+            self.drop(key)
+
+
+cache = AssetCache(asset_cache_bytes)
+
+
+def decode_image(path):
+    # Для фонового потока: только декодирование, текстуры arcade создаёт основной поток
+    return Image.open(resolve_path(path)).convert("RGBA")
+
+
+def load_frames(path, count, size=32, image=None):
+    # Кадры из горизонтальной полосы и их зеркальные варианты: та же картинка в атласе, отражённые UV.
+    # image — уже декодированная полоса (decode_image в фоне), иначе читается с диска
+    path = resolve_path(path)
+
+    def loader():
+        nonlocal image
+        if image is None:
+            image = decode_image(path)
+        frames = [arcade.Texture(image=image.crop((i * size, 0, i * size + size, size))) for i in range(count)]
+        mirrored = [texture.flip_left_right() for texture in frames]
+        return frames, mirrored
+
+    return cache.get(("frames", path, count, size), loader, lambda value: count * size * size * 4, [path])
+
+
+def load_tile_atlas(path):
+    # Собранный атлас тайлов уровня: с диска, если источники не менялись (см. atlas_pack)
+    path = resolve_path(path)
+    return cache.get(("atlas", path), lambda: atlas_pack.load_atlas(map_bundle.load_map(path)),
+                     lambda value: value.nbytes(), atlas_pack.PackedAtlas.dependencies)
+
+
+def load_level_streamer(path, scaling=1.0):
+    # Уровень и его подгружаемые чанки живут в кэше между перезапусками; сброс возвращает собранные фрукты
+    path = resolve_path(path)
+    entry = cache.get(
+        ("level", path, scaling),
+        lambda: chunks.ChunkStreamer(map_bundle.load_map(path), scaling, atlas=load_tile_atlas(path)),
+        lambda value: value.slot_texture.size[0] * value.slot_texture.size[1] * 4,
+        chunks.ChunkStreamer.dependencies,
+    )
+    return entry.reset()
+
+
+def refresh_level_streamer(path, scaling=1.0):
+    # После hot_reload уровень в кэше уже по новой карте: перезапуск не собирает его заново.
+    # Атлас остаётся в кэше, только если уровень рисует из него же
+    path = resolve_path(path)
+    streamer = cache.refresh(("level", path, scaling))
+    atlas = cache.entries.get(("atlas", path))
+    if streamer is not None and atlas is not None and atlas[2] is streamer.tile_atlas:
+        cache.refresh(("atlas", path))
+    else:
+        cache.drop(("atlas", path))
+
+
+def load_sound(path):
+    path = resolve_path(path)
+    return cache.get(("sound", path), lambda: arcade.load_sound(path), lambda value: os.path.getsize(path), [path])
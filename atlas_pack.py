@@ -0,0 +1,213 @@
+import json
+import math
+import os
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from level import GID_MASK
+
+# Атлас тайлов уровня, собранный заранее: каждый тайл, который встречается в слоях, один раз
+# упаковывается в общую картинку рядом с картой (maps/proj1.atlas.png), прямоугольники —
+# в таблицу (maps/proj1.atlas.json). При запуске картинка читается и загружается в GPU
+# одной текстурой вместо нарезки и добавления тайлов в атлас по одному.
+#
+# Ключ тайла — GID без флагов отражения: отражённые и повёрнутые варианты берут тот же
+# прямоугольник с переставленными углами UV, копий изображения нет.
+#
+#   python atlas_pack.py maps/proj1.tmx   — пересобрать и сравнить время загрузки
+
+VERSION = 1
+padding = 1  # пиксели вокруг тайла повторяют его край: выборка на границе не берёт соседа
+max_width = 1024
+
+# Флаги отражения в старших битах GID (формат Tiled)
+FLIPPED_HORIZONTALLY = 0x80000000
+FLIPPED_VERTICALLY = 0x40000000
+FLIPPED_DIAGONALLY = 0x20000000
+
+
+def atlas_paths(tmx_path):
+    tmx_path = Path(tmx_path)
+    return tmx_path.with_suffix(".atlas.png"), tmx_path.with_suffix(".atlas.json")
+
+
+def tile_images(level):
+    # Картинки всех тайлов из слоёв уровня: GID без флагов → изображение
+    images = {}
+    sheets = {}
+    for gids in level.layers.values():
+        for raw_gid in set(gids):
+            gid = raw_gid & GID_MASK
+            if not gid or gid in images:
+                continue
+            tileset = level.tileset_for(gid)
+            if tileset is None or tileset.image is None:
+                continue
+            sheet = sheets.get(tileset.image)
+            if sheet is None:
+                sheet = sheets[tileset.image] = Image.open(tileset.image).convert("RGBA")
+            images[gid] = sheet.crop(tileset.tile_box(gid))
+    return images
+
+
+def paste_padded(sheet, image, x, y):
+    width, height = image.size
+    sheet.paste(image, (x, y))
+    for offset in range(1, padding + 1):
+        sheet.paste(image.crop((0, 0, 1, height)), (x - offset, y))
+        sheet.paste(image.crop((width - 1, 0, width, height)), (x + width - 1 + offset, y))
+    # Строки — уже с боковыми полями, так заполняются и углы
+    top = sheet.crop((x - padding, y, x + width + padding, y + 1))
+    bottom = sheet.crop((x - padding, y + height - 1, x + width + padding, y + height))
+    for offset in range(1, padding + 1):
+        sheet.paste(top, (x - padding, y - offset))
+        sheet.paste(bottom, (x - padding, y + height - 1 + offset))
+
+
+def pack(images, width=max_width):
+    # Полки: картинки по убыванию высоты слева направо, новая полка — когда строка кончилась.
+    # Возвращает картинку атласа и {ключ: (x, y, ширина, высота)} в пикселях, ось Y вниз
+    order = sorted(images, key=lambda key: (-images[key].height, -images[key].width, key))
+    area = sum((image.width + 2 * padding) * (image.height + 2 * padding) for image in images.values())
+    widest = max((image.width + 2 * padding for image in images.values()), default=1)
+    width = min(width, max(widest, 1 << max(0, math.ceil(math.log2(math.sqrt(area or 1))))))
+    rects = {}
+    x = y = shelf = 0
+    for key in order:
+        image = images[key]
+        cell_width, cell_height = image.width + 2 * padding, image.height + 2 * padding
+        if x + cell_width > width:
+            x, y, shelf = 0, y + shelf, 0
+        rects[key] = (x + padding, y + padding, image.width, image.height)
+        x += cell_width
+        shelf = max(shelf, cell_height)
+    sheet = Image.new("RGBA", (width, max(1, y + shelf)), (0, 0, 0, 0))
+    for key, (left, top, _, _) in rects.items():
+        paste_padded(sheet, images[key], left, top)
+    return sheet, rects
+
+
+class PackedAtlas:
+    def __init__(self, image, rects, sources=()):
+        self.image = image
+        self.rects = rects  # GID без флагов → (x, y, ширина, высота)
+        self.sources = list(sources)
+        self.texture = None
+
+    def tile_uv(self, raw_gid):
+        # Углы UV в порядке arcade: верх-лево, верх-право, низ-лево, низ-право. Флаги Tiled
+        # применяются как в chunks.tile_texture: сначала диагональ, затем горизонталь, затем вертикаль
+        x, y, width, height = self.rects[raw_gid & GID_MASK]
+        atlas_width, atlas_height = self.image.size
+        u0, v0 = x / atlas_width, y / atlas_height
+        u1, v1 = (x + width) / atlas_width, (y + height) / atlas_height
+        upper_left, upper_right, lower_left, lower_right = (u0, v0), (u1, v0), (u0, v1), (u1, v1)
+        if raw_gid & FLIPPED_DIAGONALLY:
+            upper_right, lower_left = lower_left, upper_right
+        if raw_gid & FLIPPED_HORIZONTALLY:
+            upper_left, upper_right, lower_left, lower_right = upper_right, upper_left, lower_right, lower_left
+        if raw_gid & FLIPPED_VERTICALLY:
+            upper_left, upper_right, lower_left, lower_right = lower_left, lower_right, upper_left, upper_right
+        return upper_left + upper_right + lower_left + lower_right
+
+    def upload(self, ctx):
+        # Вся картинка — одной загрузкой; строка 0 картинки — v = 0, как в атласе arcade
+        if self.texture is None:
+            self.texture = ctx.texture(self.image.size, components=4, data=self.image.tobytes(),
+                                       filter=(ctx.NEAREST, ctx.NEAREST))
+        return self.texture
+
+    def nbytes(self):
+        return self.image.width * self.image.height * 4
+
+    def dependencies(self):
+        return self.sources
+
+
+def build_atlas(level, png_path, json_path):
+    png_path, json_path = Path(png_path), Path(json_path)
+    base = json_path.parent.resolve()
+    sheet, rects = pack(tile_images(level))
+    meta = {
+        "version": VERSION,
+        "rects": {str(gid): rect for gid, rect in rects.items()},
+        # Пути — относительно таблицы, как в скомпилированном уровне
+        "sources": [[os.path.relpath(Path(path).resolve(), base), os.stat(path).st_mtime_ns]
+                    for path in level.sources()],
+    }
+    temp_png = png_path.with_name(png_path.name + ".tmp")
+    temp_json = json_path.with_name(json_path.name + ".tmp")
+    sheet.save(temp_png, format="PNG")
+    with open(temp_json, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    # Таблица заменяется последней: свежая таблица не указывает на старую картинку
+    os.replace(temp_png, png_path)
+    os.replace(temp_json, json_path)
+    return PackedAtlas(sheet, rects, level.sources())
+
+
+def open_atlas(png_path, json_path):
+    # Готовый атлас, если он собран этой версией и ни один источник не менялся; иначе None
+    try:
+        with open(json_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != VERSION:
+            return None
+        base = Path(json_path).parent
+        sources = [(base / path).resolve() for path, _ in meta["sources"]]
+        for path, (_, stamp) in zip(sources, meta["sources"]):
+            if os.stat(path).st_mtime_ns != stamp:
+                return None
+        image = Image.open(png_path)
+        image.load()
+    except (OSError, ValueError, KeyError):
+        return None
+    return PackedAtlas(image.convert("RGBA"), {int(gid): tuple(rect) for gid, rect in meta["rects"].items()},
+                       sources)
+
+
+def load_atlas(level):
+    # Собирается заново, если TMX, тайлсеты или их картинки новее
+    png_path, json_path = atlas_paths(level.path)
+    atlas = open_atlas(png_path, json_path)
+    if atlas is not None:
+        return atlas
+    try:
+        return build_atlas(level, png_path, json_path)
+    except OSError:
+        # Папка только для чтения: атлас собирается в памяти
+        sheet, rects = pack(tile_images(level))
+        return PackedAtlas(sheet, rects, level.sources())
+
+
+def main():
+    from level import load_level
+    from map_bundle import load_map
+
+    tmx_path = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / "maps" / "proj1.tmx"
+    level = load_map(tmx_path)
+    png_path, json_path = atlas_paths(tmx_path)
+
+    started = time.perf_counter()
+    images = tile_images(load_level(tmx_path))
+    crop_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    atlas = build_atlas(level, png_path, json_path)
+    build_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    open_atlas(png_path, json_path)
+    open_time = time.perf_counter() - started
+
+    print(f"{png_path}: {len(atlas.rects)} тайлов, {atlas.image.width}×{atlas.image.height}, "
+          f"{os.path.getsize(png_path)} байт")
+    print(f"нарезка {len(images)} тайлов из тайлсетов: {crop_time * 1000:.1f} мс, сборка атласа: "
+          f"{build_time * 1000:.1f} мс, чтение готового: {open_time * 1000:.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
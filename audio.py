@@ -0,0 +1,101 @@
+import time
+
+from pyglet import media
+
+# Звуки игры через общий пул голосов.
+#
+# Звук декодируется один раз (assets.load_sound: arcade.Sound целиком в памяти) и регистрируется
+# под именем с громкостью и пределом одновременных голосов. play() в игровом цикле только
+# отмечает запрос: несколько запросов одного звука за кадр сливаются в одно воспроизведение
+# с наибольшей громкостью. update() раз в кадр запускает отмеченные звуки на голосах пула —
+# плееры pyglet создаются один раз при создании пула и переиспользуются.
+#
+# Голос занят до конца звука по часам, а не по событию pyglet о конце (оно приходит только через
+# цикл событий окна). Звук сверх своего предела пропускается; если свободных голосов нет,
+# забирается тот, что закончится раньше всех.
+#
+# Новый звук (смерть, рывок, прыжок) — register() и play(имя) в нужном месте, без изменений тут.
+# При выходе — close(): плееры удаляются до закрытия драйвера.
+
+voice_count = 8
+
+
+class Voice:
+    def __init__(self):
+        self.player = media.Player()
+        self.sound = None
+        self.ends = 0.0
+
+    def start(self, sound, volume, now):
+        player = self.player
+        if player.source is not None:
+            player.pause()
+            player.next_source()
+        player.volume = volume
+        player.queue(sound.source)
+        player.play()
+        self.sound = sound
+        self.ends = now + sound.duration
+
+
+class SoundEntry:
+    def __init__(self, sound, volume, max_voices):
+        self.source = sound.source
+        self.duration = sound.get_length()
+        self.volume = volume
+        self.max_voices = max_voices
+        self.requested = 0.0  # наибольшая громкость запросов этого кадра; 0 — запросов нет
+
+
+class AudioManager:
+    def __init__(self, voices=voice_count):
+        self.voices = [Voice() for _ in range(voices)]
+        self.sounds = {}
+        self.pending = []
+
+    def register(self, name, sound, volume=1.0, max_voices=2):
+        self.sounds[name] = SoundEntry(sound, volume, max_voices)
+
+    def play(self, name, volume=1.0):
+        entry = self.sounds.get(name)
+        if entry is None or volume <= 0:
+            return
+        if not entry.requested:
+            self.pending.append(entry)
+        entry.requested = max(entry.requested, volume * entry.volume)
+
+    def update(self):
+        if not self.pending:
+            return
+        now = time.monotonic()
+        for entry in self.pending:
+            volume, entry.requested = entry.requested, 0.0
+            playing = 0
+            free = oldest = None
+            for voice in self.voices:
+                if voice.ends <= now:
+                    free = free or voice
+                else:
+                    playing += voice.sound is entry
+                    if oldest is None or voice.ends < oldest.ends:
+                        oldest = voice
+            if playing < entry.max_voices:
+                (free or oldest).start(entry, volume, now)
+        self.pending.clear()
+
+    def stop(self):
+        for voice in self.voices:
+            voice.player.pause()
+            voice.ends = 0.0
+        for entry in self.pending:
+            entry.requested = 0.0
+        self.pending.clear()
+
+    def close(self):
+        # Плееры удаляются явно при выходе: иначе их добивает сборщик мусора, когда драйвер pyglet
+        # уже закрыт, и при завершении вылетает ReferenceError. После close() play() ничего не делает
+        self.stop()
+        for voice in self.voices:
+            voice.player.delete()
+        self.voices.clear()
+        self.sounds.clear()
@@ -0,0 +1,291 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+from level import default_map_path
+from map_bundle import load_map
+from simulation import (PlayerSim, EV_DIED, IN_LEFT, IN_RIGHT, IN_UP, IN_DOWN, IN_JUMP, IN_DASH, IN_CLIMB,
+                        spawn_x, spawn_y, tile_size, sim_rate)
+
+# Пакетная проверка уровня без окна: тысячи случайных или записанных последовательностей ввода
+# прогоняются через PlayerSim на всех ядрах. Отчёт: смерти по шипам, достигнутые фрукты, застрявшие прогоны.
+#
+#   python batch.py --runs 5000 --ticks 3600
+#   python batch.py --script route.txt --json report.json
+#   python batch.py --check     — сценарии CHECKS; код выхода 1, если итог разошёлся с записанным
+#
+# Формат сценария: строка «<тиков> <клавиши...>», клавиши — left right up down jump dash climb, «#» — комментарий.
+
+tick_rate = sim_rate
+stuck_ticks = 600
+stuck_span = 2 * tile_size
+
+INPUT_NAMES = {
+    "left": IN_LEFT, "right": IN_RIGHT, "up": IN_UP, "down": IN_DOWN,
+    "jump": IN_JUMP, "dash": IN_DASH, "climb": IN_CLIMB,
+}
+
+# Регрессия симуляции: фиксированный ввод и его итог на proj1 — (x, y, смертей, фруктов).
+# Правка физики, меняющая поведение, ломает проверку; намеренную — записать новые числа
+CHECKS = {
+    # Стена слева: упор, прыжок, лазание и срыв; пол; прыжок с разбега обратно к стене
+    "collision": ("""
+        40 left
+        10 left jump
+        60 left climb up
+        20
+        40 right
+        100
+        10 left
+        10 left jump
+        30 left
+    """, (20.2, 84.55, 0, 0)),
+    # Рывок в стену, вверх с земли, по диагонали после прыжка и вправо на шипы
+    "dash": ("""
+        4 left dash
+        26 left
+        4 up dash
+        26
+        4 right jump
+        4 right up dash
+        20 right
+        40
+        4 right dash
+        70
+    """, (84.0, 84.55, 1, 0)),
+}
+check_tolerance = 0.01
+
+# Уровень загружается один раз на процесс
+_world = None
+
+
+class World:
+    def __init__(self, map_path):
+        self.level = load_map(map_path)
+        self.grid = self.level.build_grid("Platforms")
+        self.hazards = self.level.build_object_index("idle")
+        self.fruits = self.level.build_object_index("fruits")
+
+
+def init_worker(map_path):
+    global _world
+    _world = World(map_path)
+
+
+def random_inputs(rng, ticks):
+    # Случайное блуждание: маска держится несколько тиков, как у живого игрока
+    while ticks > 0:
+        mask = rng.choice((0, IN_LEFT, IN_RIGHT, IN_RIGHT, IN_LEFT))
+        if rng.random() < 0.4:
+            mask |= IN_JUMP
+        if rng.random() < 0.3:
+            mask |= IN_CLIMB | rng.choice((IN_UP, IN_UP, IN_DOWN, 0))
+        if rng.random() < 0.15:
+            mask |= IN_DASH | rng.choice((0, IN_UP, IN_DOWN))
+        hold = min(ticks, rng.randint(4, 40))
+        ticks -= hold
+        for _ in range(hold):
+            yield mask
+
+
+def parse_lines(lines, source):
+    masks = []
+    for line in lines:
+        line = line.split("#", 1)[0].split()
+        if not line:
+            continue
+        mask = 0
+        for name in line[1:]:
+            if name not in INPUT_NAMES:
+                raise ValueError(f"{source}: неизвестная клавиша {name!r}")
+            mask |= INPUT_NAMES[name]
+        masks.extend([mask] * int(line[0]))
+    return masks
+
+
+def parse_script(path):
+    with open(path, encoding="utf-8") as f:
+        return parse_lines(f, path)
+
+
+def simulate(inputs, label):
+    world = _world
+    sim = PlayerSim(world.grid, spawn_x, spawn_y)
+    hit = []
+
+    def hazard_test(player):
+        touched = world.hazards.query(player.left, player.right, player.bottom, player.top)
+        if touched:
+            hit.append(touched[0])
+        return bool(touched)
+
+    sim.hazard_test = hazard_test
+    dt = 1 / tick_rate
+    deaths = Counter()
+    fruits = set()
+    ticks = 0
+    stuck = None
+    window = [sim.x, sim.x, sim.y, sim.y]
+    died_in_window = False
+    for mask in inputs:
+        sim.step(mask, dt)
+        ticks += 1
+        if sim.events & EV_DIED:
+            deaths[hit[-1]] += 1
+            died_in_window = True
+            continue
+        if sim.is_dead:
+            continue
+        for fruit in world.fruits.query(sim.left, sim.right, sim.bottom, sim.top):
+            fruits.add(fruit)
+        window[0] = min(window[0], sim.x)
+        window[1] = max(window[1], sim.x)
+        window[2] = min(window[2], sim.y)
+        window[3] = max(window[3], sim.y)
+        if ticks % stuck_ticks == 0:
+            # Застрял: за окно не умер и не выбрался из квадрата в две клетки
+            confined = window[1] - window[0] < stuck_span and window[3] - window[2] < stuck_span
+            if confined and not died_in_window or sim.top < 0:
+                col, row = int(sim.x // tile_size), int(sim.y // tile_size)
+                # Col/row как в Tiled: строка считается сверху
+                stuck = {"run": label, "tick": ticks, "cell": [col, world.level.height - 1 - row],
+                         "reason": "out_of_map" if sim.top < 0 else "no_progress"}
+                break
+            window = [sim.x, sim.x, sim.y, sim.y]
+            died_in_window = False
+    return deaths, fruits, stuck, ticks, (sim.x, sim.y)
+
+
+def run_task(task):
+    kind, payload, ticks = task
+    report = new_report()
+    if kind == "random":
+        first_seed, count = payload
+        runs = [(f"seed:{seed}", random_inputs(random.Random(seed), ticks))
+                for seed in range(first_seed, first_seed + count)]
+    else:
+        runs = [(f"script:{payload}", parse_script(payload))]
+    for label, inputs in runs:
+        deaths, fruits, stuck, run_ticks, _ = simulate(inputs, label)
+        report["runs"] += 1
+        report["ticks"] += run_ticks
+        report["deaths"].update(deaths)
+        report["fruits"].update(fruits)
+        if stuck:
+            report["stuck"].append(stuck)
+    return report
+
+
+def new_report():
+    return {"runs": 0, "ticks": 0, "deaths": Counter(), "fruits": Counter(), "stuck": []}
+
+
+def merge(total, part):
+    total["runs"] += part["runs"]
+    total["ticks"] += part["ticks"]
+    total["deaths"].update(part["deaths"])
+    total["fruits"].update(part["fruits"])
+    total["stuck"].extend(part["stuck"])
+
+
+def make_tasks(runs, ticks, seed, workers, scripts):
+    tasks = [("script", path, ticks) for path in scripts]
+    # Пачки семян: мало обменов между процессами и ровная загрузка ядер
+    chunk = max(1, runs // (workers * 8))
+    for first in range(seed, seed + runs, chunk):
+        tasks.append(("random", (first, min(chunk, seed + runs - first)), ticks))
+    return tasks
+
+
+def run_batch(map_path, runs, ticks, seed=0, workers=None, scripts=()):
+    workers = workers or os.cpu_count() or 1
+    tasks = make_tasks(runs, ticks, seed, workers, scripts)
+    total = new_report()
+    started = time.perf_counter()
+    if workers == 1:
+        init_worker(map_path)
+        for task in tasks:
+            merge(total, run_task(task))
+    else:
+        with multiprocessing.Pool(workers, initializer=init_worker, initargs=(map_path,)) as pool:
+            for part in pool.imap_unordered(run_task, tasks):
+                merge(total, part)
+    total["elapsed"] = time.perf_counter() - started
+    total["workers"] = workers
+    return total
+
+
+def run_checks(map_path):
+    # Список разошедшихся проверок; пустой — поведение симуляции не изменилось
+    init_worker(map_path)
+    failed = []
+    for name, (script, expected) in CHECKS.items():
+        deaths, fruits, _, _, (x, y) = simulate(parse_lines(script.splitlines(), name), f"check:{name}")
+        result = (round(x, 2), round(y, 2), sum(deaths.values()), len(fruits))
+        ok = all(abs(got - want) <= check_tolerance for got, want in zip(result, expected))
+        print(f"{name}: x={result[0]} y={result[1]}, смертей {result[2]}, фруктов {result[3]} — "
+              + ("ок" if ok else f"ожидалось x={expected[0]} y={expected[1]}, смертей {expected[2]}, "
+                                f"фруктов {expected[3]}"))
+        if not ok:
+            failed.append(name)
+    return failed
+
+
+def print_report(report, level):
+    elapsed = report["elapsed"]
+    print(f"прогонов: {report['runs']}, тиков: {report['ticks']}, "
+          f"{elapsed:.2f} с на {report['workers']} процессах ({report['ticks'] / elapsed:,.0f} тиков/с)")
+    print(f"смертей: {sum(report['deaths'].values())}")
+    for (col, row), count in report["deaths"].most_common(15):
+        print(f"  шип ({col}, {row}): {count}")
+    fruit_tiles = [(col, row) for col, row, _ in level.tile_cells("fruits")]
+    print(f"фрукты: достигнуто {len(report['fruits'])} из {len(fruit_tiles)}")
+    for cell in fruit_tiles:
+        print(f"  фрукт {cell}: {report['fruits'].get(cell, 0)} прогонов")
+    print(f"застряли: {len(report['stuck'])}")
+    for stuck in report["stuck"][:15]:
+        print(f"  {stuck['run']} — тик {stuck['tick']}, клетка {tuple(stuck['cell'])}, {stuck['reason']}")
+
+
+def report_json(report):
+    return {
+        "runs": report["runs"],
+        "ticks": report["ticks"],
+        "elapsed": report["elapsed"],
+        "workers": report["workers"],
+        "deaths_by_spike": {f"{col},{row}": count for (col, row), count in report["deaths"].most_common()},
+        "fruits_reached": {f"{col},{row}": count for (col, row), count in report["fruits"].most_common()},
+        "stuck": report["stuck"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетный прогон уровня без окна")
+    parser.add_argument("--map", default=str(default_map_path()), help="путь к TMX")
+    parser.add_argument("--runs", type=int, default=2000, help="число случайных прогонов")
+    parser.add_argument("--ticks", type=int, default=60 * tick_rate, help="длина прогона в тиках")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="процессов (по умолчанию все ядра)")
+    parser.add_argument("--script", action="append", default=[], help="файл сценария ввода (можно несколько)")
+    parser.add_argument("--json", help="сохранить отчёт в JSON")
+    parser.add_argument("--check", action="store_true", help="только сценарии CHECKS с записанным итогом")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(1 if run_checks(args.map) else 0)
+
+    report = run_batch(args.map, args.runs, args.ticks, args.seed, args.workers, args.script)
+    print_report(report, load_map(args.map))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report_json(report), f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
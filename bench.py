@@ -0,0 +1,276 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("ARCADE_HEADLESS", "1")
+
+import arcade
+import numpy as np
+
+import q31
+from batch import parse_lines
+
+# Замеры q31 на фиксированных сценариях без окна: рендер во внеэкранный буфер,
+# ввод из записанных сценариев, шаг 1/60 с. Сравнение с прошлым прогоном — по медианам.
+#
+#   python bench.py                                  — все сценарии, таблица
+#   python bench.py --save bench.json                — сохранить результаты
+#   python bench.py --compare bench.json --threshold 0.15   — код выхода 1 при регрессии
+#
+# Метрики сценария:
+#   update_ms / draw_ms      — медиана мс на тик (draw — с ожиданием GPU)
+#   alloc_bytes_per_tick     — сколько байт сверх начала тика выделяется в среднем (пик tracemalloc за тик)
+#   net_blocks_per_tick      — прирост живых блоков памяти за тик (утечки, растущие списки)
+#   peak_kb                  — пик памяти Python за сценарий по tracemalloc
+# Выделения меряются вторым, отдельным прогоном: tracemalloc сильно замедляет код.
+
+tick_rate = q31.sim_rate
+seed = 0
+
+# Формат сценариев — как у batch.py: «<тиков> <клавиши...>»
+SCENARIOS = {
+    # Стоим на земле у точки появления
+    "idle": """
+        600
+    """,
+    # К левой стене, прыжок на неё и вверх-вниз, пока хватает стамины; на земле стамина восстанавливается.
+    # С земли за стену не схватиться — только в воздухе
+    "wall_climb": """
+        40 left
+        10 left jump
+        150 left climb up
+        30 left climb
+        120 left climb down
+        60
+    """ * 4,
+    # Рывки в левую стену и вверх под потолок
+    "dash_spam": """
+        30 left
+    """ + """
+        4 left dash
+        26 left
+        4 up dash
+        26
+    """ * 15,
+    # Вправо на шипы, ждём появления и снова
+    "spike_death": """
+        40 right
+        60
+    """ * 10,
+    # Перенос к каждому фрукту по очереди (см. sweep_fruits), между переносами — стоим
+    "fruit_sweep": """
+        240
+    """,
+}
+# Проверки, что сценарий делает то, что замеряет: иначе правка уровня или физики тихо превратит его в «стоим»
+SCENARIO_CHECKS = {
+    "wall_climb": ("wall_ticks", "ни одного тика на стене"),
+    "spike_death": ("deaths", "ни одной смерти"),
+    "fruit_sweep": ("fruits", "ни одного фрукта"),
+}
+# Метрики, по которым ищутся регрессии; сдвиг блоков около нуля — шум, он только показывается
+COMPARED = ("update_ms", "draw_ms", "alloc_bytes_per_tick", "peak_kb")
+
+
+def sweep_fruits(game, masks):
+    # До фрукта на proj1 нет короткого записанного маршрута: ставим игрока на каждый фрукт
+    # и стоим. Нагрузка та же — проверка фруктов, удаление, звук, обновление статистики.
+    # Фрукты берутся из уровня, а не из спрайтов: чанк с фруктом может быть ещё не загружен.
+    level = game.level
+    size = level.tile_width * q31.map_scaling
+    cells = sorted((col, level.height - 1 - row) for col, row, _ in level.tile_cells("fruits"))
+    for col, row in cells:
+        yield ("teleport", (col + 0.5) * size, (row + 0.5) * size)
+        yield from masks
+
+
+# Сценарии, которым кроме ввода нужны действия над игрой
+SCENARIO_HOOKS = {"fruit_sweep": sweep_fruits}
+
+
+def ticks_of(game, name, masks):
+    hook = SCENARIO_HOOKS.get(name)
+    return hook(game, masks) if hook else iter(masks)
+
+
+def new_game():
+    # Прогоны и телеметрия пишутся, как в игре, но не в папки игрока: запись входит в замер.
+    # Временная папка удаляется в close_game
+    directory = tempfile.TemporaryDirectory(prefix="q31-bench-")
+    game = q31.MyGame(stats_db=":memory:", replay_dir=directory.name, telemetry_dir=directory.name)
+    game.bench_directory = directory
+    game.set_player_name("bench")
+    arcade.get_window().show_view(game)
+    game.setup()
+    # Частицы тоже воспроизводимы
+    game.trail.rng = np.random.default_rng(seed)
+    game.explosion.rng = np.random.default_rng(seed + 1)
+    return game
+
+
+def close_game(game):
+    # Как при выходе из игры: прогон сохраняется и поток записи телеметрии останавливается
+    # до удаления папки, в которую они пишут (иначе on_hide_view сохранит прогон уже после)
+    game.save_run()
+    game.close_telemetry()
+    game.close_audio()
+    game.stats_writer.close()
+    game.stats_store.close()
+    game.bench_directory.cleanup()
+
+
+def step(game, tick):
+    if isinstance(tick, tuple):
+        _, x, y = tick
+        game.sim.x, game.sim.y = x, y
+        game.sim.change_x = game.sim.change_y = 0
+        tick = 0
+    game.input_mask = tick
+    game.on_update(1 / tick_rate)
+
+
+def time_scenario(name, masks):
+    game = new_game()
+    ctx = arcade.get_window().ctx
+    update_times = []
+    draw_times = []
+    ticks = 0
+    wall_ticks = 0
+    for tick in ticks_of(game, name, masks):
+        started = time.perf_counter()
+        step(game, tick)
+        updated = time.perf_counter()
+        wall_ticks += game.sim.on_wall
+        game.on_draw()
+        ctx.finish()
+        drawn = time.perf_counter()
+        update_times.append((updated - started) * 1000)
+        draw_times.append((drawn - updated) * 1000)
+        ticks += 1
+    close_game(game)
+    return {
+        "ticks": ticks,
+        "update_ms": statistics.median(update_times),
+        "update_p95_ms": float(np.percentile(update_times, 95)),
+        "draw_ms": statistics.median(draw_times),
+        "draw_p95_ms": float(np.percentile(draw_times, 95)),
+        "deaths": game.stats["deaths"],
+        "fruits": game.stats["fruits_collected"],
+        "wall_ticks": wall_ticks,
+    }
+
+
+def memory_scenario(name, masks):
+    game = new_game()
+    gc.collect()
+    tracemalloc.start()
+    transient = 0
+    blocks_before = sys.getallocatedblocks()
+    ticks = 0
+    for tick in ticks_of(game, name, masks):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        step(game, tick)
+        game.on_draw()
+        _, peak = tracemalloc.get_traced_memory()
+        transient += peak - current
+        ticks += 1
+    blocks_after = sys.getallocatedblocks()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    close_game(game)
+    return {
+        "alloc_bytes_per_tick": transient / ticks,
+        "net_blocks_per_tick": (blocks_after - blocks_before) / ticks,
+        "peak_kb": peak / 1024,
+    }
+
+
+def run_benchmarks(names):
+    arcade.Window(q31.screen_width, q31.screen_height, q31.screen_title, visible=False)
+    results = {}
+    for name in names:
+        masks = parse_lines(SCENARIOS[name].splitlines(), name)
+        result = time_scenario(name, masks)
+        if name in SCENARIO_CHECKS:
+            metric, problem = SCENARIO_CHECKS[name]
+            if not result[metric]:
+                raise RuntimeError(f"сценарий {name}: {problem}, замер бессмыслен")
+        result.update(memory_scenario(name, masks))
+        results[name] = result
+    return {
+        "version": 1,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "arcade": arcade.version.VERSION,
+        "platform": platform.platform(),
+        "tick_rate": tick_rate,
+        "scenarios": results,
+    }
+
+
+def print_results(report):
+    print(f"{'сценарий':<12} {'тиков':>6} {'update мс':>10} {'draw мс':>9} {'байт/тик':>10} "
+          f"{'блоков/тик':>11} {'пик КБ':>8}")
+    for name, result in report["scenarios"].items():
+        print(f"{name:<12} {result['ticks']:>6} {result['update_ms']:>10.3f} {result['draw_ms']:>9.3f} "
+              f"{result['alloc_bytes_per_tick']:>10.0f} {result['net_blocks_per_tick']:>11.2f} "
+              f"{result['peak_kb']:>8.0f}")
+
+
+def compare(report, baseline, threshold):
+    # Регрессия — рост метрики больше чем на threshold относительно сохранённого прогона
+    regressions = []
+    for name, result in report["scenarios"].items():
+        old = baseline["scenarios"].get(name)
+        if old is None:
+            continue
+        for metric in COMPARED:
+            if metric not in old or old[metric] <= 0:
+                continue
+            change = result[metric] / old[metric] - 1
+            flag = "РЕГРЕССИЯ" if change > threshold else ""
+            print(f"  {name:<12} {metric:<22} {old[metric]:>10.3f} → {result[metric]:>10.3f}  {change:+7.1%} {flag}")
+            if flag:
+                regressions.append((name, metric, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры q31 на записанных сценариях")
+    parser.add_argument("scenarios", nargs="*", help="какие сценарии (по умолчанию все)")
+    parser.add_argument("--save", help="сохранить результаты в JSON")
+    parser.add_argument("--compare", help="сравнить с сохранённым JSON")
+    parser.add_argument("--threshold", type=float, default=0.10, help="допустимый рост метрики (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    names = args.scenarios or list(SCENARIOS)
+    for name in names:
+        if name not in SCENARIOS:
+            parser.error(f"нет сценария {name!r}, есть: {', '.join(SCENARIOS)}")
+
+    report = run_benchmarks(names)
+    print_results(report)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"сравнение с {args.compare} ({baseline.get('created', '?')}), порог {args.threshold:.0%}:")
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"регрессий: {len(regressions)}")
+            sys.exit(1)
+        print("регрессий нет")
+
+
+if __name__ == "__main__":
+    main()
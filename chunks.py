@@ -0,0 +1,766 @@
+import gc
+import math
+import queue
+import sys
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+import arcade
+from arcade import gl
+from arcade.camera.static import static_from_raw_orthographic
+
+import atlas_pack
+from atlas_pack import FLIPPED_DIAGONALLY, FLIPPED_HORIZONTALLY, FLIPPED_VERTICALLY
+from level import GID_MASK
+from map_bundle import load_map
+from simulation import map_scaling
+from spatial_hash import SpatialHash
+
+# Карта подгружается чанками по chunk_tiles×chunk_tiles тайлов по мере приближения камеры.
+#
+# Статические слои хранятся не спрайтами, а компактными массивами индексов (uint16 на клетку)
+# в одну таблицу тайлов: размер и UV в собранном заранее атласе (atlas_pack) на каждый
+# различный GID, отражения — перестановкой углов UV. Спрайты
+# создаются только для слоёв, которые трогает логика игры, — фруктов и шипов; платформы
+# живут в сетке столкновений.
+#
+# Фоновый поток вырезает из массивов квады тайлов чанка и клетки фруктов и шипов — только данные,
+# без GPU и без объектов arcade (кэш текстур arcade не потокобезопасен и сбрасывается при полной
+# перезагрузке уровня). Основной поток за кадр принимает готовые чанки в пределах
+# integrate_budget: запекает подряд идущие статические слои в ячейку общей текстуры одним
+# вызовом на проход, создаёт спрайты и добавляет их в списки и пространственные индексы.
+# Текстура ячеек выделяется один раз под texture_budget; когда свободных ячеек нет,
+# выгружается самый дальний от камеры чанк. Сетка столкновений от чанков не зависит:
+# она целиком лежит в скомпилированном уровне и подгружается страницами mmap.
+#
+# Видимые чанки одного прохода рисуются одним вызовом, сколько бы ни было тайлов в карте.
+# При правке карты в Tiled (hot_reload.py) пересобираются только чанки с изменёнными клетками.
+#
+#   python chunks.py maps/proj1.tmx   — память статических слоёв: спрайт на тайл против массива
+
+chunk_tiles = 16
+DYNAMIC_LAYERS = ("fruits",)  # рисуются спрайтами между запечёнными проходами
+HAZARD_LAYERS = ("idle",)  # запекаются, но спрайты остаются для точных столкновений
+texture_budget = 32 * 1024 * 1024
+preload_chunks = 1  # запас чанков вокруг камеры, которые подгружаются заранее
+integrate_budget = 0.003  # секунд на кадр для приёма готовых чанков
+
+# При запекании альфа копится отдельно, в ячейке получается цвет с предумноженной альфой
+BAKE_BLEND = (gl.SRC_ALPHA, gl.ONE_MINUS_SRC_ALPHA, gl.ONE, gl.ONE_MINUS_SRC_ALPHA)
+CHUNK_BLEND = (gl.ONE, gl.ONE_MINUS_SRC_ALPHA)
+
+VERTEX_SHADER = """
+#version 330
+
+uniform WindowBlock {
+    mat4 projection;
+    mat4 view;
+} window;
+
+in vec2 in_pos;
+in vec2 in_uv;
+in vec4 in_rect;
+
+out vec2 v_uv;
+flat out vec4 v_rect;
+
+void main() {
+    gl_Position = window.projection * window.view * vec4(in_pos, 0.0, 1.0);
+    v_uv = in_uv;
+    v_rect = in_rect;
+}
+"""
+
+# Запекание тайлов чанка из атласа: позиция, UV и прозрачность слоя на вершину
+BAKE_VERTEX_SHADER = """
+#version 330
+
+uniform WindowBlock {
+    mat4 projection;
+    mat4 view;
+} window;
+
+in vec2 in_pos;
+in vec2 in_uv;
+in float in_alpha;
+
+out vec2 v_uv;
+out float v_alpha;
+
+void main() {
+    gl_Position = window.projection * window.view * vec4(in_pos, 0.0, 1.0);
+    v_uv = in_uv;
+    v_alpha = in_alpha;
+}
+"""
+
+BAKE_FRAGMENT_SHADER = """
+#version 330
+
+uniform sampler2D atlas;
+
+in vec2 v_uv;
+in float v_alpha;
+
+out vec4 fragColor;
+
+void main() {
+    fragColor = texture(atlas, v_uv);
+    fragColor.a *= v_alpha;
+}
+"""
+
+FRAGMENT_SHADER = """
+#version 330
+
+uniform sampler2D chunks;
+
+in vec2 v_uv;
+flat in vec4 v_rect;
+
+out vec4 fragColor;
+
+void main() {
+    // На краю квада интерполяция может дать текстель соседней ячейки: не выходим за свою
+    vec2 half_texel = 0.5 / vec2(textureSize(chunks, 0));
+    fragColor = texture(chunks, clamp(v_uv, v_rect.xy + half_texel, v_rect.zw - half_texel));
+}
+"""
+
+
+warned_gids = set()
+
+
+def warn_missing_tileset(raw_gid, name):
+    # Один раз на GID: слои перечитываются при каждой сборке чанка и перезагрузке карты
+    gid = raw_gid & GID_MASK
+    if gid not in warned_gids:
+        warned_gids.add(gid)
+        print(f"Предупреждение: нет тайлсета для GID {gid} в слое '{name}'")
+
+
+def tile_texture(tileset, gid):
+    x, y, right, bottom = tileset.tile_box(gid)
+    texture = arcade.texture.default_texture_cache.load_or_get_texture(
+        tileset.image, x=x, y=y, width=right - x, height=bottom - y)
+    if gid & FLIPPED_DIAGONALLY:
+        texture = texture.flip_diagonally()
+    if gid & FLIPPED_HORIZONTALLY:
+        texture = texture.flip_horizontally()
+    if gid & FLIPPED_VERTICALLY:
+        texture = texture.flip_vertically()
+    return texture
+
+
+def sprite_tiles(level, names=DYNAMIC_LAYERS + HAZARD_LAYERS):
+    # Различные тайлы слоёв со спрайтами: (тайлсет, GID с флагами отражения)
+    tiles = {}
+    for name in names:
+        for raw_gid in set(level.layers.get(name, ())):
+            if not raw_gid or raw_gid in tiles:
+                continue
+            tileset = level.tileset_for(raw_gid)
+            if tileset is not None and tileset.image is not None:
+                tiles[raw_gid] = tileset
+    return [(tileset, raw_gid) for raw_gid, tileset in tiles.items()]
+
+
+def decode_tilesets(level, names=DYNAMIC_LAYERS + HAZARD_LAYERS):
+    # Для фонового потока: только декодирование картинок тайлсетов, без текстур и кэшей arcade
+    paths = {tileset.image for tileset, _ in sprite_tiles(level, names)}
+    return {path: arcade.texture.ImageData(Image.open(path).convert("RGBA")) for path in paths}
+
+
+def cache_images(images):
+    # Основной поток: декодированные в фоне картинки — в кэш arcade, tile_texture берёт их оттуда
+    cache = arcade.texture.default_texture_cache.image_data_cache
+    for path, image_data in images.items():
+        name = arcade.Texture.create_image_cache_name(str(path))
+        if cache.get(name) is None:
+            cache.put(name, image_data)
+
+
+def level_textures(level, names=DYNAMIC_LAYERS + HAZARD_LAYERS):
+    # Текстуры тайлов слоёв со спрайтами: можно нарезать заранее и загрузить в атлас arcade до первого чанка
+    return [tile_texture(tileset, raw_gid) for tileset, raw_gid in sprite_tiles(level, names)]
+
+
+def index_layers(level, names):
+    # Слои как массивы индексов в общую таблицу GID (0 — пустая клетка), строка 0 — верхняя
+    table = [0]
+    numbers = {}
+    layers = {}
+    for name in names:
+        unique, inverse = np.unique(np.asarray(level.layers[name], dtype=np.uint32), return_inverse=True)
+        lookup = np.zeros(len(unique), dtype=np.uint32)
+        for position, raw_gid in enumerate(unique.tolist()):
+            if not raw_gid:
+                continue
+            if raw_gid not in numbers:
+                tileset = level.tileset_for(raw_gid)
+                if tileset is None or tileset.image is None:
+                    warn_missing_tileset(raw_gid, name)
+                    continue
+                numbers[raw_gid] = len(table)
+                table.append(raw_gid)
+            lookup[position] = numbers[raw_gid]
+        layers[name] = lookup[inverse].reshape(level.height, level.width)
+    dtype = np.uint16 if len(table) <= 0x10000 else np.uint32
+    return {name: layer.astype(dtype) for name, layer in layers.items()}, table
+
+
+def tile_vertices(quads, uvs):
+    # Квад (x0, y0, x1, y1, индекс, альфа) → два треугольника; UV атласа: верх-лево, верх-право, низ-лево, низ-право
+    corners = uvs[quads[:, 4].astype(np.intp)].reshape(-1, 4, 2)
+    x0, y0, x1, y1, alpha = quads[:, 0], quads[:, 1], quads[:, 2], quads[:, 3], quads[:, 5]
+    vertices = np.empty((len(quads), 6, 5), dtype=np.float32)
+    for vertex, (x, y, corner) in enumerate(((x0, y0, 2), (x1, y0, 3), (x1, y1, 1),
+                                              (x0, y0, 2), (x1, y1, 1), (x0, y1, 0))):
+        vertices[:, vertex, 0] = x
+        vertices[:, vertex, 1] = y
+        vertices[:, vertex, 2:4] = corners[:, corner]
+        vertices[:, vertex, 4] = alpha
+    return vertices
+
+
+def layer_memory(level, scaling, dynamic=DYNAMIC_LAYERS, hazards=HAZARD_LAYERS):
+    # Память Python на видимые слои: было — спрайт на каждый тайл (как Scene.from_tilemap),
+    # стало — массив индексов, а спрайты остаются только у фруктов и шипов.
+    # [(слой, тайлов, байт было, байт стало)] и размер общей таблицы тайлов
+    names = [name for name in level.layers if level.layer_info[name]["visible"]]
+    layers, table = index_layers(level, names)
+    textures = {raw_gid: tile_texture(level.tileset_for(raw_gid), raw_gid) for raw_gid in table[1:]}
+    rows = []
+    for name in names:
+        tiles = layers[name]
+        gids = np.array(table, dtype=np.uint32)[tiles[tiles != 0]].tolist()
+        gc.collect()
+        tracemalloc.start()
+        sprites = [arcade.Sprite(textures[raw_gid], scale=scaling) for raw_gid in gids]
+        sprite_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del sprites
+        after = 0 if name in dynamic else tiles.nbytes
+        if name in dynamic or name in hazards:
+            after += sprite_bytes
+        rows.append((name, len(gids), sprite_bytes, after))
+    return rows, len(table) - 1
+
+
+def camera_view(camera):
+    # Видимый прямоугольник мира: left/right/bottom/top камеры отсчитываются от её позиции
+    x, y = camera.position
+    return x + camera.left, x + camera.right, y + camera.bottom, y + camera.top
+
+
+def distance_key(center):
+    return lambda key: (key[0] + 0.5 - center[0]) ** 2 + (key[1] + 0.5 - center[1]) ** 2
+
+
+class ChunkData:
+    # Результат фонового потока: квады и клетки чанка, ещё не тронувшие GPU
+    def __init__(self, key, generation):
+        self.key = key
+        self.generation = generation
+        self.passes = []  # квады тайлов каждого запекаемого прохода, массив (n, 6)
+        self.tiles = {}  # слой → [(клетка, GID)] фруктов и шипов; спрайты из них создаёт основной поток
+
+
+class Chunk:
+    def __init__(self, key, slots, sprites):
+        self.key = key
+        self.slots = slots  # ячейка текстуры на каждый запекаемый проход; None — проход в чанке пуст
+        self.sprites = sprites
+
+
+class ChunkStreamer:
+    def __init__(self, level, scaling, dynamic=DYNAMIC_LAYERS, hazards=HAZARD_LAYERS, tiles=chunk_tiles,
+                 budget=texture_budget, index_cell_size=None, atlas=None):
+        self.level = level
+        self.scaling = scaling
+        self.tiles = tiles
+        self.chunk_cols = math.ceil(level.width / tiles)
+        self.chunk_rows = math.ceil(level.height / tiles)
+        self.chunk_width = tiles * level.tile_width * scaling
+        self.chunk_height = tiles * level.tile_height * scaling
+        self.world_width = level.width * level.tile_width * scaling
+        self.world_height = level.height * level.tile_height * scaling
+
+        # Проходы в порядке слоёв: список статических слоёв (запекается вместе) или имя динамического
+        self.passes = []
+        run = []
+        for name in level.layers:
+            if name in dynamic:
+                if run:
+                    self.passes.append(run)
+                    run = []
+                self.passes.append(name)
+            elif level.layer_info[name]["visible"]:
+                run.append(name)
+        if run:
+            self.passes.append(run)
+        # На сколько клеток самый крупный тайл выступает за свою
+        self.overhang = max((math.ceil(max(tileset.tile_width / level.tile_width,
+                                           tileset.tile_height / level.tile_height)) - 1
+                             for tileset in level.tilesets), default=0)
+        self.baked_passes = [index for index, layers in enumerate(self.passes) if isinstance(layers, list)]
+        self.sprite_layers = tuple(dynamic) + tuple(name for name in hazards if name not in dynamic)
+
+        # Запекаемые слои — массивы индексов; таблица тайлов общая для всех слоёв
+        self.baked_layers = [name for index in self.baked_passes for name in self.passes[index]]
+        self.tile_layers, self.tile_gids = index_layers(level, self.baked_layers)
+        self.tile_atlas = atlas or atlas_pack.load_atlas(level)
+        self.make_tile_table()
+
+        # Спрайты загруженных чанков: списки для отрисовки и индексы для проверок столкновений
+        self.sprite_lists = {name: arcade.SpriteList() for name in dynamic}
+        cell_size = index_cell_size or 2 * level.tile_width * scaling
+        self.indexes = {name: SpatialHash(cell_size) for name in self.sprite_layers}
+        self.cells = {}  # спрайт → (слой, col, row): собранное не возвращается при повторной загрузке чанка
+        self.collected = set()
+
+        self.loaded = {}
+        self.requested = set()
+        self.generation = 0
+        self.requests = queue.Queue()
+        self.ready = queue.Queue()
+        self.worker = threading.Thread(target=self.run, name="chunk-loader", daemon=True)
+        self.worker.start()
+
+        self.ctx = arcade.get_window().ctx
+        self.tile_sheet = self.tile_atlas.upload(self.ctx)
+        self.make_slots(budget)
+        self.program = self.ctx.program(vertex_shader=VERTEX_SHADER, fragment_shader=FRAGMENT_SHADER)
+        self.bake_program = self.ctx.program(vertex_shader=BAKE_VERTEX_SHADER, fragment_shader=BAKE_FRAGMENT_SHADER)
+        self.bake_buffer = None
+        self.geometries = {}
+        self.view_range = None
+        self.view_dirty = True
+
+    def make_tile_table(self):
+        # Размер и UV в атласе на каждую запись таблицы тайлов
+        tilesets = [self.level.tileset_for(raw_gid) for raw_gid in self.tile_gids[1:]]
+        self.tile_sizes = np.array([(0, 0)] + [(tileset.tile_width * self.scaling, tileset.tile_height * self.scaling)
+                                               for tileset in tilesets], dtype=np.float32)
+        # С учётом поворота тайла на 90° — по большей стороне
+        self.tile_extents = self.tile_sizes.max(axis=1)
+        self.tile_uvs = np.array([(0,) * 8] + [self.tile_atlas.tile_uv(raw_gid) for raw_gid in self.tile_gids[1:]],
+                                 dtype=np.float32)
+
+    # ---- ячейки текстуры ----
+
+    def make_slots(self, budget):
+        self.slot_width = self.tiles * self.level.tile_width
+        self.slot_height = self.tiles * self.level.tile_height
+        slot_bytes = self.slot_width * self.slot_height * 4
+        # Не больше, чем нужно всей карте, и не меньше, чем нужно экрану с запасом вокруг
+        total = self.chunk_cols * self.chunk_rows * len(self.baked_passes)
+        around = (3 + 2 * preload_chunks) ** 2 * len(self.baked_passes)
+        count = max(1, min(total, max(around, budget // slot_bytes)))
+        max_size = self.ctx.info.MAX_TEXTURE_SIZE
+        columns = max(1, min(max_size // self.slot_width, math.ceil(math.sqrt(count))))
+        rows = min(math.ceil(count / columns), max_size // self.slot_height)
+        self.slot_texture = self.ctx.texture((columns * self.slot_width, rows * self.slot_height), components=4,
+                                             filter=(self.ctx.NEAREST, self.ctx.NEAREST))
+        self.slot_fbo = self.ctx.framebuffer(color_attachments=[self.slot_texture])
+        self.slot_columns = columns
+        self.free_slots = list(range(columns * rows - 1, -1, -1))
+
+    def slot_rect(self, slot):
+        return (slot % self.slot_columns * self.slot_width, slot // self.slot_columns * self.slot_height,
+                self.slot_width, self.slot_height)
+
+    def bake(self, slot, key, quads):
+        # Крайние чанки карты неполные: лишняя часть ячейки остаётся прозрачной
+        left, bottom = key[0] * self.chunk_width, key[1] * self.chunk_height
+        viewport = self.slot_rect(slot)
+        camera = static_from_raw_orthographic(
+            (left, left + self.chunk_width, bottom, bottom + self.chunk_height), -1, 1, viewport=viewport)
+        vertices = tile_vertices(quads, self.tile_uvs)
+        if self.bake_buffer is None or self.bake_buffer.size < vertices.nbytes:
+            self.bake_buffer = self.ctx.buffer(reserve=max(vertices.nbytes, self.tiles * self.tiles * 6 * 20))
+            self.bake_geometry = self.ctx.geometry(
+                [gl.BufferDescription(self.bake_buffer, "2f 2f 1f", ["in_pos", "in_uv", "in_alpha"])],
+                mode=self.ctx.TRIANGLES)
+        self.bake_buffer.write(vertices.tobytes())
+        self.tile_sheet.use(0)
+        with self.slot_fbo.activate() as fbo, camera.activate():
+            fbo.clear(color=(0, 0, 0, 0), viewport=viewport)
+            with self.ctx.enabled(self.ctx.BLEND):
+                self.ctx.blend_func = BAKE_BLEND
+                self.bake_geometry.render(self.bake_program, vertices=len(quads) * 6)
+            self.ctx.blend_func = self.ctx.BLEND_DEFAULT
+
+    # ---- фоновая сборка ----
+
+    def run(self):
+        while True:
+            key, generation = self.requests.get()
+            if key is None:
+                return
+            if generation != self.generation:
+                continue
+            try:
+                data = self.build(key, generation)
+            except Exception as error:
+                if generation != self.generation:
+                    # Сборку прервала перезагрузка карты: она читала полузаменённые массивы, а её
+                    # результат всё равно был бы выброшен
+                    continue
+                # Настоящая ошибка: receive() поднимет её в основном потоке
+                data = error
+            self.ready.put(data)
+
+    def build(self, key, generation):
+        col_from, row_from = key[0] * self.tiles, key[1] * self.tiles
+        data = ChunkData(key, generation)
+        for index in self.baked_passes:
+            parts = [self.layer_quads(name, col_from, row_from) for name in self.passes[index]]
+            data.passes.append(np.concatenate(parts))
+        for name in self.sprite_layers:
+            data.tiles[name] = self.layer_tiles(name, col_from, row_from)
+        return data
+
+    def layer_quads(self, name, col_from, row_from):
+        # Квады (x0, y0, x1, y1, индекс тайла, альфа) слоя в чанке — без объекта на тайл
+        level = self.level
+        col_to = min(level.width, col_from + self.tiles)
+        row_to = min(level.height, row_from + self.tiles)
+        # Тайлы крупнее клетки (флаги 32×32) выступают вправо и вверх: соседи слева и снизу
+        # тоже запекаются в чанк, иначе их часть обрезалась бы на стыке
+        first_col = max(0, col_from - self.overhang)
+        first_row = max(0, row_from - self.overhang)
+        # Строки чанков считаются снизу, строки слоя — сверху. Порядок — как у arcade, с верхней
+        # строки: перекрывающиеся крупные тайлы ложатся так же
+        block = self.tile_layers[name][level.height - row_to:level.height - first_row, first_col:col_to]
+        rows_top, cols = np.nonzero(block)
+        numbers = block[rows_top, cols]
+        cols = cols + first_col
+        rows = row_to - 1 - rows_top
+        x0 = (cols * (level.tile_width * self.scaling)).astype(np.float32)
+        y0 = (rows * (level.tile_height * self.scaling)).astype(np.float32)
+        owned = (cols >= col_from) & (rows >= row_from)
+        extents = self.tile_extents[numbers]
+        keep = owned | ((x0 + extents > col_from * level.tile_width * self.scaling) &
+                        (y0 + extents > row_from * level.tile_height * self.scaling))
+        numbers = numbers[keep]
+        quads = np.empty((len(numbers), 6), dtype=np.float32)
+        quads[:, 0] = x0[keep]
+        quads[:, 1] = y0[keep]
+        quads[:, 2:4] = quads[:, 0:2] + self.tile_sizes[numbers]
+        quads[:, 4] = numbers
+        quads[:, 5] = level.layer_info[name]["opacity"]
+        return quads
+
+    def layer_tiles(self, name, col_from, row_from):
+        # Клетки фруктов и шипов: [(клетка, GID)], только тайлы самого чанка
+        level = self.level
+        gids = level.layers.get(name)
+        if gids is None:
+            return []
+        tiles = []
+        for row in range(min(level.height, row_from + self.tiles) - 1, row_from - 1, -1):
+            row_top = level.height - 1 - row
+            offset = row_top * level.width
+            for col in range(col_from, min(level.width, col_from + self.tiles)):
+                raw_gid = gids[offset + col]
+                if not raw_gid:
+                    continue
+                tileset = level.tileset_for(raw_gid)
+                if tileset is None or tileset.image is None:
+                    warn_missing_tileset(raw_gid, name)
+                    continue
+                tiles.append(((name, col, row_top), raw_gid))
+        return tiles
+
+    def make_sprites(self, layers):
+        # Основной поток: спрайты по клеткам из фоновой сборки, слой → [(клетка, спрайт)]
+        level = self.level
+        scaling = self.scaling
+        sprites = {}
+        for name, tiles in layers.items():
+            opacity = level.layer_info[name]["opacity"]
+            sprites[name] = []
+            for cell, raw_gid in tiles:
+                _, col, row_top = cell
+                sprite = arcade.Sprite(tile_texture(level.tileset_for(raw_gid), raw_gid), scale=scaling)
+                sprite.center_x = col * level.tile_width * scaling + sprite.width / 2
+                sprite.center_y = (level.height - 1 - row_top) * level.tile_height * scaling + sprite.height / 2
+                if opacity < 1.0:
+                    sprite.alpha = int(opacity * 255)
+                sprites[name].append((cell, sprite))
+        return sprites
+
+    # ---- основной поток ----
+
+    def chunk_range(self, left, right, bottom, top, margin=0):
+        return (max(0, int(left // self.chunk_width) - margin),
+                min(self.chunk_cols - 1, int(right // self.chunk_width) + margin),
+                max(0, int(bottom // self.chunk_height) - margin),
+                min(self.chunk_rows - 1, int(top // self.chunk_height) + margin))
+
+    def keys_in(self, chunk_range):
+        col_from, col_to, row_from, row_to = chunk_range
+        return [(col, row) for row in range(row_from, row_to + 1) for col in range(col_from, col_to + 1)]
+
+    def update(self, view):
+        # view — (left, right, bottom, top) камеры в мировых координатах
+        center = ((view[0] + view[1]) / 2 / self.chunk_width, (view[2] + view[3]) / 2 / self.chunk_height)
+        wanted = self.keys_in(self.chunk_range(*view, margin=preload_chunks))
+        # Ближние к камере — первыми
+        wanted.sort(key=distance_key(center))
+        self.request(wanted)
+        self.receive(set(wanted), center)
+
+        view_range = self.chunk_range(*view)
+        if view_range != self.view_range or self.view_dirty:
+            self.view_range = view_range
+            self.view_dirty = False
+            self.rebuild_geometry()
+
+    def follow(self, camera):
+        self.update(camera_view(camera))
+
+    def preload(self, views):
+        # Подгрузка через фоновый поток под экраном загрузки; возвращает, сколько чанков ещё не готово
+        wanted = {key for view in views for key in self.keys_in(self.chunk_range(*view, margin=preload_chunks))}
+        self.request(sorted(wanted))
+        self.receive(wanted, None)
+        return sum(1 for key in wanted if key not in self.loaded)
+
+    def request(self, keys):
+        for key in keys:
+            if key not in self.loaded and key not in self.requested:
+                self.requested.add(key)
+                self.requests.put((key, self.generation))
+
+    def receive(self, wanted, center):
+        # Готовые чанки — в пределах бюджета кадра, остальные дождутся следующего
+        deadline = time.perf_counter() + integrate_budget
+        while time.perf_counter() < deadline:
+            try:
+                data = self.ready.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(data, Exception):
+                raise data
+            self.integrate(data, wanted, center)
+
+    def load_now(self, view):
+        # Синхронно, в обход потока: область вокруг камеры при старте уровня
+        for key in self.keys_in(self.chunk_range(*view, margin=preload_chunks)):
+            if key not in self.loaded:
+                self.integrate(self.build(key, self.generation), set(), None)
+        self.view_range = self.chunk_range(*view)
+        self.view_dirty = False
+        self.rebuild_geometry()
+
+    def integrate(self, data, wanted, center):
+        self.requested.discard(data.key)
+        if data.generation != self.generation or data.key in self.loaded:
+            return
+        needed = sum(1 for quads in data.passes if len(quads))
+        while len(self.free_slots) < needed:
+            if not self.evict_farthest(wanted, center):
+                # Бюджет не вмещает даже окрестность камеры: чанк будет запрошен снова
+                return
+        slots = []
+        for quads in data.passes:
+            if not len(quads):
+                slots.append(None)
+                continue
+            slot = self.free_slots.pop()
+            self.bake(slot, data.key, quads)
+            slots.append(slot)
+        sprites = self.make_sprites(data.tiles)
+        self.loaded[data.key] = Chunk(data.key, slots, sprites)
+        self.add_sprites(sprites)
+        self.view_dirty = True
+
+    def add_sprites(self, layers):
+        for name, sprites in layers.items():
+            sprite_list = self.sprite_lists.get(name)
+            index = self.indexes[name]
+            for cell, sprite in sprites:
+                if cell in self.collected or sprite in self.cells:
+                    continue
+                self.cells[sprite] = cell
+                index.insert(sprite, sprite.left, sprite.right, sprite.bottom, sprite.top)
+                if sprite_list is not None:
+                    sprite_list.append(sprite)
+
+    def evict_farthest(self, wanted, center):
+        candidates = [key for key in self.loaded if key not in wanted]
+        if not candidates:
+            return False
+        if center is not None:
+            candidates.sort(key=distance_key(center))
+        self.unload(candidates[-1])
+        return True
+
+    def unload(self, key):
+        chunk = self.loaded.pop(key)
+        self.free_slots.extend(slot for slot in chunk.slots if slot is not None)
+        for name, sprites in chunk.sprites.items():
+            for _, sprite in sprites:
+                if self.cells.pop(sprite, None) is not None:
+                    self.indexes[name].remove(sprite)
+                    sprite.remove_from_sprite_lists()
+        self.view_dirty = True
+
+    def remove(self, sprite):
+        # Собранный фрукт: из списков и индекса, и не возвращать при повторной загрузке чанка
+        cell = self.cells.pop(sprite, None)
+        if cell is not None:
+            self.collected.add(cell)
+            self.indexes[cell[0]].remove(sprite)
+        sprite.remove_from_sprite_lists()
+
+    def reset(self):
+        # Перезапуск уровня: собранное возвращается
+        self.collected.clear()
+        for chunk in self.loaded.values():
+            self.add_sprites(chunk.sprites)
+        return self
+
+    def reload(self, level, changes, atlas):
+        # Горячая перезагрузка (hot_reload.py): раскладка карты та же, изменились клетки слоёв.
+        # changes — слой → номера клеток (строка 0 — верхняя). Пересобираются только загруженные
+        # чанки, которые задевают эти клетки; остальные соберутся из новых данных, когда понадобятся.
+        # Фоновые сборки старого поколения выбрасываются. Возвращает пересобранные чанки
+        self.generation += 1
+        self.requested.clear()
+        self.level = level
+        table_changed = atlas is not self.tile_atlas
+        for name, cells in changes.items():
+            if name in self.tile_layers:
+                table_changed |= self.update_tile_layer(name, cells)
+        if atlas is not self.tile_atlas:
+            self.tile_atlas = atlas
+            self.tile_sheet = atlas.upload(self.ctx)
+        if table_changed:
+            self.make_tile_table()
+
+        touched = set()
+        for name, cells in changes.items():
+            if name in self.sprite_layers:
+                # На месте собранного фрукта теперь другой тайл — он появляется заново
+                rows_top, cols = np.divmod(cells, level.width)
+                self.collected.difference_update((name, col, row_top)
+                                                 for col, row_top in zip(cols.tolist(), rows_top.tolist()))
+            if name in self.tile_layers or name in self.sprite_layers:
+                touched |= self.touched_chunks(cells)
+        wanted = set(self.keys_in(self.view_range)) if self.view_range else set()
+        rebuilt = [key for key in sorted(touched) if key in self.loaded]
+        for key in rebuilt:
+            self.unload(key)
+            self.integrate(self.build(key, self.generation), wanted, None)
+        return rebuilt
+
+    def update_tile_layer(self, name, cells):
+        # Клетки массива индексов по новому уровню; новые GID — в конец таблицы. True — таблица выросла
+        table = self.tile_gids
+        numbers = {raw_gid: number for number, raw_gid in enumerate(table)}
+        size = len(table)
+        values = []
+        for raw_gid in np.asarray(self.level.layers[name], dtype=np.uint32)[cells].tolist():
+            if raw_gid not in numbers:
+                tileset = self.level.tileset_for(raw_gid)
+                if tileset is None or tileset.image is None:
+                    warn_missing_tileset(raw_gid, name)
+                    numbers[raw_gid] = 0
+                else:
+                    numbers[raw_gid] = len(table)
+                    table.append(raw_gid)
+            values.append(numbers[raw_gid])
+        if len(table) > np.iinfo(self.tile_layers[name].dtype).max + 1:
+            self.tile_layers = {key: layer.astype(np.uint32) for key, layer in self.tile_layers.items()}
+        self.tile_layers[name].flat[cells] = values
+        return len(table) > size
+
+    def touched_chunks(self, cells):
+        # Чанки, в которые запекается клетка: свой и соседи справа и сверху, куда выступает крупный тайл
+        rows_top, cols = np.divmod(cells, self.level.width)
+        rows = self.level.height - 1 - rows_top
+        keys = set()
+        for dx in range(self.overhang + 1):
+            for dy in range(self.overhang + 1):
+                chunk_cols = np.minimum((cols + dx) // self.tiles, self.chunk_cols - 1)
+                chunk_rows = np.minimum((rows + dy) // self.tiles, self.chunk_rows - 1)
+                keys.update(zip(chunk_cols.tolist(), chunk_rows.tolist()))
+        return keys
+
+    def dependencies(self):
+        return self.level.sources()
+
+    def close(self):
+        # Запросы старого поколения поток пропускает, затем завершается
+        self.generation += 1
+        self.requests.put((None, None))
+
+    # ---- отрисовка ----
+
+    def rebuild_geometry(self):
+        # Квады видимых чанков, по геометрии на запекаемый проход: x, y, u, v и границы ячейки на вершину
+        keys = [key for key in self.keys_in(self.view_range) if key in self.loaded]
+        texture_width, texture_height = self.slot_texture.size
+        for number, index in enumerate(self.baked_passes):
+            quads = []
+            for key in keys:
+                slot = self.loaded[key].slots[number]
+                if slot is None:
+                    continue
+                left, bottom = key[0] * self.chunk_width, key[1] * self.chunk_height
+                right, top = left + self.chunk_width, bottom + self.chunk_height
+                x, y, width, height = self.slot_rect(slot)
+                u0, v0 = x / texture_width, y / texture_height
+                u1, v1 = (x + width) / texture_width, (y + height) / texture_height
+                rect = u0, v0, u1, v1
+                quads.extend(((left, bottom, u0, v0) + rect, (right, bottom, u1, v0) + rect,
+                              (right, top, u1, v1) + rect, (left, bottom, u0, v0) + rect,
+                              (right, top, u1, v1) + rect, (left, top, u0, v1) + rect))
+            vertices = np.array(quads, dtype=np.float32).reshape(-1, 8)
+            geometry = self.geometries.get(index)
+            if geometry is None or geometry[1].size < vertices.nbytes:
+                buffer = self.ctx.buffer(reserve=max(vertices.nbytes, 6 * 32 * 16))
+                geometry = self.geometries[index] = [
+                    self.ctx.geometry([gl.BufferDescription(buffer, "2f 2f 4f", ["in_pos", "in_uv", "in_rect"])],
+                                      mode=self.ctx.TRIANGLES), buffer, 0]
+            if len(vertices):
+                geometry[1].write(vertices.tobytes())
+            geometry[2] = len(vertices)
+
+    def draw(self):
+        for index, layers in enumerate(self.passes):
+            if isinstance(layers, str):
+                self.sprite_lists[layers].draw()
+                continue
+            geometry, _, count = self.geometries.get(index, (None, None, 0))
+            if not count:
+                continue
+            self.slot_texture.use(0)
+            with self.ctx.enabled(self.ctx.BLEND):
+                self.ctx.blend_func = CHUNK_BLEND
+                geometry.render(self.program, vertices=count)
+            self.ctx.blend_func = self.ctx.BLEND_DEFAULT
+
+
+def main():
+    tmx_path = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / "maps" / "proj1.tmx"
+    level = load_map(tmx_path)
+    rows, table_size = layer_memory(level, map_scaling)
+    print(f"{'слой':<14} {'тайлов':>7} {'было КБ':>9} {'стало КБ':>9}")
+    for name, tiles, before, after in rows:
+        print(f"{name:<14} {tiles:>7} {before / 1024:>9.1f} {after / 1024:>9.1f}")
+    print(f"{'всего':<14} {sum(row[1] for row in rows):>7} {sum(row[2] for row in rows) / 1024:>9.1f} "
+          f"{sum(row[3] for row in rows) / 1024:>9.1f}")
+    print(f"общая таблица тайлов: {table_size} различных GID")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import base64
+import shutil
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+import atlas_pack
+import map_bundle
+from assets import stamp
+from level import GID_MASK, parse_layer_data
+
+# Горячая перезагрузка карты, пока идёт игра: дизайнер сохраняет TMX в Tiled, через poll_interval
+# игра видит новый mtime, в фоне разбирает карту (map_bundle.load_map заодно перекомпилирует .lvl)
+# и сравнивает GID слоёв с загруженными. На основном потоке меняется только то, что задели
+# изменённые клетки: чанки с ними (ChunkStreamer.reload — запечённые слои, спрайты фруктов и шипов),
+# клетки сетки столкновений и индекса шипов (Level.update_grid, Level.update_object_index).
+# Игрок, камера и собранные фрукты остаются как были.
+#
+# Если поменялась раскладка — размер карты, набор слоёв, таблица тайлсетов — или сами файлы
+# тайлсетов (TSX, картинки), клетки не сравнить: уровень собирается заново, но игрок остаётся на месте.
+#
+#   python hot_reload.py maps/proj1.tmx   — время перезагрузки после правки одной клетки (на копии карты)
+
+poll_interval = 0.5  # секунд между проверками: несколько os.stat, на кадр не влияет
+
+
+class FileWatcher:
+    # Опрос mtime из игрового цикла: без потоков и сторонних библиотек
+    def __init__(self, paths, interval=poll_interval):
+        self.paths = list(paths)
+        self.interval = interval
+        self.stamps = stamp(self.paths)
+        self.elapsed = 0.0
+
+    def poll(self, delta_time):
+        # Файлы, изменившиеся с прошлой проверки
+        self.elapsed += delta_time
+        if self.elapsed < self.interval:
+            return []
+        self.elapsed = 0.0
+        stamps = stamp(self.paths)
+        changed = [path for path, old, new in zip(self.paths, self.stamps, stamps) if old != new]
+        self.stamps = stamps
+        return changed
+
+
+class LevelUpdate:
+    def __init__(self, level, changes, atlas):
+        self.level = level
+        self.changes = changes  # слой → номера клеток (строка 0 — верхняя); None — только целиком
+        self.atlas = atlas
+
+    @property
+    def full(self):
+        return self.changes is None
+
+
+def layout(level):
+    # Всё, кроме GID в клетках: если это разное, клетки двух уровней не сравнить
+    return (level.width, level.height, level.tile_width, level.tile_height,
+            [(t.firstgid, t.name, t.tile_width, t.tile_height, t.tilecount, t.columns, str(t.image),
+              t.spacing, t.margin) for t in level.tilesets],
+            [(name, info["visible"], info["opacity"]) for name, info in level.layer_info.items()])
+
+
+def diff_levels(old, new):
+    # Слой → номера изменившихся клеток; None — раскладка разная
+    if layout(old) != layout(new):
+        return None
+    changes = {}
+    for name, gids in new.layers.items():
+        cells = np.flatnonzero(np.asarray(old.layers[name], dtype=np.uint32) != np.asarray(gids, dtype=np.uint32))
+        if len(cells):
+            changes[name] = cells
+    return changes
+
+
+def prepare(tmx_path, old_level, atlas):
+    # Фоновая часть: разбор новой карты, сравнение и новый атлас, если появились тайлы не из него
+    level = map_bundle.load_map(tmx_path)
+    changes = diff_levels(old_level, level)
+    if changes:
+        used = set()
+        for name, cells in changes.items():
+            for raw_gid in np.asarray(level.layers[name], dtype=np.uint32)[cells].tolist():
+                tileset = level.tileset_for(raw_gid)
+                if raw_gid and tileset is not None and tileset.image is not None:
+                    used.add(raw_gid & GID_MASK)
+        if not used <= atlas.rects.keys():
+            atlas = atlas_pack.load_atlas(level)
+    return LevelUpdate(level, changes, atlas)
+
+
+class LevelWatcher:
+    # Следит за файлами уровня streamer; poll() в игровом цикле возвращает готовое обновление или None
+    def __init__(self, streamer, executor, interval=poll_interval):
+        self.streamer = streamer
+        self.executor = executor
+        self.files = FileWatcher(streamer.level.sources(), interval)
+        self.pending = None
+        self.error = None  # последняя неудачная перезагрузка, её показывает игра
+
+    def poll(self, delta_time):
+        if self.pending is not None:
+            if not self.pending.done():
+                return None
+            future, self.pending = self.pending, None
+            try:
+                return future.result()
+            except (OSError, ValueError, ET.ParseError) as error:
+                # Файл дописывается или сохранён с ошибкой: следующее сохранение попробует снова
+                self.error = error
+                return None
+        changed = self.files.poll(delta_time)
+        if not changed:
+            return None
+        level = self.streamer.level
+        tmx_path = Path(level.path).resolve()
+        if any(Path(path).resolve() != tmx_path for path in changed):
+            return LevelUpdate(None, None, None)
+        self.pending = self.executor.submit(prepare, level.path, level, self.streamer.tile_atlas)
+        return None
+
+
+def set_tile(tmx_path, layer, col, row, gid):
+    # Правка одной клетки в TMX, как её сохранил бы Tiled (base64 без сжатия)
+    tree = ET.parse(tmx_path)
+    root = tree.getroot()
+    width, height = int(root.get("width")), int(root.get("height"))
+    for element in root.iter("layer"):
+        if element.get("name") == layer:
+            data = element.find("data")
+            gids = array("I", parse_layer_data(data, width * height))
+            gids[row * width + col] = gid
+            if sys.byteorder == "big":
+                gids.byteswap()
+            data.attrib = {"encoding": "base64"}
+            data.text = base64.b64encode(gids.tobytes()).decode("ascii")
+    tree.write(tmx_path, encoding="UTF-8", xml_declaration=True)
+
+
+def main():
+    import arcade
+    from chunks import ChunkStreamer
+    from simulation import map_scaling, spawn_x, spawn_y, tile_size
+
+    source = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / "maps" / "proj1.tmx"
+    # Правится копия карты; тайлсеты level.find_tileset находит по имени в tilesets/ проекта
+    tmx_path = Path(tempfile.mkdtemp(prefix="q31-reload-")) / source.name
+    shutil.copy(source, tmx_path)
+    arcade.Window(320, 240, visible=False)
+    # Скомпилированный уровень и атлас уже лежат рядом, как при обычном запуске
+    atlas_pack.load_atlas(map_bundle.load_map(tmx_path))
+    view = (spawn_x - 100, spawn_x + 100, spawn_y - 80, spawn_y + 80)
+
+    started = time.perf_counter()
+    level = map_bundle.load_map(tmx_path)
+    streamer = ChunkStreamer(level, map_scaling)
+    streamer.load_now(view)
+    grid = level.build_grid("Platforms")
+    full_time = time.perf_counter() - started
+
+    # Пустая клетка у точки появления получает тайл платформы
+    col, row = int(spawn_x // tile_size) + 2, level.height - 1 - int(spawn_y // tile_size)
+    platforms = level.layers["Platforms"]
+    gid = next(raw_gid for raw_gid in platforms if raw_gid)
+    set_tile(tmx_path, "Platforms", col, row, 0 if platforms[row * level.width + col] else gid)
+
+    started = time.perf_counter()
+    update = prepare(tmx_path, level, streamer.tile_atlas)
+    prepare_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    rebuilt = streamer.reload(update.level, update.changes, update.atlas)
+    walls = update.level.update_grid(grid, "Platforms", update.changes["Platforms"].tolist(), streamer.overhang)
+    apply_time = time.perf_counter() - started
+
+    cells = sum(len(cells) for cells in update.changes.values())
+    print(f"{source}: клеток изменено {cells}, чанков пересобрано {len(rebuilt)}, клеток сетки {walls}")
+    print(f"полная загрузка уровня: {full_time * 1000:.1f} мс; перезагрузка: фон {prepare_time * 1000:.1f} мс, "
+          f"основной поток {apply_time * 1000:.1f} мс")
+    shutil.rmtree(tmx_path.parent, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
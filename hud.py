@@ -0,0 +1,36 @@
+import arcade
+import pyglet
+
+# Надписи интерфейса в одном pyglet Batch: рисуются одним вызовом.
+# Для каждой надписи запоминается показанное значение — текст и цвет arcade.Text
+# трогаются (и pyglet перестраивает глифы), только когда оно действительно изменилось.
+
+
+class TextBatch:
+    def __init__(self):
+        self.batch = pyglet.graphics.Batch()
+        self.labels = {}
+        self.values = {}
+
+    def add(self, key, text, x, y, color=arcade.color.WHITE, font_size=12, **kwargs):
+        label = arcade.Text(text, x, y, color, font_size, batch=self.batch, **kwargs)
+        self.labels[key] = label
+        self.values[key] = (text, None)
+        return label
+
+    def set(self, key, value, fmt="{}", color=None):
+        # value — то, что видно на экране (уже округлённое): формат считается только при изменении
+        if self.values[key] == (value, color):
+            return False
+        self.values[key] = (value, color)
+        label = self.labels[key]
+        label.text = fmt.format(value)
+        if color is not None:
+            label.color = color
+        return True
+
+    def __getitem__(self, key):
+        return self.labels[key]
+
+    def draw(self):
+        self.batch.draw()
@@ -0,0 +1,259 @@
+import base64
+import gzip
+import sys
+import zlib
+from array import array
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from simulation import map_scaling
+from spatial_hash import SpatialHash
+from tile_grid import TileGrid
+
+# Чтение TMX без arcade: слои как массивы GID и таблица тайлсетов.
+# Нужен для прогонов симуляции без окна.
+
+GID_MASK = 0x1FFFFFFF
+
+
+class Tileset:
+    def __init__(self, firstgid, name, tile_width, tile_height, tilecount, columns, image, source,
+                 spacing=0, margin=0):
+        self.firstgid = firstgid
+        self.name = name
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.tilecount = tilecount
+        self.columns = columns
+        self.image = image
+        self.source = source
+        self.spacing = spacing
+        self.margin = margin
+
+    def tile_box(self, gid):
+        # Область тайла в картинке тайлсета (пиксели, ось Y вниз)
+        local_id = (gid & GID_MASK) - self.firstgid
+        columns = self.columns or 1
+        x = self.margin + (local_id % columns) * (self.tile_width + self.spacing)
+        y = self.margin + (local_id // columns) * (self.tile_height + self.spacing)
+        return x, y, x + self.tile_width, y + self.tile_height
+
+
+class Level:
+    def __init__(self, path, width, height, tile_width, tile_height, tilesets, layers, layer_info=None):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.tilesets = tilesets
+        # Слои в порядке TMX: строка 0 — верхняя
+        self.layers = layers
+        # Видимость и прозрачность слоёв из TMX
+        self.layer_info = layer_info or {name: {"visible": True, "opacity": 1.0} for name in layers}
+        self.opaque_boxes = {}
+        # Готовые сетки занятости по слоям (в клетках, строка 0 — нижняя), если уровень скомпилирован
+        self.grids = {}
+
+    def sources(self):
+        # Файлы, от которых зависит уровень: сам TMX, внешние тайлсеты и их картинки
+        paths = [Path(self.path)]
+        for tileset in self.tilesets:
+            for path in (tileset.source, tileset.image):
+                if path is not None and Path(path).exists() and Path(path) not in paths:
+                    paths.append(Path(path))
+        return paths
+
+    def tileset_for(self, gid):
+        gid &= GID_MASK
+        found = None
+        for tileset in self.tilesets:
+            if tileset.firstgid <= gid:
+                found = tileset
+        return found
+
+    def tile_cells(self, layer):
+        # (col, row_from_top, gid) для каждой непустой клетки слоя
+        gids = self.layers.get(layer)
+        if gids is None:
+            return
+        width = self.width
+        for index, gid in enumerate(gids):
+            if gid:
+                yield index % width, index // width, gid & GID_MASK
+
+    def tile_rect(self, col, row, gid, scaling=map_scaling):
+        # Мировой прямоугольник тайла так же, как его ставит arcade: от левого нижнего угла клетки
+        tileset = self.tileset_for(gid)
+        tile_width = tileset.tile_width if tileset else self.tile_width
+        tile_height = tileset.tile_height if tileset else self.tile_height
+        left = col * self.tile_width * scaling
+        bottom = (self.height - row - 1) * self.tile_height * scaling
+        return left, left + tile_width * scaling, bottom, bottom + tile_height * scaling
+
+    def opaque_box(self, gid):
+        # Непрозрачная область тайла, как её видит хитбокс arcade; None — весь тайл
+        gid &= GID_MASK
+        if gid not in self.opaque_boxes:
+            box = None
+            tileset = self.tileset_for(gid)
+            if tileset is not None and tileset.image is not None and tileset.image.exists():
+                from PIL import Image
+                with Image.open(tileset.image) as image:
+                    box = image.convert("RGBA").crop(tileset.tile_box(gid)).getchannel("A").getbbox()
+            self.opaque_boxes[gid] = box
+        return self.opaque_boxes[gid]
+
+    def tile_hitbox(self, col, row, gid, scaling=map_scaling):
+        left, right, bottom, top = self.tile_rect(col, row, gid, scaling)
+        box = self.opaque_box(gid)
+        if box is None:
+            return left, right, bottom, top
+        x0, y0, x1, y1 = box
+        return left + x0 * scaling, left + x1 * scaling, top - y1 * scaling, top - y0 * scaling
+
+    def build_object_index(self, layer, scaling=map_scaling):
+        # Клетки слоя (col, row_from_top) в пространственном хеше по их хитбоксам
+        index = SpatialHash(self.tile_width * scaling)
+        for col, row, gid in self.tile_cells(layer):
+            index.insert((col, row), *self.tile_hitbox(col, row, gid, scaling))
+        return index
+
+    def build_grid(self, layer="Platforms", scaling=map_scaling):
+        grid = TileGrid(self.width, self.height, self.tile_width * scaling)
+        if layer in self.grids:
+            grid.cells[:] = self.grids[layer]
+            return grid
+        for col, row, gid in self.tile_cells(layer):
+            left, right, bottom, top = self.tile_rect(col, row, gid, scaling)
+            for cell_col, cell_row in grid.cells_in_rect(left, right, bottom, top):
+                grid.cells[cell_row * grid.width + cell_col] = 1
+        return grid
+
+    def update_grid(self, grid, layer, cells, reach=0, scaling=map_scaling):
+        # Пересчёт сетки только под изменёнными клетками слоя (номер клетки — строка сверху).
+        # reach — на сколько клеток тайл выступает вправо и вверх: столько же соседей пересчитывается
+        # и столько же проверяется тайлов слева и снизу. Возвращает число изменившихся клеток сетки
+        gids = self.layers.get(layer)
+        dirty = set()
+        for cell in cells:
+            col, row = cell % self.width, self.height - 1 - cell // self.width
+            dirty.update((cell_col, cell_row)
+                         for cell_col in range(col, min(grid.width, col + reach + 1))
+                         for cell_row in range(row, min(grid.height, row + reach + 1)))
+        solid = set()
+        for col, row in {(col - dx, row - dy) for col, row in dirty
+                         for dx in range(reach + 1) for dy in range(reach + 1)}:
+            if col < 0 or row < 0:
+                continue
+            gid = gids[(self.height - 1 - row) * self.width + col] if gids is not None else 0
+            if gid:
+                rect = self.tile_rect(col, self.height - 1 - row, gid, scaling)
+                solid.update(key for key in grid.cells_in_rect(*rect) if key in dirty)
+        changed = 0
+        for col, row in dirty:
+            value = 1 if (col, row) in solid else 0
+            if grid.cells[row * grid.width + col] != value:
+                grid.cells[row * grid.width + col] = value
+                changed += 1
+        return changed
+
+    def update_object_index(self, index, layer, cells, scaling=map_scaling):
+        # Клетки индекса (как в build_object_index) заново по изменённым клеткам слоя
+        gids = self.layers.get(layer)
+        for cell in cells:
+            col, row = cell % self.width, cell // self.width
+            index.remove((col, row))
+            gid = gids[cell] & GID_MASK if gids is not None else 0
+            if gid:
+                index.insert((col, row), *self.tile_hitbox(col, row, gid, scaling))
+
+
+def parse_layer_data(data, count):
+    encoding = data.get("encoding")
+    text = (data.text or "").strip()
+    if encoding == "csv":
+        return [int(value) for value in text.replace("\n", "").split(",") if value]
+    if encoding == "base64":
+        raw = base64.b64decode(text)
+        compression = data.get("compression")
+        if compression == "zlib":
+            raw = zlib.decompress(raw)
+        elif compression == "gzip":
+            raw = gzip.decompress(raw)
+        elif compression:
+            raise ValueError(f"неподдерживаемое сжатие слоя: {compression}")
+        gids = array("I")
+        gids.frombytes(raw[:count * 4])
+        if sys.byteorder == "big":
+            gids.byteswap()
+        return gids
+    return [int(tile.get("gid", 0)) for tile in data.iter("tile")]
+
+
+def parse_tileset(element, firstgid, base_dir, default_size):
+    source = element.get("source")
+    if source:
+        source_path = find_tileset(base_dir, source)
+        if not source_path.exists():
+            # Внешний тайлсет не найден: считаем тайлы размером клетки карты
+            return Tileset(firstgid, Path(source).stem, default_size[0], default_size[1], 0, 0, None, source_path)
+        element = ET.parse(source_path).getroot()
+        base_dir = source_path.parent
+    else:
+        source_path = None
+    image = element.find("image")
+    return Tileset(
+        firstgid,
+        element.get("name", ""),
+        int(element.get("tilewidth")),
+        int(element.get("tileheight")),
+        int(element.get("tilecount", 0)),
+        int(element.get("columns", 0)),
+        (base_dir / image.get("source")).resolve() if image is not None else None,
+        source_path,
+        int(element.get("spacing", 0)),
+        int(element.get("margin", 0)),
+    )
+
+
+def find_tileset(base_dir, source):
+    # Путь из TMX, а если его нет (карту сохраняли с другой машины) — тот же файл в tilesets/ проекта
+    path = (base_dir / source).resolve()
+    if path.exists():
+        return path
+    name = Path(source.replace("\\", "/")).name
+    for candidate in (base_dir / name, base_dir.parent / "tilesets" / name, Path(__file__).parent / "tilesets" / name):
+        if candidate.exists():
+            return candidate.resolve()
+    return path
+
+
+def load_level(path):
+    path = Path(path)
+    root = ET.parse(path).getroot()
+    width = int(root.get("width"))
+    height = int(root.get("height"))
+    tile_width = int(root.get("tilewidth"))
+    tile_height = int(root.get("tileheight"))
+    tilesets = [
+        parse_tileset(element, int(element.get("firstgid")), path.parent, (tile_width, tile_height))
+        for element in root.findall("tileset")
+    ]
+    tilesets.sort(key=lambda tileset: tileset.firstgid)
+    layers = {}
+    layer_info = {}
+    for layer in root.iter("layer"):
+        name = layer.get("name")
+        layers[name] = parse_layer_data(layer.find("data"), width * height)
+        layer_info[name] = {"visible": layer.get("visible", "1") != "0",
+                            "opacity": float(layer.get("opacity", 1.0))}
+    return Level(path, width, height, tile_width, tile_height, tilesets, layers, layer_info)
+
+
+def default_map_path(project_root=None):
+    project_root = Path(project_root or Path(__file__).parent)
+    map_path = project_root / "proj1.tmx"
+    if not map_path.exists():
+        map_path = project_root / "maps" / "proj1.tmx"
+    return map_path
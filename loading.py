@@ -0,0 +1,43 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Загрузка по кускам, пока окно продолжает рисовать и принимать ввод.
+#
+# Шаги загрузки — генератор на основном потоке. Он отдаёт (доля, подпись) после каждого
+# куска работы или None, если ждёт фоновый поток: тогда кадр отпускается сразу.
+# Тяжёлое для процессора (PIL, разбор TMX, декодирование звука) уходит в фон через
+# `result = yield from background(fn, ...)`, работа с GPU остаётся на основном потоке.
+
+frame_budget = 0.004  # секунд на кадр для шагов основного потока
+
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="loader")
+
+
+def background(fn, *args):
+    future = executor.submit(fn, *args)
+    while not future.done():
+        yield None
+    return future.result()
+
+
+class Loader:
+    def __init__(self, steps):
+        self.steps = steps
+        self.progress = 0.0
+        self.label = ""
+        self.done = False
+
+    def advance(self, budget=frame_budget):
+        # Шаги до конца бюджета кадра или до ожидания фона; True — загрузка закончена
+        deadline = time.perf_counter() + budget
+        while not self.done and time.perf_counter() < deadline:
+            try:
+                step = next(self.steps)
+            except StopIteration:
+                self.done = True
+                self.progress = 1.0
+                break
+            if step is None:
+                break
+            self.progress, self.label = step
+        return self.done
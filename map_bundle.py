@@ -0,0 +1,187 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from pathlib import Path
+
+from level import Level, Tileset, load_level
+
+# Скомпилированный уровень: TMX и тайлсеты один раз сводятся в бинарный файл рядом с картой
+# (maps/proj1.lvl), который при запуске отображается в память через mmap.
+#
+# Формат (little-endian):
+#   заголовок  magic "CLVL", версия, длина метаданных, смещение данных
+#   метаданные JSON: размеры, таблица тайлсетов с уже найденными путями, слои,
+#              непрозрачные области тайлов шипов и фруктов, файлы-источники с mtime
+#   данные     на каждый слой width*height uint32 GID, затем сетки занятости uint8 по клеткам
+#
+#   python map_bundle.py maps/proj1.tmx   — перекомпилировать и сравнить время загрузки
+
+MAGIC = b"CLVL"
+VERSION = 1
+HEADER = struct.Struct("<4sIII")
+GRID_LAYERS = {"collision": "Platforms", "hazard": "idle"}
+BOX_LAYERS = ("idle", "fruits")
+
+
+def bundle_path(tmx_path):
+    return Path(tmx_path).with_suffix(".lvl")
+
+
+def layer_cells(level, layer):
+    grid = level.build_grid(layer)
+    return bytes(grid.cells)
+
+
+def compile_level(level, out_path):
+    out_path = Path(out_path)
+    base = out_path.parent.resolve()
+
+    def relative(path):
+        return os.path.relpath(Path(path).resolve(), base) if path is not None else None
+
+    boxes = {}
+    for layer in BOX_LAYERS:
+        for _, _, gid in level.tile_cells(layer):
+            if gid not in boxes:
+                boxes[gid] = level.opaque_box(gid)
+
+    layer_names = list(level.layers)
+    meta = {
+        "width": level.width,
+        "height": level.height,
+        "tile_width": level.tile_width,
+        "tile_height": level.tile_height,
+        "tilesets": [
+            [t.firstgid, t.name, t.tile_width, t.tile_height, t.tilecount, t.columns,
+             relative(t.image), relative(t.source), t.spacing, t.margin]
+            for t in level.tilesets
+        ],
+        "layers": [[name, level.layer_info[name]["visible"], level.layer_info[name]["opacity"]]
+                   for name in layer_names],
+        "grids": [kind for kind, layer in GRID_LAYERS.items() if layer in level.layers],
+        "boxes": {str(gid): box for gid, box in boxes.items()},
+        "sources": [[relative(path), os.stat(path).st_mtime_ns] for path in level.sources()],
+    }
+    meta_bytes = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+    # Данные выравниваются по 4 байта, чтобы массив GID можно было привести к uint32 без копии
+    data_offset = (HEADER.size + len(meta_bytes) + 3) & ~3
+
+    temp_path = out_path.with_name(out_path.name + ".tmp")
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(meta_bytes), data_offset))
+        f.write(meta_bytes)
+        f.write(b"\0" * (data_offset - HEADER.size - len(meta_bytes)))
+        for name in layer_names:
+            gids = struct.pack(f"<{level.width * level.height}I", *level.layers[name])
+            f.write(gids)
+        for kind in meta["grids"]:
+            f.write(layer_cells(level, GRID_LAYERS[kind]))
+    os.replace(temp_path, out_path)
+
+
+class MappedLevel(Level):
+    # Уровень поверх отображённого файла: массивы слоёв — представления памяти без копирования
+    def __init__(self, path, source_path, buffer, meta, data_offset):
+        base = Path(path).parent
+
+        def absolute(value):
+            return (base / value).resolve() if value is not None else None
+
+        tilesets = [
+            Tileset(firstgid, name, tile_width, tile_height, tilecount, columns, absolute(image),
+                    absolute(source), spacing, margin)
+            for firstgid, name, tile_width, tile_height, tilecount, columns, image, source, spacing, margin
+            in meta["tilesets"]
+        ]
+        width, height = meta["width"], meta["height"]
+        count = width * height
+        view = memoryview(buffer)
+        offset = data_offset
+        layers = {}
+        layer_info = {}
+        for name, visible, opacity in meta["layers"]:
+            layer = view[offset:offset + count * 4]
+            layers[name] = layer.cast("I") if sys.byteorder == "little" else struct.unpack(f"<{count}I", layer)
+            layer_info[name] = {"visible": visible, "opacity": opacity}
+            offset += count * 4
+        super().__init__(source_path, width, height, meta["tile_width"], meta["tile_height"],
+                         tilesets, layers, layer_info)
+        for kind in meta["grids"]:
+            self.grids[GRID_LAYERS[kind]] = view[offset:offset + count]
+            offset += count
+        self.opaque_boxes = {int(gid): tuple(box) if box else None for gid, box in meta["boxes"].items()}
+        self.source_stamps = [(absolute(path), stamp) for path, stamp in meta["sources"]]
+        self.bundle = path
+        self.buffer = buffer
+
+    def sources(self):
+        return [path for path, _ in self.source_stamps]
+
+    def is_fresh(self):
+        for path, stamp in self.source_stamps:
+            try:
+                if os.stat(path).st_mtime_ns != stamp:
+                    return False
+            except OSError:
+                return False
+        return True
+
+
+def open_bundle(path, source_path=None):
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, meta_length, data_offset = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC or version != VERSION:
+        buffer.close()
+        raise ValueError(f"{path}: не скомпилированный уровень или старая версия формата")
+    meta = json.loads(bytes(buffer[HEADER.size:HEADER.size + meta_length]).decode("utf-8"))
+    return MappedLevel(path, source_path or path, buffer, meta, data_offset)
+
+
+def load_map(tmx_path):
+    # Скомпилированный уровень; перекомпилируется, если TMX, тайлсеты или их картинки новее
+    tmx_path = Path(tmx_path)
+    path = bundle_path(tmx_path)
+    try:
+        level = open_bundle(path, tmx_path)
+        if level.is_fresh():
+            return level
+    except (OSError, ValueError):
+        pass
+    level = load_level(tmx_path)
+    try:
+        compile_level(level, path)
+        return open_bundle(path, tmx_path)
+    except OSError:
+        # Папка только для чтения: работаем с разобранным TMX
+        return level
+
+
+def main():
+    tmx_path = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / "maps" / "proj1.tmx"
+
+    started = time.perf_counter()
+    level = load_level(tmx_path)
+    level.build_grid("Platforms")
+    for layer in BOX_LAYERS:
+        level.build_object_index(layer)
+    tmx_time = time.perf_counter() - started
+
+    compile_level(level, bundle_path(tmx_path))
+
+    started = time.perf_counter()
+    bundle = open_bundle(bundle_path(tmx_path), tmx_path)
+    bundle.build_grid("Platforms")
+    for layer in BOX_LAYERS:
+        bundle.build_object_index(layer)
+    bundle_time = time.perf_counter() - started
+
+    print(f"{bundle_path(tmx_path)}: {os.path.getsize(bundle_path(tmx_path))} байт")
+    print(f"холодная загрузка TMX: {tmx_time * 1000:.1f} мс, скомпилированный уровень: {bundle_time * 1000:.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
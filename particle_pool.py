@@ -0,0 +1,162 @@
+import numpy as np
+
+import arcade
+
+# Частицы в пуле фиксированного размера на массивах NumPy: обновление одним векторным шагом,
+# отрисовка одним вызовом — точки с мягким кругом в шейдере вместо спрайтов с текстурами.
+# Живые частицы всегда лежат в начале массивов [0:count].
+
+# Флаг «размер точки из шейдера» (gl_PointSize). Контекст arcade до 3.3 отдаёт его как
+# ctx.PROGRAM_POINT_SIZE, в 3.3 атрибут убран, но enable/enable_only по-прежнему его понимают.
+PROGRAM_POINT_SIZE = getattr(arcade.ArcadeContext, "PROGRAM_POINT_SIZE", 0x8642)
+
+VERTEX_SHADER = """
+#version 330
+
+uniform WindowBlock {
+    mat4 projection;
+    mat4 view;
+} window;
+
+uniform float viewport_width;
+
+in vec2 in_pos;
+in float in_size;
+in vec4 in_color;
+
+out vec4 v_color;
+
+void main() {
+    gl_Position = window.projection * window.view * vec4(in_pos, 0.0, 1.0);
+    // Диаметр из мировых единиц в пиксели с учётом зума камеры
+    vec4 unit = window.projection * window.view * vec4(1.0, 0.0, 0.0, 0.0);
+    gl_PointSize = in_size * length(unit.xy) * 0.5 * viewport_width;
+    v_color = in_color;
+}
+"""
+
+FRAGMENT_SHADER = """
+#version 330
+
+in vec4 v_color;
+
+out vec4 fragColor;
+
+void main() {
+    // Как make_soft_circle_texture: альфа линейно падает от центра к краю
+    float r = length(gl_PointCoord * 2.0 - 1.0);
+    if (r > 1.0) {
+        discard;
+    }
+    fragColor = vec4(v_color.rgb, v_color.a * (1.0 - r));
+}
+"""
+
+_programs = {}
+
+
+def get_program(ctx):
+    program = _programs.get(ctx)
+    if program is None:
+        program = _programs[ctx] = ctx.program(vertex_shader=VERTEX_SHADER, fragment_shader=FRAGMENT_SHADER)
+    return program
+
+
+class Effect:
+    # Параметры вылета частиц; kinds — (цвет, диаметр в пикселях текстуры, альфа в центре)
+    def __init__(self, kinds, speed, lifetime, start_alpha, end_alpha, scale):
+        self.kinds = kinds
+        self.speed = speed
+        self.lifetime = lifetime
+        self.start_alpha = start_alpha
+        self.end_alpha = end_alpha
+        self.scale = scale
+        self.colors = np.array([color[:3] for color, _, _ in kinds], dtype=np.float32) / 255
+        self.sizes = np.array([size for _, size, _ in kinds], dtype=np.float32)
+        self.alphas = np.array([alpha for _, _, alpha in kinds], dtype=np.float32) / 255
+
+
+class ParticlePool:
+    def __init__(self, capacity, effect, seed=None):
+        self.capacity = capacity
+        self.effect = effect
+        self.count = 0
+        self.rng = np.random.default_rng(seed)
+        self.position = np.zeros((capacity, 2), dtype=np.float32)
+        self.velocity = np.zeros((capacity, 2), dtype=np.float32)
+        self.age = np.zeros(capacity, dtype=np.float32)
+        self.lifetime = np.ones(capacity, dtype=np.float32)
+        self.scale = np.zeros(capacity, dtype=np.float32)
+        self.kind = np.zeros(capacity, dtype=np.uint8)
+        # Вершины для GPU: x, y, диаметр, r, g, b, a
+        self.vertices = np.zeros((capacity, 7), dtype=np.float32)
+        self.geometry = None
+        self.last_step = 0.0
+
+    def emit(self, count, x, y):
+        # Сверх ёмкости не вылетает: пул не растёт
+        count = min(count, self.capacity - self.count)
+        if count <= 0:
+            return
+        effect = self.effect
+        rng = self.rng
+        new = slice(self.count, self.count + count)
+        # Равномерно по кругу радиуса speed, как arcade.math.rand_in_circle
+        angle = rng.uniform(0, 2 * np.pi, count)
+        radius = effect.speed * np.sqrt(rng.random(count))
+        self.position[new] = x, y
+        self.velocity[new, 0] = radius * np.cos(angle)
+        self.velocity[new, 1] = radius * np.sin(angle)
+        self.age[new] = 0
+        self.lifetime[new] = rng.uniform(*effect.lifetime, count)
+        self.scale[new] = rng.uniform(*effect.scale, count)
+        self.kind[new] = rng.integers(0, len(effect.kinds), count)
+        self.count += count
+
+    def update(self, delta_time=1 / 60):
+        self.last_step = delta_time
+        count = self.count
+        if not count:
+            return
+        # Скорость — смещение за кадр при 60 FPS, как у частиц arcade
+        self.position[:count] += self.velocity[:count] * (delta_time * 60)
+        self.age[:count] += delta_time
+        alive = self.age[:count] < self.lifetime[:count]
+        left = int(alive.sum())
+        if left != count:
+            for array in (self.position, self.velocity, self.age, self.lifetime, self.scale, self.kind):
+                array[:left] = array[:count][alive]
+            self.count = left
+
+    def clear(self):
+        self.count = 0
+
+    def draw(self, interpolation=1.0):
+        # interpolation — доля от предыдущего шага update к последнему (фиксированный шаг симуляции)
+        count = self.count
+        if not count:
+            return
+        effect = self.effect
+        kind = self.kind[:count]
+        t = self.age[:count] / self.lifetime[:count]
+        alpha = np.clip(effect.start_alpha + (effect.end_alpha - effect.start_alpha) * t, 0, 255) / 255
+        vertices = self.vertices
+        vertices[:count, 0:2] = self.position[:count]
+        if interpolation < 1.0:
+            vertices[:count, 0:2] -= self.velocity[:count] * ((1.0 - interpolation) * self.last_step * 60)
+        vertices[:count, 2] = effect.sizes[kind] * self.scale[:count]
+        vertices[:count, 3:6] = effect.colors[kind]
+        vertices[:count, 6] = effect.alphas[kind] * alpha
+
+        ctx = arcade.get_window().ctx
+        if self.geometry is None:
+            self.buffer = ctx.buffer(reserve=vertices.nbytes)
+            self.geometry = ctx.geometry(
+                [arcade.gl.BufferDescription(self.buffer, "2f 1f 4f", ["in_pos", "in_size", "in_color"])],
+                mode=ctx.POINTS)
+        self.buffer.write(vertices[:count].tobytes())
+        program = get_program(ctx)
+        program["viewport_width"] = ctx.viewport[2]
+        with ctx.enabled(ctx.BLEND, PROGRAM_POINT_SIZE):
+            ctx.blend_func = ctx.BLEND_DEFAULT
+            self.geometry.render(program, vertices=count)
@@ -0,0 +1,141 @@
+import csv
+import time
+from pathlib import Path
+
+import numpy as np
+
+import arcade
+from hud import TextBatch
+
+# Покадровый профилировщик по фазам on_update/on_draw. Выключен по умолчанию:
+# mark() тогда сразу возвращается, и цена — один вызов метода на фазу.
+#
+#   F3 — включить запись и оверлей (p50/p95/p99 по фазам и график времени кадра)
+#   F4 — сохранить накопленные кадры в profiles/profile_<время>.csv (путь виден в оверлее)
+#
+# Кадр — строка кольцевого буфера: время кадра (между началами on_update) и мс на каждую фазу.
+
+UPDATE_PHASES = ("fruits", "sim", "events", "animation", "hud", "audio", "camera", "chunks", "particles")
+DRAW_PHASES = ("draw_world", "draw_player", "draw_particles", "draw_hud")
+PHASES = ("frame",) + UPDATE_PHASES + DRAW_PHASES
+
+history_frames = 600
+stats_interval = 30  # перцентили пересчитываются раз в столько кадров
+graph_width = 300
+graph_height = 80
+graph_scale_ms = 33.3  # высота графика
+column_x = (0, 170, 230, 300)  # правые края колонок перцентилей
+profile_dir = Path("profiles")
+
+
+class FrameProfiler:
+    def __init__(self, phases=PHASES, capacity=history_frames):
+        self.phases = phases
+        self.columns = {phase: i for i, phase in enumerate(phases)}
+        self.capacity = capacity
+        self.samples = np.zeros((capacity, len(phases)), dtype=np.float32)
+        self.frames = 0
+        self.row = None
+        self.enabled = False
+        self.frame_started = None
+        self.last_mark = 0.0
+        self.overlay = None
+        self.percentiles = None
+        self.saved = ""
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.frame_started = None
+        self.row = None
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.row is not None and self.frame_started is not None:
+            self.row[0] = (now - self.frame_started) * 1000
+            self.frames += 1
+            if self.frames % stats_interval == 0:
+                self.percentiles = None
+        self.row = self.samples[self.frames % self.capacity]
+        self.row[:] = 0
+        self.frame_started = now
+        self.last_mark = now
+
+    def start(self):
+        # Начало отсчёта фаз внутри кадра (например, в on_draw)
+        if not self.enabled:
+            return
+        self.last_mark = time.perf_counter()
+
+    def mark(self, phase):
+        # Время с предыдущей отметки уходит в фазу phase
+        if not self.enabled or self.row is None:
+            return
+        now = time.perf_counter()
+        self.row[self.columns[phase]] += (now - self.last_mark) * 1000
+        self.last_mark = now
+
+    def history(self):
+        # Завершённые кадры в хронологическом порядке
+        if self.frames < self.capacity:
+            return self.samples[:self.frames]
+        # Строка start — текущий незавершённый кадр
+        start = self.frames % self.capacity
+        return np.concatenate((self.samples[start + 1:], self.samples[:start]))
+
+    def summary(self):
+        if self.percentiles is None:
+            history = self.history()
+            if not len(history):
+                return None
+            self.percentiles = np.percentile(history, (50, 95, 99), axis=0)
+        return self.percentiles
+
+    def dump_csv(self, path=None):
+        if path is None:
+            profile_dir.mkdir(exist_ok=True)
+            path = profile_dir / time.strftime("profile_%Y%m%d_%H%M%S.csv")
+        history = self.history()
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(self.phases)
+            writer.writerows(np.round(history.astype(np.float64), 4).tolist())
+        self.saved = f"сохранено: {path}"
+        return path
+
+    def draw_overlay(self, x, top):
+        if not self.enabled:
+            return
+        if self.overlay is None:
+            # Колонки отдельными надписями: выравнивание не зависит от наличия моноширинного шрифта
+            self.overlay = TextBatch()
+            for column, title in enumerate(("фаза", "p50", "p95", "p99 мс")):
+                self.overlay.add(("header", column), title, x + column_x[column], top, arcade.color.YELLOW, 11,
+                                 anchor_x="left" if column == 0 else "right")
+            for i, phase in enumerate(self.phases):
+                y = top - 15 * (i + 1)
+                self.overlay.add((phase, 0), phase, x, y, arcade.color.WHITE, 11)
+                for column in (1, 2, 3):
+                    self.overlay.add((phase, column), "", x + column_x[column], y, arcade.color.WHITE, 11,
+                                     anchor_x="right")
+            self.overlay.add("saved", "", x, top - 15 * (len(self.phases) + 1) - graph_height - 20,
+                             arcade.color.YELLOW, 11)
+        percentiles = self.summary()
+        if percentiles is not None:
+            for i, phase in enumerate(self.phases):
+                for column in (1, 2, 3):
+                    self.overlay.set((phase, column), round(float(percentiles[column - 1, i]), 2), "{:.2f}")
+        graph_top = top - 15 * (len(self.phases) + 1) - 5
+        bottom = graph_top - graph_height
+        arcade.draw_lrbt_rectangle_filled(x, x + graph_width, bottom, graph_top, (0, 0, 0, 160))
+        frames = self.history()[-graph_width:, 0]
+        if len(frames) > 1:
+            heights = np.minimum(frames / graph_scale_ms, 1.0) * graph_height + bottom
+            xs = np.arange(len(frames)) + x + graph_width - len(frames)
+            arcade.draw_line_strip(list(zip(xs.tolist(), heights.tolist())), arcade.color.LIME_GREEN, 1)
+        # Линия 60 FPS
+        budget = bottom + 1000 / 60 / graph_scale_ms * graph_height
+        arcade.draw_line(x, budget, x + graph_width, budget, arcade.color.RED, 1)
+        self.overlay.set("saved", self.saved)
+        self.overlay.draw()
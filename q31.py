@@ -1,152 +1,155 @@
+import startup  # первым: отметка начала импортов
+import importlib
 import arcade
 from pathlib import Path
 from arcade import Camera2D
-from arcade.particles import FadeParticle, Emitter, EmitMaintainCount, EmitBurst
 import math
-import random
-from PIL import Image, ImageOps
-import csv
-import os
-
-# Частицы
-spark_tex = [
-    arcade.make_soft_circle_texture(6, arcade.color.WHITE, 210),
-    arcade.make_soft_circle_texture(4, arcade.color.LIGHT_GRAY, 170),
-]
-
-
-def make_trail(attached_sprite, maintain=38):
-    return Emitter(
-        center_xy=(attached_sprite.center_x, attached_sprite.center_y),
-        emit_controller=EmitMaintainCount(maintain),
-        particle_factory=lambda e: FadeParticle(
-            filename_or_texture=random.choice(spark_tex),
-            change_xy=arcade.math.rand_in_circle((0.0, 0.0), 1.1),
-            lifetime=random.uniform(0.22, 0.42),
-            start_alpha=190,
-            end_alpha=0,
-            scale=random.uniform(0.16, 0.28),
-        ),
-    )
-
-
-explosion_tex = [
-    arcade.make_soft_circle_texture(14, arcade.color.CANDY_APPLE_RED, 240),
-    arcade.make_soft_circle_texture(12, arcade.color.ORANGE_RED, 220),
-    arcade.make_soft_circle_texture(10, arcade.color.DARK_ORANGE, 200),
-]
-
-
-def make_explosion(center_x, center_y):
-    return Emitter(
-        center_xy=(center_x, center_y),
-        emit_controller=EmitBurst(50),
-        particle_factory=lambda e: FadeParticle(
-            filename_or_texture=random.choice(explosion_tex),
-            change_xy=arcade.math.rand_in_circle((0.0, 0.0), 5.0),
-            lifetime=random.uniform(0.5, 0.8),
-            start_alpha=230,
-            end_alpha=0,
-            scale=random.uniform(0.4, 0.7),
-        ),
-    )
+import time
+from hud import TextBatch
+import replay
+from simulation import (PlayerSim, EV_DIED, EV_RESPAWNED, IN_LEFT, IN_RIGHT, IN_UP, IN_DOWN, IN_JUMP, IN_DASH,
+                        IN_CLIMB, map_scaling, sprite_scale, tile_size, spawn_x, spawn_y, sim_rate)
+from stats_store import StatsStore
+from stats_writer import StatsWriter
+
+# Модули только для игры (NumPy, PIL, разбор карт) импортируются при запуске уровня,
+# в фоне под экраном загрузки (import_game_modules), а в функциях — по месту: меню открывается без них.
+
+# Частицы: пулы NumPy (particle_pool.py), мягкие круги рисует шейдер. Effect собирается в setup()
+TRAIL = dict(
+    kinds=[(arcade.color.WHITE, 6, 210), (arcade.color.LIGHT_GRAY, 4, 170)],
+    speed=1.1, lifetime=(0.22, 0.42), start_alpha=190, end_alpha=0, scale=(0.16, 0.28),
+)
+TRAIL_COUNT = 38
+
+EXPLOSION = dict(
+    kinds=[(arcade.color.CANDY_APPLE_RED, 14, 240), (arcade.color.ORANGE_RED, 12, 220),
+           (arcade.color.DARK_ORANGE, 10, 200)],
+    speed=5.0, lifetime=(0.5, 0.8), start_alpha=230, end_alpha=0, scale=(0.4, 0.7),
+)
+EXPLOSION_COUNT = 50
+
+startup.mark("imports")
+
+
+GAME_MODULES = ("assets", "audio", "chunks", "hot_reload", "map_bundle", "particle_pool", "profiler", "telemetry")
+
+
+def import_game_modules():
+    for name in GAME_MODULES:
+        importlib.import_module(name)
 
 
 # Константы
 screen_width = 800
 screen_height = 700
 screen_title = "Celeste"
-gravity = 0.9
-move_speed = 1.6
-jump_speed = 5.8
-coyote_time = 0.08
-jump_buffer = 0.12
-max_jumps = 1
-dash_duration = 0.12
-dash_speed = 300.0
-dash_post_impulse = 6
-max_dashes = 1
 camera_lerp = 0.12
-max_stamina = 5.0
-climb_speed = 0.85
-wall_dash_stamina_cost = 2.0
-sprite_scale = 0.35
-map_scaling = 0.5
-tile_size = 16 * map_scaling
-STATS_FILE = "game_stats.csv"
+# Симуляция идёт фиксированными шагами 1/sim_rate независимо от частоты кадров: между двумя
+# последними состояниями игрок, камера и частицы интерполируются при отрисовке
+sim_step = 1 / sim_rate
+max_sim_steps = 5  # больше шагов за кадр не догоняем: при провале игра замедляется, а не зависает
+display_rate = 60  # частота кадров окна: 144/240 или 30 на слабых машинах, физика от неё не зависит
+world_zoom = 4.8
+status_seconds = 4.0  # сколько держится сообщение о перезагрузке карты
+project_root = Path(__file__).parent
+RUN_SHEET = (project_root / "Run (32x32).png", 4)
+CLIMB_SHEET = (project_root / "Wall Jump (32x32).png", 5)
+FRUIT_SOUND = ":resources:sounds/coin5.wav"
+# Звуки — через пул голосов (audio.py): имя → (файл, громкость, предел одновременных голосов)
+SOUNDS = {
+    "fruit": (FRUIT_SOUND, 0.2, 3),
+}
+# События симуляции со звуком: бит EV_* → имя из SOUNDS (смерть, рывок, прыжок добавляются сюда)
+EVENT_SOUNDS = {}
+hazard_margin = tile_size / 2
+STATS_FILE = "game_stats.csv"  # старый формат, импортируется в базу один раз
+STATS_DB = "game_stats.db"
+STATS_PAGE_SIZE = 10
+GHOST_ALPHA = 100  # призрак лучшего прогона рисуется полупрозрачным
 WORLD_COLOR = arcade.color.SKY_BLUE  # ← ДОБАВЛЕНА КОНСТАНТА ФОНА
 
+# Клавиши управления → биты маски ввода симуляции
+KEY_BITS = {
+    arcade.key.LEFT: IN_LEFT, arcade.key.A: IN_LEFT,
+    arcade.key.RIGHT: IN_RIGHT, arcade.key.D: IN_RIGHT,
+    arcade.key.UP: IN_UP, arcade.key.W: IN_UP,
+    arcade.key.DOWN: IN_DOWN, arcade.key.S: IN_DOWN,
+    arcade.key.SPACE: IN_JUMP,
+    arcade.key.X: IN_DASH,
+    arcade.key.C: IN_CLIMB,
+}
+
 
 class StatsView(arcade.View):
     def __init__(self, menu_view):
         super().__init__()
         self.menu_view = menu_view
-        self.title = arcade.Text("СТАТИСТИКА ИГРОКОВ", screen_width / 2, screen_height - 60,
-                                 arcade.color.WHITE, 42, anchor_x="center", bold=True)
+        # Все надписи экрана в одной пачке; строки таблицы создаются один раз и переиспользуются
+        self.texts = TextBatch()
+        self.texts.add("title", "СТАТИСТИКА ИГРОКОВ", screen_width / 2, screen_height - 60,
+                       arcade.color.WHITE, 42, anchor_x="center", bold=True)
         self.back_button = [
             screen_width / 2 - 100, screen_width / 2 + 100, 40, 90,
-            arcade.Text("Назад", screen_width / 2, 65, arcade.color.WHITE, 24, anchor_x="center", anchor_y="center"),
+            self.texts.add("back", "Назад", screen_width / 2, 65, arcade.color.WHITE, 24,
+                           anchor_x="center", anchor_y="center"),
             self.go_back
         ]
-        self.header_texts = [
-            arcade.Text("Игрок", 150, screen_height - 120, arcade.color.CYAN, 18, bold=True),
-            arcade.Text("Смерти", 400, screen_height - 120, arcade.color.RED, 18, bold=True, anchor_x="center"),
-            arcade.Text("Фрукты", 650, screen_height - 120, arcade.color.GOLD, 18, bold=True, anchor_x="center"),
-        ]
-        self.player_rows = []
+        self.texts.add("header_name", "Игрок", 150, screen_height - 120, arcade.color.CYAN, 18, bold=True)
+        self.texts.add("header_deaths", "Смерти", 400, screen_height - 120, arcade.color.RED, 18, bold=True,
+                       anchor_x="center")
+        self.texts.add("header_fruits", "Фрукты", 650, screen_height - 120, arcade.color.GOLD, 18, bold=True,
+                       anchor_x="center")
+        self.store = menu_view.game_view.stats_store
+        self.page = 0
+        self.page_count = 1
+        self.texts.add("page", "", screen_width - 60, 65, arcade.color.GRAY, 14, anchor_x="right", anchor_y="center")
+        y_start = screen_height - 170
+        for i in range(STATS_PAGE_SIZE):
+            y = y_start - i * 45
+            self.texts.add(("name", i), "", 150, y, arcade.color.WHITE, 16, anchor_x="left")
+            self.texts.add(("deaths", i), "", 400, y, arcade.color.RED, 16, anchor_x="center")
+            self.texts.add(("fruits", i), "", 650, y, arcade.color.GOLD, 16, anchor_x="center")
         self.load_stats_data()
 
     def load_stats_data(self):
-        players = []
-        if os.path.exists(STATS_FILE):
-            try:
-                with open(STATS_FILE, 'r', encoding='utf-8') as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        name = row.get("player_name", "").strip()
-                        if name:
-                            players.append({
-                                "name": name,
-                                "deaths": int(row.get("deaths", 0)),
-                                "fruits": int(row.get("fruits_collected", 0))
-                            })
-            except:
-                pass
-
-        players.sort(key=lambda x: x["fruits"], reverse=True)
-        self.player_rows = []
-        y_start = screen_height - 170
-        for i, player in enumerate(players[:15]):
-            y = y_start - i * 45
-            if y < 120:
-                break
+        # Читаем из индекса только текущую страницу
+        self.page_count = max(1, math.ceil(self.store.count() / STATS_PAGE_SIZE))
+        self.page = max(0, min(self.page, self.page_count - 1))
+        players = self.store.leaderboard(self.page, STATS_PAGE_SIZE)
+        self.texts.set("page", (self.page + 1, self.page_count), "стр. {0[0]}/{0[1]}  (←/→)")
+        for i in range(STATS_PAGE_SIZE):
+            if i >= len(players):
+                self.texts.set(("name", i), "")
+                self.texts.set(("deaths", i), "")
+                self.texts.set(("fruits", i), "")
+                continue
+            player = players[i]
             name_color = (arcade.color.GOLD if player["fruits"] >= 10 else
                           arcade.color.LIME_GREEN if player["fruits"] >= 5 else
                           arcade.color.WHITE if player["fruits"] >= 2 else
                           arcade.color.ORANGE_RED)
-            self.player_rows.append([
-                arcade.Text(player["name"], 150, y, name_color, 16, anchor_x="left"),
-                arcade.Text(str(player["deaths"]), 400, y, arcade.color.RED, 16, anchor_x="center"),
-                arcade.Text(str(player["fruits"]), 650, y, arcade.color.GOLD, 16, anchor_x="center"),
-            ])
+            self.texts.set(("name", i), player["name"], color=name_color)
+            self.texts.set(("deaths", i), player["deaths"])
+            self.texts.set(("fruits", i), player["fruits"])
+
+    def turn_page(self, delta):
+        page = max(0, min(self.page + delta, self.page_count - 1))
+        if page != self.page:
+            self.page = page
+            self.load_stats_data()
 
     def go_back(self):
         self.window.show_view(self.menu_view)
 
     def on_draw(self):
         self.clear(arcade.color.BLACK)
-        self.title.draw()
-        for text in self.header_texts:
-            text.draw()
         arcade.draw_line(50, screen_height - 135, screen_width - 50, screen_height - 135, arcade.color.GRAY, 2)
-        # Отображаем только если есть данные
-        for row in self.player_rows:
-            for text in row:
-                text.draw()
-        left, right, bottom, top, text_obj, _ = self.back_button
+        left, right, bottom, top, _, _ = self.back_button
         arcade.draw_lrbt_rectangle_filled(left, right, bottom, top, arcade.color.DARK_GRAY)
         arcade.draw_lrbt_rectangle_outline(left, right, bottom, top, arcade.color.WHITE, 2)
-        text_obj.draw()
+        # Подписи поверх кнопки — одним вызовом
+        self.texts.draw()
 
     def on_mouse_press(self, x, y, button, modifiers):
         left, right, bottom, top, _, action = self.back_button
@@ -156,6 +159,10 @@ class StatsView(arcade.View):
     def on_key_press(self, key, modifiers):
         if key == arcade.key.ESCAPE:
             self.go_back()
+        elif key in (arcade.key.RIGHT, arcade.key.PAGEDOWN):
+            self.turn_page(1)
+        elif key in (arcade.key.LEFT, arcade.key.PAGEUP):
+            self.turn_page(-1)
 
 
 class MainMenu(arcade.View):
@@ -166,20 +173,22 @@ class MainMenu(arcade.View):
         self.input_active = False
         self.cursor_visible = True
         self.cursor_timer = 0.0
-        self.title = arcade.Text("CELESTE", screen_width / 2, screen_height - 100,
-                                 arcade.color.WHITE, 64, anchor_x="center", bold=True)
-        self.name_prompt = arcade.Text("Имя игрока:", screen_width / 2 - 190, screen_height / 2 + 40,
-                                       arcade.color.LIGHT_GRAY, 20, anchor_x="left")
-        self.name_display = arcade.Text("", screen_width / 2 - 180, screen_height / 2 - 5,
-                                        arcade.color.WHITE, 32, anchor_x="left")
+        self.texts = TextBatch()
+        self.texts.add("title", "CELESTE", screen_width / 2, screen_height - 100,
+                       arcade.color.WHITE, 64, anchor_x="center", bold=True)
+        self.texts.add("prompt", "Имя игрока:", screen_width / 2 - 190, screen_height / 2 + 40,
+                       arcade.color.LIGHT_GRAY, 20, anchor_x="left")
+        self.texts.add("name", "", screen_width / 2 - 180, screen_height / 2 - 5,
+                       arcade.color.WHITE, 32, anchor_x="left")
+        self.refresh_name()
         self.buttons = []
         button_configs = [("Выйти", 220, arcade.close_window),
                           ("Статистика", 140, self.show_stats),
                           ("Начать игру", 60, self.start_game)]
         for text, y_offset, action in button_configs:
             y_center = screen_height / 2 - y_offset
-            btn_text = arcade.Text(text, screen_width / 2, y_center,
-                                   arcade.color.WHITE, 24, anchor_x="center", anchor_y="center")
+            btn_text = self.texts.add(("button", text), text, screen_width / 2, y_center,
+                                      arcade.color.WHITE, 24, anchor_x="center", anchor_y="center")
             self.buttons.append([
                 screen_width / 2 - 125, screen_width / 2 + 125,
                 y_center - 30, y_center + 30, btn_text, action
@@ -188,23 +197,24 @@ class MainMenu(arcade.View):
     def show_stats(self):
         self.window.show_view(StatsView(self))
 
+    def refresh_name(self):
+        # Строка с курсором собирается только при вводе, смене фокуса и мигании
+        cursor = "|" if self.cursor_visible and self.input_active else ""
+        self.texts.set("name", self.player_name + cursor)
+
     def on_draw(self):
         self.clear(arcade.color.BLACK)
-        self.title.draw()
         arcade.draw_lrbt_rectangle_outline(
             screen_width / 2 - 200, screen_width / 2 + 200,
             screen_height / 2 - 15, screen_height / 2 + 35,
             arcade.color.LIME_GREEN if self.input_active else arcade.color.GRAY, 3
         )
-        self.name_prompt.draw()
-        display_text = self.player_name + ("|" if self.cursor_visible and self.input_active else "")
-        self.name_display.text = display_text
-        self.name_display.draw()
         for btn in self.buttons:
-            left, right, bottom, top, text_obj, _ = btn
+            left, right, bottom, top, _, _ = btn
             arcade.draw_lrbt_rectangle_filled(left, right, bottom, top, arcade.color.DARK_GRAY)
             arcade.draw_lrbt_rectangle_outline(left, right, bottom, top, arcade.color.WHITE, 2)
-            text_obj.draw()
+        self.texts.draw()
+        startup.finish("first_frame")
 
     def on_mouse_press(self, x, y, button, modifiers):
         for btn in self.buttons:
@@ -214,6 +224,7 @@ class MainMenu(arcade.View):
                 return
         self.input_active = (screen_width / 2 - 200 < x < screen_width / 2 + 200 and
                              screen_height / 2 - 15 < y < screen_height / 2 + 35)
+        self.refresh_name()
 
     def on_key_press(self, key, modifiers):
         if key == arcade.key.ESCAPE:
@@ -222,12 +233,14 @@ class MainMenu(arcade.View):
             self.start_game()
         elif key == arcade.key.TAB:
             self.input_active = not self.input_active
+            self.refresh_name()
         elif key == arcade.key.S:
             self.show_stats()
 
     def on_text(self, text):
         if self.input_active and len(self.player_name) < 15:
             self.player_name += text
+            self.refresh_name()
 
     def on_text_motion(self, motion):
         if self.input_active:
@@ -235,27 +248,69 @@ class MainMenu(arcade.View):
                 self.player_name = self.player_name[:-1]
             elif motion == arcade.key.MOTION_DELETE:
                 self.player_name = ""
+            self.refresh_name()
 
     def start_game(self):
         if not self.player_name.strip():
             self.player_name = "player1"
         self.game_view.set_player_name(self.player_name.strip())
-        self.game_view.setup()
-        self.window.show_view(self.game_view)
+        self.window.show_view(LoadingView(self.game_view))
 
     def on_update(self, delta_time):
         self.cursor_timer += delta_time
         if self.cursor_timer >= 0.5:
             self.cursor_visible = not self.cursor_visible
             self.cursor_timer = 0.0
+            self.refresh_name()
+
+
+class LoadingView(arcade.View):
+    # Экран загрузки: шаги MyGame.load() идут кусками по кадрам, окно рисуется и отвечает на ввод
+    def __init__(self, game_view):
+        super().__init__()
+        self.game_view = game_view
+        from loading import Loader
+        self.loader = Loader(game_view.load())
+        self.texts = TextBatch()
+        self.texts.add("title", "ЗАГРУЗКА", screen_width / 2, screen_height / 2 + 60,
+                       arcade.color.WHITE, 36, anchor_x="center", bold=True)
+        self.texts.add("label", "", screen_width / 2, screen_height / 2 - 50,
+                       arcade.color.LIGHT_GRAY, 16, anchor_x="center")
+
+    def on_update(self, delta_time):
+        if self.loader.advance():
+            self.window.show_view(self.game_view)
+            return
+        self.texts.set("label", (self.loader.label, int(self.loader.progress * 100)), "{0[0]}… {0[1]}%")
+
+    def on_draw(self):
+        self.clear(arcade.color.BLACK)
+        left, right = screen_width / 2 - 200, screen_width / 2 + 200
+        bottom, top = screen_height / 2 - 15, screen_height / 2 + 15
+        arcade.draw_lrbt_rectangle_filled(left, left + (right - left) * self.loader.progress, bottom, top,
+                                          arcade.color.LIME_GREEN)
+        arcade.draw_lrbt_rectangle_outline(left, right, bottom, top, arcade.color.WHITE, 2)
+        self.texts.draw()
 
 
 class MyGame(arcade.View):
-    def __init__(self):
+    def __init__(self, stats_db=STATS_DB, replay_dir=replay.replay_dir, telemetry_dir=None):
         super().__init__()
         self.player_name = "player1"
         self.stats = {"deaths": 0, "fruits_collected": 0}
-        self.fruit_sound = None
+        self.stats_store = StatsStore(stats_db, csv_path=STATS_FILE)
+        self.stats_writer = StatsWriter(self.stats_store)
+        # Пул голосов создаётся в первом setup() и живёт между перезапусками уровня
+        self.audio = None
+        # Запись прогонов (replay.py): текущий прогон пишется с setup() до финиша или выхода в меню
+        self.replay_dir = replay_dir
+        self.recorder = None
+        # Телеметрия (telemetry.py): по умолчанию — в папку telemetry/ рядом с игрой
+        self.telemetry_dir = telemetry_dir
+        self.telemetry = None
+        self.spike_hit = -1  # клетка шипа, о который игрок погиб
+        # Профилировщик живёт между перезапусками уровня, включается F3; создаётся в первом setup()
+        self.profiler = None
 
     def set_player_name(self, name):
         self.player_name = name or "player1"
@@ -263,461 +318,481 @@ class MyGame(arcade.View):
 
     def load_stats(self):
         self.stats = {"deaths": 0, "fruits_collected": 0}
-        if os.path.exists(STATS_FILE):
-            try:
-                with open(STATS_FILE, 'r', encoding='utf-8') as f:
-                    for row in csv.DictReader(f):
-                        if row.get("player_name", "").strip() == self.player_name:
-                            self.stats["deaths"] = int(row.get("deaths", 0))
-                            self.stats["fruits_collected"] = int(row.get("fruits_collected", 0))
-                            break
-            except:
-                pass
+        # Несброшенные обновления новее базы
+        row = self.stats_writer.pending_row(self.player_name) or self.stats_store.get(self.player_name)
+        if row:
+            self.stats["deaths"] = row["deaths"]
+            self.stats["fruits_collected"] = row["fruits_collected"]
         else:
             self.save_stats()
 
     def save_stats(self):
-        all_players = []
-        if os.path.exists(STATS_FILE):
-            try:
-                with open(STATS_FILE, 'r', encoding='utf-8') as f:
-                    all_players = [r for r in csv.DictReader(f) if r.get("player_name", "").strip()]
-            except:
-                pass
-        for row in all_players:
-            if row["player_name"] == self.player_name:
-                row["deaths"] = str(self.stats["deaths"])
-                row["fruits_collected"] = str(self.stats["fruits_collected"])
+        # Только буфер в памяти: в базу пишет фоновый поток StatsWriter
+        self.stats_writer.update(self.player_name, self.stats)
+
+    def on_hide_view(self):
+        self.stats_writer.flush()
+        self.save_run()
+        if self.telemetry is not None:
+            self.telemetry.flush()
+
+    def save_run(self):
+        if self.recorder is not None:
+            replay.save_run(self.recorder, self.replay_dir)
+            self.recorder = None
+
+    def close_telemetry(self):
+        if self.telemetry is not None:
+            self.telemetry.close()
+            self.telemetry = None
+
+    def close_audio(self):
+        if self.audio is not None:
+            self.audio.close()
+            self.audio = None
+
+    def start_views(self):
+        # Что должно быть загружено к первому кадру: окрестности точки появления и стартовой камеры
+        import chunks
+        camera = Camera2D()
+        camera.zoom = world_zoom
+        return [(spawn_x, spawn_x, spawn_y, spawn_y), chunks.camera_view(camera)]
+
+    def load(self):
+        # Шаги для LoadingView: разбор и декодирование в фоне, загрузка в GPU — кусками на основном потоке.
+        # Всё попадает в кэш ресурсов, и setup() в конце берёт готовое.
+        from loading import background
+        yield 0.0, "модули"
+        yield from background(import_game_modules)
+        import assets, chunks, map_bundle
+        from level import default_map_path
+        yield 0.1, "персонаж"
+        walk_image = yield from background(assets.decode_image, RUN_SHEET[0])
+        climb_image = yield from background(assets.decode_image, CLIMB_SHEET[0])
+        yield 0.2, "карта"
+        map_path = default_map_path(project_root)
+        level = yield from background(map_bundle.load_map, map_path)
+        # Статические слои — из собранного атласа одной текстурой, по текстуре — только фрукты и шипы
+        yield from background(assets.load_tile_atlas, map_path)
+        tileset_images = yield from background(chunks.decode_tilesets, level)
+        yield 0.4, "звук"
+        for path, _, _ in SOUNDS.values():
+            yield from background(assets.load_sound, path)
+
+        # Текстуры и записи кэшей arcade — только на основном потоке, из декодированных в фоне картинок
+        walk = assets.load_frames(*RUN_SHEET, image=walk_image)
+        climb = assets.load_frames(*CLIMB_SHEET, image=climb_image)
+        yield 0.45, "текстуры"
+        chunks.cache_images(tileset_images)
+        tiles = chunks.level_textures(level)
+        yield 0.5, "текстуры"
+
+        # В атлас по текстуре за шаг: кадр не ждёт загрузки всех тайлов сразу
+        textures = [texture for frames in walk + climb for texture in frames] + tiles
+        atlas = self.window.ctx.default_atlas
+        for i, texture in enumerate(textures):
+            atlas.add(texture)
+            yield 0.5 + 0.1 * (i + 1) / len(textures), "текстуры"
+
+        streamer = assets.load_level_streamer(map_path, scaling=map_scaling)
+        yield 0.6, "чанки"
+        views = self.start_views()
+        total = None
+        while True:
+            left = streamer.preload(views)
+            total = total or left
+            if not left:
                 break
-        else:
-            all_players.append({
-                "player_name": self.player_name,
-                "deaths": str(self.stats["deaths"]),
-                "fruits_collected": str(self.stats["fruits_collected"])
-            })
-        try:
-            with open(STATS_FILE, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=["player_name", "deaths", "fruits_collected"])
-                writer.writeheader()
-                writer.writerows(all_players)
-        except:
-            pass
+            yield 0.6 + 0.35 * (1 - left / total), "чанки"
+            yield None
+        yield 0.95, "уровень"
+        self.setup()
 
     def setup(self):
-        project_root = Path(__file__).parent
-
-        # Загрузка текстур персонажа
-        walk_image = Image.open(project_root / "Run (32x32).png").convert("RGBA")
-        self.walk_textures_right = [
-            arcade.Texture(image=walk_image.crop((i * 32, 0, i * 32 + 32, 32)))
-            for i in range(4)
-        ]
-        self.walk_textures_left = [
-            arcade.Texture(image=ImageOps.mirror(tex.image))
-            for tex in self.walk_textures_right
-        ]
-
-        climb_image = Image.open(project_root / "Wall Jump (32x32).png").convert("RGBA")
-        self.climb_textures = [
-            arcade.Texture(image=climb_image.crop((i * 32, 0, i * 32 + 32, 32)))
-            for i in range(5)
-        ]
-        self.climb_textures_mirrored = [
-            arcade.Texture(image=ImageOps.mirror(tex.image))
-            for tex in self.climb_textures
-        ]
-
-        # Загрузка карты
-        map_path = project_root / "proj1.tmx"
-        if not map_path.exists():
-            map_path = project_root / "maps" / "proj1.tmx"
-
-        self.tile_map = arcade.load_tilemap(map_path, scaling=map_scaling)
-        self.scene = arcade.Scene.from_tilemap(self.tile_map)
-        self.walls = self.scene['Platforms']
-
-        # Слои карты
-        self.spikes = self.scene['idle'] if 'idle' in self.scene else arcade.SpriteList()
-        self.fruits = self.scene['fruits'] if 'fruits' in self.scene else arcade.SpriteList()
-
-        # Игрок
-        self.spawn_x = 6 * tile_size
-        self.spawn_y = 13 * tile_size + (32 * sprite_scale) / 2
+        import assets
+        import hot_reload
+        import telemetry
+        from level import default_map_path
+        from loading import executor
+        from particle_pool import Effect, ParticlePool
+        from profiler import FrameProfiler
+        if self.profiler is None:
+            self.profiler = FrameProfiler()
+
+        # Загрузка текстур персонажа (из кэша ресурсов после первого запуска или после load())
+        self.walk_textures_right, self.walk_textures_left = assets.load_frames(*RUN_SHEET)
+        self.climb_textures, self.climb_textures_mirrored = assets.load_frames(*CLIMB_SHEET)
+
+        # Загрузка карты: скомпилированный уровень через mmap, чанки вокруг камеры подгружает фоновый поток
+        self.streamer = assets.load_level_streamer(default_map_path(project_root), scaling=map_scaling)
+        self.level = self.streamer.level
+        # Сетка занятости на всю карту: O(1) проверки стен и земли, в том числе на стыках чанков
+        self.grid = self.level.build_grid("Platforms")
+        self.map_width = self.streamer.world_width
+        self.map_height = self.streamer.world_height
+        # Правки карты в Tiled подхватываются на ходу (hot_reload.py)
+        self.level_watcher = hot_reload.LevelWatcher(self.streamer, executor)
+
+        # Фрукты и шипы загруженных чанков; индексы по клеткам — проверяются только объекты под хитбоксом игрока
+        self.fruits = self.streamer.sprite_lists['fruits']
+        self.spike_index = self.streamer.indexes['idle']
+        self.fruit_index = self.streamer.indexes['fruits']
+
+        # Игрок: правила движения живут в PlayerSim, спрайт только отображает его состояние
+        self.sim = PlayerSim(self.grid, spawn_x, spawn_y)
+        self.sim.hazard_test = self.touches_spikes
         self.player = arcade.Sprite(self.walk_textures_right[0], scale=sprite_scale)
-        self.player.center_x = self.spawn_x
-        self.player.center_y = self.spawn_y
+        self.player.center_x = self.sim.x
+        self.player.center_y = self.sim.y
         self.player_spritelist = arcade.SpriteList()
+
+        # Прогон записывается с первого тика; лучший законченный прогон идёт рядом призраком
+        self.level_name = Path(self.level.path).stem
+        self.fruit_total = sum(1 for _ in self.level.tile_cells("fruits"))
+        self.save_run()
+        self.recorder = replay.Recorder(self.player_name, self.level_name)
+        best = replay.load_best(self.replay_dir, self.level_name)
+        self.ghost = replay.Ghost(best, self.grid, self.level.build_object_index("idle")) if best else None
+        # Телеметрия: сессия на игрока и карту, перезапуски уровня пишут в неё же
+        if self.telemetry is None or (self.telemetry.player, self.telemetry.level) != (self.player_name,
+                                                                                       self.level_name):
+            self.close_telemetry()
+            self.telemetry = telemetry.TelemetryLog(self.telemetry_dir or telemetry.telemetry_dir,
+                                                    self.player_name, self.level_name)
+        self.ghost_sprite = arcade.Sprite(self.walk_textures_right[0], scale=sprite_scale)
+        self.ghost_sprite.alpha = GHOST_ALPHA
+        self.ghost_previous = (spawn_x, spawn_y)
+        if self.ghost is not None:
+            self.ghost_sprite.position = self.ghost_previous = (self.ghost.sim.x, self.ghost.sim.y)
+            self.player_spritelist.append(self.ghost_sprite)
         self.player_spritelist.append(self.player)
 
         # Анимация
         self.walk_frame = self.climb_frame = 0
         self.animation_timer = 0.0
         self.animation_speed = 0.1
-        self.facing_right = True
-
-        # Управление
-        self.left = self.right = self.up = self.down = False
-        self.jump_pressed = self.dash_requested = self.climb_key = False
-
-        # Состояние
-        self.jump_buffer_timer = 0.0
-        self.time_since_ground = 999.0
-        self.jumps_left = max_jumps
-        self.dashes_left = max_dashes
-        self.dash_time_left = 0.0
-        self.dash_dx = self.dash_dy = 1.0
-        self.on_wall = False
-        self.wall_side = 0
-        self.stamina = max_stamina
-        self.is_dead = False
-        self.respawn_timer = 0.0
-        self.explosion_emitter = None
+
+        # Управление: маска зажатых клавиш, её читает симуляция, и клавиши, нажатые с прошлого тика:
+        # короткое нажатие, отпущенное до тика, симуляция всё равно видит один тик
+        self.input_mask = 0
+        self.pressed_mask = 0
 
         # Камеры
         self.world_camera = Camera2D()
-        self.world_camera.zoom = 4.8
+        self.world_camera.zoom = world_zoom
         self.gui_camera = Camera2D()
-
-        # Физика
-        self.engine = arcade.PhysicsEnginePlatformer(
-            player_sprite=self.player,
-            gravity_constant=gravity,
-            walls=self.walls
-        )
-        self.was_dashing = False
-
-        # Интерфейс
-        self.stamina_text = arcade.Text("стамина: 5.0 сек", 10, self.height - 30,
-                                        color=arcade.color.WHITE, font_size=16)
-        self.dash_text = arcade.Text("рывок: готов", 10, self.height - 55,
-                                     color=arcade.color.LIME_GREEN, font_size=16, bold=True)
-        self.player_name_text = arcade.Text(f"игрок: {self.player_name}", 10, self.height - 80,
-                                            color=arcade.color.CYAN, font_size=16, bold=True)
+        # Обычно уже подгружено под экраном загрузки; иначе (bench, перезапуск) — синхронно
+        for view in self.start_views():
+            self.streamer.load_now(view)
+
+        # Интерфейс: одна пачка надписей, обновляются только изменившиеся
+        self.hud = TextBatch()
+        self.hud.add("stamina", "стамина: 5.0 сек", 10, self.height - 30, arcade.color.WHITE, 16)
+        self.hud.add("dash", "рывок: готов", 10, self.height - 55, arcade.color.LIME_GREEN, 16, bold=True)
+        self.hud.add("player", f"игрок: {self.player_name}", 10, self.height - 80, arcade.color.CYAN, 16, bold=True)
+        # Сообщения о перезагрузке карты: видны status_seconds, в stdout игра не пишет
+        self.hud.add("status", "", 10, self.height - 105, arcade.color.YELLOW, 12)
+        self.status_time = 0.0
 
         # Частицы
-        self.trail_emitter = make_trail(self.player, maintain=38)
+        self.trail = ParticlePool(64, Effect(**TRAIL))
+        self.explosion = ParticlePool(128, Effect(**EXPLOSION))
         self.camera_offset_x = self.camera_offset_y = 0.0
 
-        # Звук
-        self.fruit_sound = arcade.load_sound(":resources:sounds/coin5.wav")
-
-    def respawn_player(self):
-        self.player.center_x = self.spawn_x
-        self.player.center_y = self.spawn_y
-        self.player.change_x = self.player.change_y = 0
-        self.left = self.right = self.up = self.down = self.jump_pressed = self.climb_key = False
-        self.stamina = max_stamina
-        self.dashes_left = max_dashes
-        self.jumps_left = max_jumps
-        self.is_dead = False
-        self.respawn_timer = 0.0
+        # Фиксированный шаг: накопленное время и состояние до последнего шага (игрок, камера)
+        self.sim_time = 0.0
+        self.camera_x, self.camera_y = self.world_camera.position
+        self.previous = (self.sim.x, self.sim.y, self.camera_x, self.camera_y)
+        self.alpha = 1.0
+
+        # Звук: декодирован один раз в кэше ресурсов, играет через пул голосов
+        if self.audio is None:
+            from audio import AudioManager
+            self.audio = AudioManager()
+            for name, (path, volume, voices) in SOUNDS.items():
+                self.audio.register(name, assets.load_sound(path), volume, voices)
+
+    def nearby_collisions(self, index):
+        # Кандидаты — по прямоугольнику симуляции с запасом (хитбокс спрайта зависит от кадра),
+        # точная проверка — по хитбоксам спрайтов, как раньше
+        sim = self.sim
+        margin = hazard_margin
+        candidates = index.query(sim.left - margin, sim.right + margin, sim.bottom - margin, sim.top + margin)
+        return [sprite for sprite in candidates if arcade.check_for_collision(self.player, sprite)]
+
+    def touches_spikes(self, sim):
+        spikes = self.nearby_collisions(self.spike_index)
+        if spikes:
+            _, col, row = self.streamer.cells[spikes[0]]
+            self.spike_hit = row * self.level.width + col
+        return bool(spikes)
 
     def collect_fruit(self):
-        for fruit in arcade.check_for_collision_with_list(self.player, self.fruits):
-            fruit.remove_from_sprite_lists()
+        for fruit in self.nearby_collisions(self.fruit_index):
+            _, col, row = self.streamer.cells[fruit]
+            self.telemetry.fruit(self.sim.x, self.sim.y, row * self.level.width + col)
+            self.streamer.remove(fruit)
             self.stats["fruits_collected"] += 1
             self.save_stats()
-            if self.fruit_sound:
-                arcade.play_sound(self.fruit_sound, 0.2)
+            self.audio.play("fruit")
+        if self.recorder is not None and len(self.streamer.collected) >= self.fruit_total:
+            # Все фрукты собраны: прогон закончен и сохраняется сразу
+            self.recorder.finish()
+            self.save_run()
 
     def on_draw(self):
+        profiler = self.profiler
+        profiler.start()
         self.clear(WORLD_COLOR)  # ← ПРИМЕНЕН ЦВЕТ ФОНА
         self.world_camera.use()
-        self.scene.draw()
+        self.streamer.draw()
+        profiler.mark("draw_world")
         self.player_spritelist.draw()
-        if not self.is_dead and (abs(self.player.change_x) > 0.1 or self.dash_time_left > 0 or
-                                 (self.on_wall and (self.up or self.down))):
-            self.trail_emitter.draw()
-        if self.explosion_emitter:
-            self.explosion_emitter.draw()
+        profiler.mark("draw_player")
+        if self.trail_visible():
+            self.trail.draw(self.alpha)
+        self.explosion.draw(self.alpha)
+        profiler.mark("draw_particles")
         self.gui_camera.use()
-        self.stamina_text.draw()
-        self.dash_text.draw()
-        self.player_name_text.draw()
-
-    def is_next_to_wall(self):
-        grounded = self.engine.can_jump(y_distance=2)
-        if grounded:
-            return False, 0
-
-        # Надёжная проверка: минимальный сдвиг (1.2 пикселя) для обнаружения стены
-        original_x = self.player.center_x
-
-        # Проверка слева
-        self.player.center_x = original_x - 1.2
-        hit_left = len(arcade.check_for_collision_with_list(self.player, self.walls)) > 0
-        self.player.center_x = original_x
-
-        # Проверка справа
-        self.player.center_x = original_x + 1.2
-        hit_right = len(arcade.check_for_collision_with_list(self.player, self.walls)) > 0
-        self.player.center_x = original_x
-
-        if hit_left:
-            return True, -1
-        elif hit_right:
-            return True, 1
-        return False, 0
-
-    def perform_dash(self):
-        if self.dashes_left <= 0 or self.is_dead:
-            return
+        self.hud.draw()
+        profiler.mark("draw_hud")
+        profiler.draw_overlay(self.width - 320, self.height - 20)
 
-        if self.on_wall:
-            dx, dy = (1.0, 0.35) if self.wall_side == -1 else (-1.0, 0.35)
-            self.stamina -= wall_dash_stamina_cost
-            self.stamina = max(0.0, self.stamina)
-        else:
-            # Умная логика направления рывка с приоритизацией чистых направлений
-            horizontal = 0
-            vertical = 0
-
-            # Приоритет 1: чисто вертикальные рывки (без горизонтали)
-            if self.up and not (self.left or self.right):
-                horizontal, vertical = 0, 1
-            elif self.down and not (self.left or self.right):
-                horizontal, vertical = 0, -1
-            # Приоритет 2: чисто горизонтальные рывки (без вертикали)
-            elif self.right and not (self.up or self.down):
-                horizontal, vertical = 1, 0
-            elif self.left and not (self.up or self.down):
-                horizontal, vertical = -1, 0
-            # Приоритет 3: диагонали или рывок без направления
-            else:
-                horizontal = (1 if self.right else -1 if self.left else (1 if self.facing_right else -1))
-                vertical = (1 if self.up else -1 if self.down else 0)
-
-            # Нормализация вектора
-            length = math.hypot(horizontal, vertical)
-            if length > 0:
-                dx = horizontal / length
-                dy = vertical / length
-            else:
-                dx, dy = 1.0 if self.facing_right else -1.0, 0.0
-
-        self.dash_dx, self.dash_dy = dx, dy
-        self.dash_time_left = dash_duration
-        self.dashes_left = 0
-        if self.on_wall:
-            self.on_wall = False
+    def trail_visible(self):
+        sim = self.sim
+        return not sim.is_dead and (abs(sim.change_x) > 0.1 or sim.dash_time_left > 0 or
+                                    (sim.on_wall and (sim.up_key or sim.down_key)))
 
     def on_update(self, delta_time):
-        if self.is_dead:
-            if self.explosion_emitter:
-                self.explosion_emitter.update()
-                if self.explosion_emitter.can_reap():
-                    self.explosion_emitter = None
-            self.respawn_timer += delta_time
-            if self.respawn_timer >= 0.8:
-                self.respawn_player()
-            return
+        profiler = self.profiler
+        profiler.begin_frame()
+        self.sim_time += delta_time
+        steps = 0
+        while self.sim_time >= sim_step:
+            if steps == max_sim_steps:
+                self.sim_time = 0.0
+                break
+            self.sim_time -= sim_step
+            self.fixed_update(sim_step)
+            steps += 1
+        # Звуки шагов этого кадра — одним проходом по пулу голосов
+        self.audio.update()
+        profiler.mark("audio")
+
+        # Отрисовка — между двумя последними шагами
+        self.alpha = self.sim_time / sim_step
+        self.interpolate(self.alpha)
+        profiler.mark("camera")
+
+        # Чанки: запросы по позиции камеры и приём готовых в пределах бюджета кадра
+        self.streamer.follow(self.world_camera)
+        update = self.level_watcher.poll(delta_time)
+        if update is not None:
+            self.reload_level(update)
+        elif self.level_watcher.error is not None:
+            self.show_status(f"карта не перезагружена: {self.level_watcher.error}", arcade.color.ORANGE)
+            self.level_watcher.error = None
+        elif self.status_time > 0:
+            self.status_time -= delta_time
+            if self.status_time <= 0:
+                self.hud.set("status", "")
+        profiler.mark("chunks")
+
+    def reload_level(self, update):
+        # Карта сохранена в Tiled: игрок и камера остаются, меняется только задетое правкой
+        import assets
+        started = time.perf_counter()
+        if update.full:
+            # Раскладка или тайлсеты поменялись: уровень собирается заново, текстуры тайлов — из файлов
+            state = self.sim.save_state()
+            camera = (self.camera_x, self.camera_y)
+            arcade.texture.default_texture_cache.flush()
+            assets.cache.invalidate(self.level.path)
+            self.recorder = None
+            self.setup()
+            self.sim.load_state(state)
+            self.camera_x, self.camera_y = camera
+            self.previous = (self.sim.x, self.sim.y) + camera
+            changed = "целиком"
+        else:
+            changes = update.changes
+            rebuilt = self.streamer.reload(update.level, changes, update.atlas)
+            self.level = update.level
+            walls = 0
+            if "Platforms" in changes:
+                walls = self.level.update_grid(self.grid, "Platforms", changes["Platforms"].tolist(),
+                                               self.streamer.overhang)
+            if "idle" in changes and self.ghost is not None:
+                self.level.update_object_index(self.ghost.hazards, "idle", changes["idle"].tolist())
+            self.fruit_total = sum(1 for _ in self.level.tile_cells("fruits"))
+            assets.refresh_level_streamer(self.level.path, scaling=map_scaling)
+            changed = (f"клеток {sum(len(cells) for cells in changes.values())} в слоях {', '.join(changes) or '—'}, "
+                       f"чанков {len(rebuilt)}, клеток сетки {walls}")
+        # Время прогона на изменённой карте не сравнить с лучшим: он больше не записывается
+        self.recorder = None
+        self.show_status(f"карта перезагружена: {changed}, {(time.perf_counter() - started) * 1000:.1f} мс")
+
+    def show_status(self, text, color=arcade.color.YELLOW):
+        self.hud.set("status", text, color=color)
+        self.status_time = status_seconds
+
+    def interpolate(self, alpha):
+        sim = self.sim
+        x, y, camera_x, camera_y = self.previous
+        self.player.center_x = x + (sim.x - x) * alpha
+        self.player.center_y = y + (sim.y - y) * alpha
+        if self.ghost is not None:
+            ghost_x, ghost_y = self.ghost_previous
+            self.ghost_sprite.position = (ghost_x + (self.ghost.sim.x - ghost_x) * alpha,
+                                          ghost_y + (self.ghost.sim.y - ghost_y) * alpha)
+        self.world_camera.position = (camera_x + (self.camera_x - camera_x) * alpha,
+                                      camera_y + (self.camera_y - camera_y) * alpha)
+        self.gui_camera.position = (self.width / 2, self.height / 2)
 
-        self.collect_fruit()
-        if arcade.check_for_collision_with_list(self.player, self.spikes):
-            self.is_dead = True
+    def fixed_update(self, delta_time):
+        profiler = self.profiler
+        sim = self.sim
+        # Столкновения — по состоянию симуляции, а не по интерполированному спрайту
+        self.player.center_x = sim.x
+        self.player.center_y = sim.y
+        self.previous = (sim.x, sim.y, self.camera_x, self.camera_y)
+        if not sim.is_dead:
+            self.collect_fruit()
+        profiler.mark("fruits")
+
+        mask = self.input_mask | self.pressed_mask
+        self.pressed_mask = 0
+        if self.recorder is not None:
+            self.recorder.record(sim, mask)
+        sim.step(mask, delta_time)
+        self.player.center_x = sim.x
+        self.player.center_y = sim.y
+        if self.ghost is not None:
+            self.update_ghost(delta_time)
+        profiler.mark("sim")
+        self.telemetry.record(sim, self.spike_hit)
+        for bit, name in EVENT_SOUNDS.items():
+            if sim.events & bit:
+                self.audio.play(name)
+        if sim.events & EV_DIED:
             self.stats["deaths"] += 1
             self.save_stats()
-            self.left = self.right = self.up = self.down = self.jump_pressed = self.climb_key = False
-            self.explosion_emitter = make_explosion(self.player.center_x, self.player.center_y)
+            self.explosion.emit(EXPLOSION_COUNT, sim.x, sim.y)
+        if sim.events & EV_RESPAWNED:
+            # Перенос на точку появления не размазывается интерполяцией
+            self.previous = (sim.x, sim.y) + self.previous[2:]
+        profiler.mark("events")
+        if sim.is_dead or sim.events & EV_RESPAWNED:
+            self.explosion.update(delta_time)
+            profiler.mark("particles")
             return
 
-        grounded = self.engine.can_jump(y_distance=6)
-        if grounded:
-            self.time_since_ground = 0
-            self.jumps_left = max_jumps
-            self.dashes_left = max_dashes
-            self.stamina = max_stamina
-            self.on_wall = False
-        else:
-            self.time_since_ground += delta_time
-
-        next_to_wall, side = self.is_next_to_wall()
-        if self.climb_key and next_to_wall and self.stamina > 0 and not grounded:
-            self.on_wall = True
-            self.wall_side = side
-
-            # Прижимаем игрока к стене для плавного лазания
-            if self.wall_side == -1:  # слева
-                for wall in arcade.check_for_collision_with_list(self.player, self.walls):
-                    if wall.right < self.player.center_x and wall.right > self.player.left - 5:
-                        self.player.left = wall.right + 0.5
-                        break
-            else:  # справа
-                for wall in arcade.check_for_collision_with_list(self.player, self.walls):
-                    if wall.left > self.player.center_x and wall.left < self.player.right + 5:
-                        self.player.right = wall.left - 0.5
-                        break
-        else:
-            if not self.climb_key or self.stamina <= 0 or not next_to_wall:
-                self.on_wall = False
-
-        if self.on_wall:
-            self.player.change_y = 0
-            if self.up:
-                self.player.center_y += climb_speed
-                self.stamina -= delta_time * 1.0
-            elif self.down:
-                self.player.center_y -= climb_speed
-                self.stamina -= delta_time * 0.7
-            else:
-                self.stamina -= delta_time * 0.4
-
-            # Коррекция позиции при коллизии сверху/снизу
-            collisions = arcade.check_for_collision_with_list(self.player, self.walls)
-            if collisions:
-                if self.up:
-                    while arcade.check_for_collision_with_list(self.player, self.walls) and self.player.center_y > 0:
-                        self.player.center_y -= 0.5
-                elif self.down:
-                    while arcade.check_for_collision_with_list(self.player, self.walls):
-                        self.player.center_y += 0.5
-            self.stamina = max(0.0, self.stamina)
-        elif grounded:
-            self.stamina = min(max_stamina, self.stamina + delta_time * 2.5)
-
-        if not (self.dash_time_left > 0 and self.on_wall):
-            self.player.change_x = -move_speed if (self.left and not self.right) else (
-                move_speed if (self.right and not self.left) else 0)
-        else:
-            self.player.change_x = 0
-
-        if self.jump_buffer_timer > 0:
-            self.jump_buffer_timer -= delta_time
-        if (self.jump_pressed or self.jump_buffer_timer > 0) and (grounded or self.time_since_ground <= coyote_time):
-            self.engine.jump(jump_speed)
-            self.jump_buffer_timer = 0
-
-        if self.dash_requested:
-            self.perform_dash()
-            self.dash_requested = False
-
-        if self.dash_time_left > 0:
-            self.dash_time_left -= delta_time
-            if self.dash_time_left < 0:
-                self.dash_time_left = 0
-            step = dash_speed * delta_time
-            orig_x, orig_y = self.player.center_x, self.player.center_y
-            self.player.center_x += self.dash_dx * step
-            self.player.center_y += self.dash_dy * step
-            if arcade.check_for_collision_with_list(self.player, self.walls):
-                self.player.center_x = orig_x
-                if arcade.check_for_collision_with_list(self.player, self.walls):
-                    self.player.center_y = orig_y
-                    if arcade.check_for_collision_with_list(self.player, self.walls):
-                        self.dash_time_left = 0
-
-        if self.dash_time_left <= 0 and self.was_dashing:
-            self.player.change_x = self.dash_dx * dash_post_impulse
-            self.player.change_y = self.dash_dy * dash_post_impulse
-        self.was_dashing = self.dash_time_left > 0
-
-        if not self.on_wall and self.dash_time_left <= 0:
-            self.engine.update()
-
         # Анимация
-        moving_horizontally = (self.left or self.right) and not self.on_wall and self.dash_time_left <= 0 and abs(
-            self.player.change_x) > 0.1
-        if self.on_wall and self.climb_textures:
+        moving_horizontally = (sim.left_key or sim.right_key) and not sim.on_wall and sim.dash_time_left <= 0 and abs(
+            sim.change_x) > 0.1
+        if sim.on_wall and self.climb_textures:
             self.animation_timer += delta_time
             if self.animation_timer >= self.animation_speed:
                 self.animation_timer = 0
                 self.climb_frame = (self.climb_frame + 1) % len(self.climb_textures)
-            self.player.texture = self.climb_textures_mirrored[self.climb_frame] if self.wall_side == -1 else \
+            self.player.texture = self.climb_textures_mirrored[self.climb_frame] if sim.wall_side == -1 else \
                 self.climb_textures[self.climb_frame]
         elif moving_horizontally:
             self.animation_timer += delta_time
             if self.animation_timer >= self.animation_speed:
                 self.animation_timer = 0
                 self.walk_frame = (self.walk_frame + 1) % len(self.walk_textures_right)
-            self.player.texture = self.walk_textures_right[self.walk_frame] if self.right else self.walk_textures_left[
+            self.player.texture = self.walk_textures_right[self.walk_frame] if sim.right_key else self.walk_textures_left[
                 self.walk_frame]
-            self.facing_right = self.right or (not self.left and self.facing_right)
         else:
             self.walk_frame = 0
-            self.player.texture = self.walk_textures_right[0] if self.facing_right else self.walk_textures_left[0]
+            self.player.texture = self.walk_textures_right[0] if sim.facing_right else self.walk_textures_left[0]
+        profiler.mark("animation")
 
         # Интерфейс — ИСПРАВЛЕНО: надпись зависит ТОЛЬКО от количества рывков
-        self.stamina_text.text = f"стамина: {self.stamina:.1f} сек"
-        if self.dashes_left > 0 and not self.is_dead:
-            self.dash_text.text = "рывок: готов"
-            self.dash_text.color = arcade.color.LIME_GREEN
+        # Стамина показывается с точностью 0.1: надпись меняется раз в несколько кадров, а не каждый
+        self.hud.set("stamina", round(sim.stamina, 1), "стамина: {:.1f} сек")
+        if sim.dashes_left > 0 and not sim.is_dead:
+            self.hud.set("dash", "рывок: готов", color=arcade.color.LIME_GREEN)
         else:
-            self.dash_text.text = "рывок: недоступен"
-            self.dash_text.color = arcade.color.DARK_RED
-        self.player_name_text.text = f"игрок: {self.player_name}"
+            self.hud.set("dash", "рывок: недоступен", color=arcade.color.DARK_RED)
+        profiler.mark("hud")
 
-        # Камера
-        target_offset_x = self.player.change_x * 0.15
-        target_offset_y = self.player.change_y * 0.12
+        # Камера: сглаживание — тоже за шаг, на экране позиция интерполируется
+        target_offset_x = sim.change_x * 0.15
+        target_offset_y = sim.change_y * 0.12
         self.camera_offset_x += (target_offset_x - self.camera_offset_x) * 0.35
         self.camera_offset_y += (target_offset_y - self.camera_offset_y) * 0.35
-        target_x = self.player.center_x - self.camera_offset_x
-        target_y = self.player.center_y - self.camera_offset_y
-        cx, cy = self.world_camera.position
-        smooth_x = cx + (target_x - cx) * camera_lerp
-        smooth_y = cy + (target_y - cy) * camera_lerp
-        map_width = 800 * map_scaling
-        map_height = 800 * map_scaling
+        target_x = sim.x - self.camera_offset_x
+        target_y = sim.y - self.camera_offset_y
+        smooth_x = self.camera_x + (target_x - self.camera_x) * camera_lerp
+        smooth_y = self.camera_y + (target_y - self.camera_y) * camera_lerp
         half_w = self.width / (2 * self.world_camera.zoom)
         half_h = self.height / (2 * self.world_camera.zoom)
-        cam_x = max(half_w, min(map_width - half_w, smooth_x))
-        cam_y = max(half_h, min(map_height - half_h, smooth_y))
-        self.world_camera.position = (cam_x, cam_y)
-        self.gui_camera.position = (self.width / 2, self.height / 2)
-
-        # Частицы
-        self.trail_emitter.center_x = self.player.center_x
-        self.trail_emitter.center_y = self.player.center_y - self.player.height * 0.48
-        self.trail_emitter.update()
+        self.camera_x = max(half_w, min(self.map_width - half_w, smooth_x))
+        self.camera_y = max(half_h, min(self.map_height - half_h, smooth_y))
+        profiler.mark("camera")
+
+        # Частицы: след пополняется, только пока его видно
+        if self.trail_visible():
+            self.trail.emit(TRAIL_COUNT - self.trail.count, sim.x, sim.y - self.player.height * 0.48)
+        self.trail.update(delta_time)
+        self.explosion.update(delta_time)
+        profiler.mark("particles")
+
+    def update_ghost(self, delta_time):
+        ghost = self.ghost
+        if ghost.done:
+            self.ghost_sprite.visible = False
+            return
+        self.ghost_previous = (ghost.sim.x, ghost.sim.y)
+        ghost.step(delta_time)
+        sim = ghost.sim
+        if sim.events & EV_RESPAWNED:
+            self.ghost_previous = (sim.x, sim.y)
+        # Кадр призрака — только по направлению, без своей анимации
+        if sim.on_wall:
+            self.ghost_sprite.texture = self.climb_textures_mirrored[0] if sim.wall_side == -1 else \
+                self.climb_textures[0]
+        else:
+            self.ghost_sprite.texture = self.walk_textures_right[0] if sim.facing_right else \
+                self.walk_textures_left[0]
+        self.ghost_sprite.visible = not sim.is_dead
 
     def on_key_press(self, key, modifiers):
-        if self.is_dead:
-            return
-        if key in (arcade.key.LEFT, arcade.key.A):
-            self.left = True
-        elif key in (arcade.key.RIGHT, arcade.key.D):
-            self.right = True
-        elif key in (arcade.key.UP, arcade.key.W):
-            self.up = True
-        elif key in (arcade.key.DOWN, arcade.key.S):
-            self.down = True
-        elif key == arcade.key.SPACE:
-            self.jump_pressed = True
-            self.jump_buffer_timer = jump_buffer
-        elif key == arcade.key.X:
-            self.dash_requested = True
-        elif key == arcade.key.C:
-            self.climb_key = True
-        elif key == arcade.key.ESCAPE:
+        # Маска ведётся всегда: симуляция сама игнорирует клавиши, зажатые во время смерти
+        self.input_mask |= KEY_BITS.get(key, 0)
+        self.pressed_mask |= KEY_BITS.get(key, 0)
+        if key == arcade.key.F3:
+            self.profiler.toggle()
+        elif key == arcade.key.F4:
+            self.profiler.dump_csv()
+        if key == arcade.key.ESCAPE and not self.sim.is_dead:
             menu_view = MainMenu(self)
             menu_view.player_name = self.player_name
             self.window.show_view(menu_view)
 
     def on_key_release(self, key, modifiers):
-        if self.is_dead:
-            return
-        if key in (arcade.key.LEFT, arcade.key.A):
-            self.left = False
-        elif key in (arcade.key.RIGHT, arcade.key.D):
-            self.right = False
-        elif key in (arcade.key.UP, arcade.key.W):
-            self.up = False
-        elif key in (arcade.key.DOWN, arcade.key.S):
-            self.down = False
-        elif key == arcade.key.SPACE:
-            self.jump_pressed = False
-            if self.player.change_y > 0:
-                self.player.change_y *= 0.45
-        elif key == arcade.key.C:
-            self.climb_key = False
+        self.input_mask &= ~KEY_BITS.get(key, 0)
 
 
 def main():
-    window = arcade.Window(screen_width, screen_height, screen_title)
+    window = arcade.Window(screen_width, screen_height, screen_title,
+                           update_rate=1 / display_rate, draw_rate=1 / display_rate)
+    startup.mark("window")
     game_view = MyGame()
+    startup.mark("stats")
     menu_view = MainMenu(game_view)
+    startup.mark("menu")
     window.show_view(menu_view)
-    arcade.run()
+    try:
+        arcade.run()
+    finally:
+        game_view.save_run()
+        game_view.close_telemetry()
+        game_view.close_audio()
+        game_view.stats_writer.close()
+        game_view.stats_store.close()
 
 
 if __name__ == "__main__":
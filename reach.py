@@ -0,0 +1,392 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from array import array
+
+from batch import World
+from level import default_map_path
+from simulation import (PlayerSim, EV_DIED, IN_LEFT, IN_RIGHT, IN_UP, IN_DOWN, IN_JUMP, IN_DASH, IN_CLIMB,
+                        coyote_time, spawn_x, spawn_y, tile_size, sim_rate)
+
+# Анализ достижимости уровня: поиск в ширину по состояниям игрока вместо случайных прогонов.
+#
+#   python reach.py                          — сводка и карта достижимости в терминале
+#   python reach.py --png reach.png --json reach.json
+#
+# Ход из состояния — одна клавишная комбинация, удерживаемая macro_ticks тиков; правила — сам PlayerSim.
+# Состояние огрубляется до ключа: клетка позиции (key_cell — полторы клетки карты: в полтора раза
+# меньше состояний при той же карте достижимости, тепло всё равно считается по клеткам TMX), корзина вертикальной скорости, рывки, стамина, стена,
+# идёт ли рывок и зажат ли рывок (нажатие срабатывает по фронту). Горизонтальной скорости в ключе нет:
+# PlayerSim каждый тик задаёт её заново по клавишам, на будущее она не влияет. Ключ упакован в одно целое;
+# таблица уже виденных ключей (set) отсекает повторы и состояния, для которых уже видено такое же, но
+# с рывком, большей стаминой или отпущенным рывком. Рывок задаёт скорость сам, поэтому из состояний,
+# отличающихся только скоростью, рывки симулируются один раз — из первого такого состояния.
+# Таблица ограничена max_states: при переполнении новые состояния не добавляются, отчёт помечается
+# как неполный и показывает, сколько состояний отброшено; непосещённые клетки тогда — «не исследовано»,
+# а не «недостижимо». Полный поиск по proj1 — около 5 тыс. состояний, несколько секунд на одном ядре.
+# Слой поиска раскрывается на всех ядрах, как в batch.py.
+#
+# Карта тепла — сколько тиков поиска прошло с центром игрока в каждой клетке TMX.
+
+macro_ticks = 8
+key_cell = tile_size * 1.5
+max_states = 50_000
+
+DASH_DIRECTIONS = (IN_LEFT, IN_RIGHT, IN_UP, IN_DOWN, IN_UP | IN_LEFT, IN_UP | IN_RIGHT,
+                   IN_DOWN | IN_LEFT, IN_DOWN | IN_RIGHT)
+MOVES = (0, IN_LEFT, IN_RIGHT, IN_JUMP, IN_JUMP | IN_LEFT, IN_JUMP | IN_RIGHT)
+DASHES = tuple(IN_DASH | direction for direction in DASH_DIRECTIONS)
+CLIMBS = (IN_CLIMB, IN_CLIMB | IN_UP, IN_CLIMB | IN_DOWN)
+
+# Поля ключа, по которым одно состояние заведомо не хуже другого
+HELD_DASH_BIT = 1
+STAMINA_SHIFT = 3
+STAMINA_MASK = 0b111 << STAMINA_SHIFT
+DASH_BIT = 1 << 6
+# Корзина скорости в ключе: от неё не зависит, куда приведёт рывок
+VELOCITY_BITS = 0b1111 << 7
+
+
+def state_key(sim, cell):
+    # Огрублённое состояние, упакованное в целое: col 12 бит, row 12, скорость 4, остальное по биту-три
+    vy = min(5, max(-6, int(sim.change_y // 2)))
+    key = int(sim.x // cell) & 0xFFF
+    key = key << 12 | int(sim.y // cell) & 0xFFF
+    key = key << 4 | vy + 8
+    key = key << 1 | (sim.dashes_left > 0)
+    key = key << 3 | int(sim.stamina)
+    key = key << 1 | sim.on_wall
+    key = key << 1 | (sim.dash_time_left > 0)
+    return key << 1 | bool(sim.held & IN_DASH)
+
+
+def actions(sim, dash=True):
+    # Прыжок — только когда он сработает (земля, койот-время) или когда отпускание срежет подъём;
+    # рывки — только с запасом рывка и не при зажатом рывке (срабатывает по фронту; от стены направление
+    # не выбирается) и если их не раскрыли из того же состояния с другой скоростью; лазание — только у стены
+    if sim.time_since_ground <= coyote_time or sim.held & IN_JUMP:
+        result = MOVES
+    else:
+        result = MOVES[:3]
+    if dash and sim.dashes_left > 0 and sim.dash_time_left <= 0 and not sim.held & IN_DASH:
+        result += DASHES[:1] if sim.on_wall else DASHES
+    if sim.on_wall or sim.wall_contact()[0]:
+        result += CLIMBS
+    return result
+
+
+# Уровень и симуляция создаются один раз на процесс
+_world = None
+_sim = None
+_settings = None
+_near_fruits = None
+
+
+def near_cells(index, grid, hitbox):
+    # Клетки сетки, в которых центр игрока может задеть объект индекса: прямоугольник объекта,
+    # расширенный на хитбокс. Вне их запрос к индексу заведомо пуст и не делается
+    size, width, height = grid.cell_size, grid.width, grid.height
+    near = bytearray(width * height)
+    for left, right, bottom, top in index.bounds.values():
+        col0, col1 = max(0, int((left - hitbox[1]) // size)), min(width - 1, int((right - hitbox[0]) // size))
+        row0, row1 = max(0, int((bottom - hitbox[3]) // size)), min(height - 1, int((top - hitbox[2]) // size))
+        for row in range(row0, row1 + 1):
+            near[row * width + col0:row * width + col1 + 1] = b"\1" * (col1 - col0 + 1)
+    return near
+
+
+def init_worker(map_path, macro_ticks, cell):
+    global _world, _sim, _settings, _near_fruits
+    _world = World(map_path)
+    _sim = PlayerSim(_world.grid, spawn_x, spawn_y)
+    grid = _world.grid
+    hazards = _world.hazards
+    near_hazards = near_cells(hazards, grid, _sim.hitbox)
+    size, width, height = grid.cell_size, grid.width, grid.height
+
+    def hazard_test(player):
+        col, row = int(player.x // size), int(player.y // size)
+        if 0 <= col < width and 0 <= row < height and not near_hazards[row * width + col]:
+            return False
+        return bool(hazards.query(player.left, player.right, player.bottom, player.top))
+
+    _sim.hazard_test = hazard_test
+    _near_fruits = near_cells(_world.fruits, grid, _sim.hitbox)
+    _settings = (macro_ticks, cell)
+
+
+def expand(states):
+    # Все ходы из пачки (состояние, раскрывать ли рывки): выжившие преемники с ключами и тепло/смерти/фрукты по пути
+    world, sim, near_fruits = _world, _sim, _near_fruits
+    macro_ticks, cell = _settings
+    width, height = world.level.width, world.level.height
+    cell_size = world.grid.cell_size
+    dt = 1 / sim_rate
+    heat = array("I", bytes(4 * width * height))
+    deaths = array("I", bytes(4 * width * height))
+    fruits = set()
+    successors = []
+    ticks = 0
+    for state, dash in states:
+        sim.load_state(state)
+        for mask in actions(sim, dash):
+            sim.load_state(state)
+            alive = True
+            for _ in range(macro_ticks):
+                sim.step(mask, dt)
+                ticks += 1
+                col, row = int(sim.x // cell_size), int(sim.y // cell_size)
+                inside = 0 <= col < width and 0 <= row < height
+                if sim.events & EV_DIED or not inside:
+                    # Мир по Y растёт вверх, строки TMX — сверху
+                    if inside:
+                        deaths[(height - 1 - row) * width + col] += 1
+                    alive = False
+                    break
+                heat[(height - 1 - row) * width + col] += 1
+                if near_fruits[row * width + col]:
+                    fruits.update(world.fruits.query(sim.left, sim.right, sim.bottom, sim.top))
+            if alive:
+                successors.append((state_key(sim, cell), sim.save_state()))
+    return successors, heat, deaths, fruits, ticks
+
+
+def dominated(key, seen):
+    # Уже видено то же состояние с рывком, не меньшей стаминой или отпущенным рывком — это ничем не лучше
+    # (с отпущенным рывком можно и не нажимать его, а зажатый нажать нельзя)
+    base = key & ~(DASH_BIT | STAMINA_MASK | HELD_DASH_BIT)
+    stamina = (key & STAMINA_MASK) >> STAMINA_SHIFT
+    for have_dash in ((0, DASH_BIT) if not key & DASH_BIT else (DASH_BIT,)):
+        for held in ((0, HELD_DASH_BIT) if key & HELD_DASH_BIT else (0,)):
+            for better in range(stamina, 8):
+                other = base | have_dash | held | better << STAMINA_SHIFT
+                if other != key and other in seen:
+                    return True
+    return False
+
+
+def analyze(map_path, max_states=max_states, macro_ticks=macro_ticks, cell=key_cell, workers=None):
+    workers = workers or os.cpu_count() or 1
+    init_worker(map_path, macro_ticks, cell)
+    level = _world.level
+    heat = array("I", bytes(4 * level.width * level.height))
+    deaths = array("I", bytes(4 * level.width * level.height))
+    fruits = set()
+    key = state_key(_sim, cell)
+    seen = {key}
+    dashed = {key & ~VELOCITY_BITS}
+    frontier = [(_sim.save_state(), True)]
+    dropped = 0
+    expanded = ticks = layers = 0
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(map_path, macro_ticks, cell))
+    started = time.perf_counter()
+    try:
+        # Поиск в ширину слоями: слой делится на пачки для процессов, повторы отсекаются здесь
+        while frontier:
+            layers += 1
+            expanded += len(frontier)
+            size = max(1, len(frontier) // (workers * 4))
+            batches = [frontier[i:i + size] for i in range(0, len(frontier), size)]
+            results = pool.imap(expand, batches) if pool else map(expand, batches)
+            frontier = []
+            for successors, part_heat, part_deaths, part_fruits, part_ticks in results:
+                for i, value in enumerate(part_heat):
+                    if value:
+                        heat[i] += value
+                for i, value in enumerate(part_deaths):
+                    if value:
+                        deaths[i] += value
+                fruits |= part_fruits
+                ticks += part_ticks
+                for key, state in successors:
+                    if key in seen or dominated(key, seen):
+                        continue
+                    if len(seen) >= max_states:
+                        dropped += 1
+                        continue
+                    seen.add(key)
+                    signature = key & ~VELOCITY_BITS
+                    dash = signature not in dashed
+                    if dash:
+                        dashed.add(signature)
+                    frontier.append((state, dash))
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return {
+        "states": len(seen),
+        "expanded": expanded,
+        "layers": layers,
+        "ticks": ticks,
+        "elapsed": time.perf_counter() - started,
+        "workers": workers,
+        "truncated": dropped > 0,
+        "dropped": dropped,
+        "heat": heat,
+        "deaths": deaths,
+        "fruits": fruits,
+    }
+
+
+def open_cells(world):
+    # Клетки TMX (col, row_сверху), где может оказаться центр игрока: не стена и не шип
+    level = world.level
+    hazards = {cell for cell in world.hazards.bounds}
+    cells = set()
+    for row in range(level.height):
+        for col in range(level.width):
+            if not world.grid.is_solid(col, level.height - 1 - row) and (col, row) not in hazards:
+                cells.add((col, row))
+    return cells
+
+
+def unreached_regions(world, heat):
+    # Связные (по 4 соседям) области свободных клеток, где поиск не побывал ни разу
+    # (при неполном поиске — не исследованные)
+    width = world.level.width
+    unreached = {(col, row) for col, row in open_cells(world) if not heat[row * width + col]}
+    regions = []
+    while unreached:
+        start = unreached.pop()
+        region = [start]
+        stack = [start]
+        while stack:
+            col, row = stack.pop()
+            for neighbour in ((col + 1, row), (col - 1, row), (col, row + 1), (col, row - 1)):
+                if neighbour in unreached:
+                    unreached.remove(neighbour)
+                    region.append(neighbour)
+                    stack.append(neighbour)
+        regions.append(region)
+    regions.sort(key=len, reverse=True)
+    return regions
+
+
+def heat_map(world, result):
+    # Строки TMX сверху вниз: # стена, ^ шип, F/f фрукт достигнут/нет, цифра — log2 тиков, пробел — не был;
+    # если поиск неполный, непосещённая клетка — «?»: она не исследована, а не недостижима
+    level = world.level
+    heat = result["heat"]
+    hazards = set(world.hazards.bounds)
+    fruit_cells = {(col, row) for col, row, _ in level.tile_cells("fruits")}
+    unvisited = "?" if result["truncated"] else " "
+    lines = []
+    for row in range(level.height):
+        line = []
+        for col in range(level.width):
+            count = heat[row * level.width + col]
+            if (col, row) in fruit_cells:
+                line.append("F" if (col, row) in result["fruits"] else "f")
+            elif world.grid.is_solid(col, level.height - 1 - row):
+                line.append("#")
+            elif (col, row) in hazards:
+                line.append("^")
+            elif count:
+                line.append(str(min(9, count.bit_length())))
+            else:
+                line.append(unvisited)
+        lines.append("".join(line))
+    return lines
+
+
+def save_png(world, result, path, scale=8):
+    from PIL import Image
+
+    level = world.level
+    heat = result["heat"]
+    peak = max(heat) or 1
+    image = Image.new("RGB", (level.width, level.height))
+    pixels = image.load()
+    hazards = set(world.hazards.bounds)
+    for row in range(level.height):
+        for col in range(level.width):
+            count = heat[row * level.width + col]
+            if world.grid.is_solid(col, level.height - 1 - row):
+                color = (70, 70, 80)
+            elif (col, row) in hazards:
+                color = (160, 160, 170)
+            elif count:
+                # От тёмно-синего к жёлтому по логарифму числа тиков
+                t = count.bit_length() / peak.bit_length()
+                color = (int(255 * t), int(80 + 150 * t), int(160 * (1 - t)))
+            else:
+                # Недостижимо — красным; при неполном поиске — серо-синим «не исследовано»
+                color = (70, 70, 120) if result["truncated"] else (120, 0, 0)
+            pixels[col, row] = color
+    for col, row, _ in level.tile_cells("fruits"):
+        pixels[col, row] = (0, 255, 0) if (col, row) in result["fruits"] else (255, 0, 255)
+    image.resize((level.width * scale, level.height * scale), Image.NEAREST).save(path)
+
+
+def print_report(world, result, regions, show_map=True):
+    level = world.level
+    flag = ""
+    if result["truncated"]:
+        flag = f" (таблица переполнена — результат неполный, отброшено состояний: {result['dropped']:,})"
+    print(f"состояний: {result['states']:,}, слоёв: {result['layers']}, тиков: {result['ticks']:,}, "
+          f"{result['elapsed']:.2f} с на {result['workers']} процессах{flag}")
+    fruit_cells = [(col, row) for col, row, _ in level.tile_cells("fruits")]
+    print(f"фрукты: достижимо {len(result['fruits'] & set(fruit_cells))} из {len(fruit_cells)}")
+    missing = "не найден (поиск неполный)" if result["truncated"] else "НЕТ"
+    for cell in fruit_cells:
+        print(f"  фрукт {cell}: {'да' if cell in result['fruits'] else missing}")
+    title = "не исследовано (поиск неполный)" if result["truncated"] else "недостижимые области"
+    print(f"{title}: {len(regions)}, клеток {sum(len(region) for region in regions)}")
+    for region in regions[:10]:
+        cols = [col for col, _ in region]
+        rows = [row for _, row in region]
+        print(f"  {len(region)} клеток, col {min(cols)}–{max(cols)}, row {min(rows)}–{max(rows)}")
+    if show_map:
+        for line in heat_map(world, result):
+            print(line)
+
+
+def report_json(world, result, regions):
+    return {
+        "states": result["states"],
+        "expanded": result["expanded"],
+        "layers": result["layers"],
+        "ticks": result["ticks"],
+        "elapsed": result["elapsed"],
+        "truncated": result["truncated"],
+        "dropped": result["dropped"],
+        "fruits": {f"{col},{row}": (col, row) in result["fruits"] for col, row, _ in world.level.tile_cells("fruits")},
+        # Непосещённые области: при неполном поиске они не исследованы, а не недостижимы
+        "unreached_regions": [] if result["truncated"] else [sorted(region) for region in regions],
+        "unexplored_regions": [sorted(region) for region in regions] if result["truncated"] else [],
+        # Тики поиска по клеткам TMX, строки сверху вниз
+        "heat": [list(result["heat"][row * world.level.width:(row + 1) * world.level.width])
+                 for row in range(world.level.height)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Достижимость фруктов и областей уровня поиском по состояниям")
+    parser.add_argument("--map", default=str(default_map_path()), help="путь к TMX")
+    parser.add_argument("--max-states", type=int, default=max_states, help="предел таблицы состояний")
+    parser.add_argument("--macro-ticks", type=int, default=macro_ticks, help="тиков на один ход")
+    parser.add_argument("--cell", type=float, default=key_cell, help="шаг сетки позиции в ключе состояния")
+    parser.add_argument("--workers", type=int, help="процессов (по умолчанию — все ядра)")
+    parser.add_argument("--no-map", action="store_true", help="не печатать карту")
+    parser.add_argument("--png", help="сохранить карту тепла в PNG")
+    parser.add_argument("--json", help="сохранить отчёт в JSON")
+    args = parser.parse_args()
+
+    world = World(args.map)
+    result = analyze(args.map, args.max_states, args.macro_ticks, args.cell, args.workers)
+    regions = unreached_regions(world, result["heat"])
+    print_report(world, result, regions, not args.no_map)
+    if args.png:
+        save_png(world, result, args.png)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report_json(world, result, regions), f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
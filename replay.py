@@ -0,0 +1,271 @@
+import os
+import struct
+import sys
+import time
+from pathlib import Path
+
+from simulation import PlayerSim, EV_DIED, sim_rate, spawn_x, spawn_y
+
+# Запись прогонов и призрак лучшего из них.
+#
+# Прогон — маска ввода на каждый тик симуляции (биты IN_* из simulation.py) и снимки состояния
+# игрока каждые keyframe_ticks тиков. Маски хранятся сериями «сколько тиков подряд — какая маска»:
+# ввод меняется несколько раз в секунду, поэтому минута игры — сотни байт. Снимки дают перемотку
+# в любую точку за O(1): загрузить ближайший снимок и досчитать меньше keyframe_ticks тиков,
+# а при воспроизведении они же гасят расхождение с записью.
+#
+# Формат файла (little-endian):
+#   заголовок  magic "QRPL", версия, тиков между снимками, тиков всего, тик финиша (0xFFFFFFFF — нет),
+#              время записи, длина имени игрока и длина имени карты, затем сами имена (UTF-8)
+#   серии      число серий, затем на серию: длина varint (LEB128) и маска байтом
+#   снимки     число снимков, затем снимки подряд (KEYFRAME)
+#
+#   python replay.py replays/best-proj1.rpl   — сводка и проверка воспроизведения по снимкам
+
+MAGIC = b"QRPL"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIIdHH")
+COUNT = struct.Struct("<I")
+# Поля — в порядке simulation.STATE_FIELDS
+KEYFRAME = struct.Struct("<dddd?BBddbbddd??bd?d")
+NOT_FINISHED = 0xFFFFFFFF
+keyframe_ticks = 300
+replay_dir = Path(__file__).parent / "replays"
+
+
+class Replay:
+    def __init__(self, masks, keyframes, finish_tick=None, player="", level="", recorded=0.0,
+                 interval=keyframe_ticks):
+        self.masks = masks  # bytes: маска на каждый тик
+        self.keyframes = keyframes  # состояние перед тиком i * interval
+        self.finish_tick = finish_tick
+        self.player = player
+        self.level = level
+        self.recorded = recorded
+        self.interval = interval
+
+    @property
+    def ticks(self):
+        return len(self.masks)
+
+    @property
+    def finished(self):
+        return self.finish_tick is not None
+
+    def to_bytes(self):
+        player = self.player.encode("utf-8")
+        level = self.level.encode("utf-8")
+        finish = NOT_FINISHED if self.finish_tick is None else self.finish_tick
+        out = bytearray(HEADER.pack(MAGIC, VERSION, self.interval, self.ticks, finish, self.recorded,
+                                    len(player), len(level)))
+        out += player + level
+        runs, encoded = encode_runs(self.masks)
+        out += COUNT.pack(runs)
+        out += encoded
+        out += COUNT.pack(len(self.keyframes))
+        for state in self.keyframes:
+            out += KEYFRAME.pack(*state)
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, interval, ticks, finish, recorded, player_length, level_length = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("не запись прогона или старая версия формата")
+        offset = HEADER.size
+        player = data[offset:offset + player_length].decode("utf-8")
+        offset += player_length
+        level = data[offset:offset + level_length].decode("utf-8")
+        offset += level_length
+        (runs,) = COUNT.unpack_from(data, offset)
+        masks, offset = decode_runs(data, offset + COUNT.size, runs)
+        if len(masks) != ticks:
+            raise ValueError(f"повреждённая запись: {len(masks)} тиков вместо {ticks}")
+        (count,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        keyframes = [KEYFRAME.unpack_from(data, offset + i * KEYFRAME.size) for i in range(count)]
+        return cls(masks, keyframes, None if finish == NOT_FINISHED else finish, player, level, recorded, interval)
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(path.name + ".tmp")
+        with open(temp_path, "wb") as f:
+            f.write(self.to_bytes())
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+def count_runs(masks):
+    runs = 0
+    previous = None
+    for mask in masks:
+        if mask != previous:
+            runs += 1
+            previous = mask
+    return runs
+
+
+def encode_runs(masks):
+    # (число серий, байты серий)
+    out = bytearray()
+    runs = index = 0
+    total = len(masks)
+    while index < total:
+        mask = masks[index]
+        end = index + 1
+        while end < total and masks[end] == mask:
+            end += 1
+        length = end - index
+        while length >= 0x80:
+            out.append(length & 0x7F | 0x80)
+            length >>= 7
+        out.append(length)
+        out.append(mask)
+        runs += 1
+        index = end
+    return runs, out
+
+
+def decode_runs(data, offset, runs):
+    masks = bytearray()
+    for _ in range(runs):
+        length = shift = 0
+        while True:
+            byte = data[offset]
+            offset += 1
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if byte < 0x80:
+                break
+        masks += bytes((data[offset],)) * length
+        offset += 1
+    return bytes(masks), offset
+
+
+class Recorder:
+    # Запись идёт в игровом шаге: байт в bytearray за тик и кортеж состояния раз в interval тиков
+    def __init__(self, player="", level="", interval=keyframe_ticks):
+        self.player = player
+        self.level = level
+        self.interval = interval
+        self.masks = bytearray()
+        self.keyframes = []
+        self.finish_tick = None
+
+    def record(self, sim, mask):
+        # До шага: снимок описывает состояние, из которого этот тик считается
+        if not len(self.masks) % self.interval:
+            self.keyframes.append(sim.save_state())
+        self.masks.append(mask)
+
+    def finish(self):
+        if self.finish_tick is None:
+            self.finish_tick = len(self.masks)
+
+    def replay(self):
+        return Replay(bytes(self.masks), list(self.keyframes), self.finish_tick, self.player, self.level,
+                      time.time(), self.interval)
+
+
+def best_path(directory, level):
+    return Path(directory) / f"best-{level}.rpl"
+
+
+def load_best(directory, level):
+    try:
+        return Replay.load(best_path(directory, level))
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def save_run(recorder, directory=replay_dir):
+    # Каждый прогон — в свой файл; законченный и более быстрый становится лучшим для призрака
+    replay = recorder.replay()
+    if not replay.ticks:
+        return replay
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(replay.recorded))
+    path = Path(directory) / f"{stamp}-{int(replay.recorded * 1000) % 1000:03d}-{recorder.level}.rpl"
+    try:
+        replay.save(path)
+        if replay.finished:
+            best = load_best(directory, recorder.level)
+            if best is None or replay.finish_tick < best.finish_tick:
+                replay.save(best_path(directory, recorder.level))
+    except OSError as error:
+        # Запись прогона не должна прерывать игру
+        print(f"Предупреждение: прогон не сохранён: {error}")
+    return replay
+
+
+class Ghost:
+    # Воспроизведение записи своей симуляцией; на тиках снимков состояние берётся из записи
+    def __init__(self, replay, grid, hazards):
+        self.replay = replay
+        self.hazards = hazards  # индекс шипов; при перезагрузке карты обновляется на месте
+        self.sim = PlayerSim(grid, spawn_x, spawn_y)
+        self.sim.hazard_test = lambda player: bool(self.hazards.query(player.left, player.right,
+                                                                      player.bottom, player.top))
+        self.tick = 0
+        self.seek(0)
+
+    @property
+    def done(self):
+        return self.tick >= self.replay.ticks
+
+    def seek(self, tick):
+        # Ближайший снимок не позже tick, дальше — меньше interval шагов
+        interval = self.replay.interval
+        keyframe = min(tick // interval, len(self.replay.keyframes) - 1)
+        if keyframe >= 0:
+            self.sim.load_state(self.replay.keyframes[keyframe])
+            self.tick = keyframe * interval
+        while self.tick < tick and not self.done:
+            self.step()
+
+    def step(self, delta_time=1 / sim_rate):
+        if self.done:
+            return
+        replay = self.replay
+        if not self.tick % replay.interval and self.tick // replay.interval < len(replay.keyframes):
+            self.sim.load_state(replay.keyframes[self.tick // replay.interval])
+        self.sim.step(replay.masks[self.tick], delta_time)
+        self.tick += 1
+
+
+def check(replay, map_path):
+    # Расхождение воспроизведения с записью: на каждом снимке — сдвиг позиции перед загрузкой снимка
+    from batch import World
+    world = World(map_path)
+    ghost = Ghost(replay, world.grid, world.hazards)
+    drift = []
+    deaths = 0
+    for tick in range(replay.ticks):
+        if tick and not tick % replay.interval and tick // replay.interval < len(replay.keyframes):
+            state = replay.keyframes[tick // replay.interval]
+            drift.append(max(abs(ghost.sim.x - state[0]), abs(ghost.sim.y - state[1])))
+        ghost.step()
+        deaths += bool(ghost.sim.events & EV_DIED)
+    return drift, deaths
+
+
+def main():
+    from level import default_map_path
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else best_path(replay_dir, "proj1")
+    replay = Replay.load(path)
+    size = os.path.getsize(path)
+    finished = f"финиш на тике {replay.finish_tick}" if replay.finished else "не закончен"
+    print(f"{path}: {replay.player or '?'} на {replay.level or '?'}, {replay.ticks} тиков "
+          f"({replay.ticks / sim_rate:.1f} с), {finished}")
+    print(f"{size} байт: серий {count_runs(replay.masks)}, снимков {len(replay.keyframes)} "
+          f"по {KEYFRAME.size} байт, {size * sim_rate * 60 / max(1, replay.ticks):.0f} байт на минуту")
+    drift, deaths = check(replay, default_map_path())
+    print(f"воспроизведение: смертей {deaths}, расхождение на снимках до {max(drift, default=0.0):.2f} px")
+
+
+if __name__ == "__main__":
+    main()
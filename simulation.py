@@ -0,0 +1,328 @@
+import math
+
+# Правила движения игрока без окна, камер и arcade: состояние продвигается по маске ввода.
+# MyGame рисует это состояние, а пакетные прогоны и тесты гоняют его напрямую.
+
+# Константы. Скорости и гравитация — в единицах за шаг, правила рассчитаны на sim_rate шагов в секунду
+sim_rate = 60
+gravity = 0.9
+move_speed = 1.6
+jump_speed = 5.8
+coyote_time = 0.08
+jump_buffer = 0.12
+max_jumps = 1
+dash_duration = 0.12
+dash_speed = 300.0
+dash_post_impulse = 6
+max_dashes = 1
+max_stamina = 5.0
+climb_speed = 0.85
+wall_dash_stamina_cost = 2.0
+jump_cut = 0.45
+respawn_delay = 0.8
+sprite_scale = 0.35
+map_scaling = 0.5
+tile_size = 16 * map_scaling
+spawn_x = 6 * tile_size
+spawn_y = 13 * tile_size + (32 * sprite_scale) / 2
+
+# Хитбокс игрока относительно центра: непрозрачная область первого кадра Run (32x32).png
+player_frame_bbox = (4, 5, 27, 29)
+player_hitbox = (
+    (player_frame_bbox[0] - 16) * sprite_scale,
+    (player_frame_bbox[2] - 16) * sprite_scale,
+    (16 - player_frame_bbox[3]) * sprite_scale,
+    (16 - player_frame_bbox[1]) * sprite_scale,
+)
+
+# Биты маски ввода за один тик
+IN_LEFT = 1 << 0
+IN_RIGHT = 1 << 1
+IN_UP = 1 << 2
+IN_DOWN = 1 << 3
+IN_JUMP = 1 << 4
+IN_DASH = 1 << 5
+IN_CLIMB = 1 << 6
+
+# События последнего тика (маска)
+EV_DIED = 1 << 0
+EV_RESPAWNED = 1 << 1
+EV_JUMPED = 1 << 2
+EV_DASHED = 1 << 3
+EV_CLIMB_START = 1 << 4
+
+# Изменяемое состояние игрока: всё, что шаг читает из прошлого шага (флаги клавиш выводятся из held)
+STATE_FIELDS = (
+    "x", "y", "change_x", "change_y", "facing_right", "held", "suppressed", "jump_buffer_timer",
+    "time_since_ground", "jumps_left", "dashes_left", "dash_time_left", "dash_dx", "dash_dy", "was_dashing",
+    "on_wall", "wall_side", "stamina", "is_dead", "respawn_timer",
+)
+
+
+class PlayerSim:
+    def __init__(self, grid, spawn_x, spawn_y, hitbox=player_hitbox):
+        self.grid = grid
+        self.spawn_x = spawn_x
+        self.spawn_y = spawn_y
+        self.hitbox = hitbox
+        # Проверка шипов: вызывается в начале живого тика, истина — игрок погиб
+        self.hazard_test = None
+
+        self.x = spawn_x
+        self.y = spawn_y
+        self.change_x = self.change_y = 0.0
+        self.facing_right = True
+
+        # Ввод: held — действующая маска, suppressed — клавиши, зажатые до смерти
+        self.held = self.suppressed = 0
+        self.left_key = self.right_key = self.up_key = self.down_key = False
+        self.jump_pressed = self.climb_key = False
+
+        self.jump_buffer_timer = 0.0
+        self.time_since_ground = 999.0
+        self.jumps_left = max_jumps
+        self.dashes_left = max_dashes
+        self.dash_time_left = 0.0
+        self.dash_dx = self.dash_dy = 1.0
+        self.was_dashing = False
+        self.on_wall = False
+        self.wall_side = 0
+        self.stamina = max_stamina
+        self.is_dead = False
+        self.respawn_timer = 0.0
+        self.events = 0
+
+    # Границы хитбокса, совместимые с проверками TileGrid
+    @property
+    def left(self):
+        return self.x + self.hitbox[0]
+
+    @property
+    def right(self):
+        return self.x + self.hitbox[1]
+
+    @property
+    def bottom(self):
+        return self.y + self.hitbox[2]
+
+    @property
+    def top(self):
+        return self.y + self.hitbox[3]
+
+    def save_state(self):
+        # Компактный снимок для поиска по состояниям: кортеж вместо копии объекта
+        return tuple(getattr(self, name) for name in STATE_FIELDS)
+
+    def load_state(self, state):
+        self.__dict__.update(zip(STATE_FIELDS, state))
+        self.set_input(self.held)
+
+    def set_input(self, held):
+        self.held = held
+        self.left_key = bool(held & IN_LEFT)
+        self.right_key = bool(held & IN_RIGHT)
+        self.up_key = bool(held & IN_UP)
+        self.down_key = bool(held & IN_DOWN)
+        self.jump_pressed = bool(held & IN_JUMP)
+        self.climb_key = bool(held & IN_CLIMB)
+
+    def kill(self):
+        self.is_dead = True
+        self.events |= EV_DIED
+        # Зажатые клавиши не действуют, пока их не отпустят после возрождения
+        self.suppressed |= self.held
+        self.set_input(0)
+
+    def respawn(self):
+        self.x = self.spawn_x
+        self.y = self.spawn_y
+        self.change_x = self.change_y = 0
+        self.set_input(0)
+        self.stamina = max_stamina
+        self.dashes_left = max_dashes
+        self.jumps_left = max_jumps
+        self.is_dead = False
+        self.respawn_timer = 0.0
+        self.events |= EV_RESPAWNED
+
+    def wall_contact(self):
+        if self.grid.solid_below(self, 2):
+            return False, 0
+        # Надёжная проверка: минимальный сдвиг (1.2 пикселя) для обнаружения стены
+        if self.grid.solid_left(self, 1.2):
+            return True, -1
+        elif self.grid.solid_right(self, 1.2):
+            return True, 1
+        return False, 0
+
+    def perform_dash(self):
+        if self.dashes_left <= 0 or self.is_dead:
+            return
+
+        if self.on_wall:
+            dx, dy = (1.0, 0.35) if self.wall_side == -1 else (-1.0, 0.35)
+            self.stamina -= wall_dash_stamina_cost
+            self.stamina = max(0.0, self.stamina)
+        else:
+            # Приоритет: чисто вертикальные, затем чисто горизонтальные, затем диагонали
+            if self.up_key and not (self.left_key or self.right_key):
+                horizontal, vertical = 0, 1
+            elif self.down_key and not (self.left_key or self.right_key):
+                horizontal, vertical = 0, -1
+            elif self.right_key and not (self.up_key or self.down_key):
+                horizontal, vertical = 1, 0
+            elif self.left_key and not (self.up_key or self.down_key):
+                horizontal, vertical = -1, 0
+            else:
+                horizontal = (1 if self.right_key else -1 if self.left_key else (1 if self.facing_right else -1))
+                vertical = (1 if self.up_key else -1 if self.down_key else 0)
+
+            length = math.hypot(horizontal, vertical)
+            if length > 0:
+                dx = horizontal / length
+                dy = vertical / length
+            else:
+                dx, dy = 1.0 if self.facing_right else -1.0, 0.0
+
+        self.dash_dx, self.dash_dy = dx, dy
+        self.dash_time_left = dash_duration
+        self.dashes_left = 0
+        self.events |= EV_DASHED
+        if self.on_wall:
+            self.on_wall = False
+
+    def move_dash(self, distance):
+        # Длинный рывок делится на подшаги не больше тайла, каждая ось сдвигается до касания
+        substeps = max(1, math.ceil(distance / tile_size))
+        step = distance / substeps
+        for _ in range(substeps):
+            moved_x = self.grid.sweep_sprite_x(self, self.dash_dx * step)
+            self.x += moved_x
+            moved_y = self.grid.sweep_sprite_y(self, self.dash_dy * step)
+            self.y += moved_y
+            if moved_x == 0 and moved_y == 0:
+                # Упёрлись по обеим осям — рывок окончен
+                self.dash_time_left = 0
+                break
+
+    def apply_physics(self):
+        # Гравитация и перемещение по осям до касания (замена PhysicsEnginePlatformer)
+        grid = self.grid
+        if grid.sprite_hits(self):
+            self.y += grid.push_sprite_out_y(self, 1)
+        self.change_y -= gravity
+        moved_y = grid.sweep_sprite_y(self, self.change_y)
+        self.y += moved_y
+        if moved_y != self.change_y:
+            self.change_y = 0.0
+        if self.change_x:
+            self.x += grid.sweep_sprite_x(self, self.change_x)
+
+    def step(self, held, delta_time):
+        self.events = 0
+        if self.is_dead:
+            self.suppressed |= held
+            self.respawn_timer += delta_time
+            if self.respawn_timer >= respawn_delay:
+                self.respawn()
+            return
+
+        if self.hazard_test is not None and self.hazard_test(self):
+            self.kill()
+            return
+
+        self.suppressed &= held
+        previous = self.held
+        self.set_input(held & ~self.suppressed)
+        pressed = self.held & ~previous
+        released = previous & ~self.held
+        if pressed & IN_JUMP:
+            self.jump_buffer_timer = jump_buffer
+        if released & IN_JUMP and self.change_y > 0:
+            self.change_y *= jump_cut
+
+        grid = self.grid
+        grounded = grid.solid_below(self, 6)
+        if grounded:
+            self.time_since_ground = 0
+            self.jumps_left = max_jumps
+            self.dashes_left = max_dashes
+            self.stamina = max_stamina
+            self.on_wall = False
+        else:
+            self.time_since_ground += delta_time
+
+        next_to_wall, side = self.wall_contact()
+        if self.climb_key and next_to_wall and self.stamina > 0 and not grounded:
+            if not self.on_wall:
+                self.events |= EV_CLIMB_START
+            self.on_wall = True
+            self.wall_side = side
+
+            # Прижимаем игрока к стене для плавного лазания
+            if self.wall_side == -1:  # слева
+                for left, right, _, _ in grid.solid_rects(self.left, self.right, self.bottom, self.top):
+                    if right < self.x and right > self.left - 5:
+                        self.x = right + 0.5 - self.hitbox[0]
+                        break
+            else:  # справа
+                for left, right, _, _ in grid.solid_rects(self.left, self.right, self.bottom, self.top):
+                    if left > self.x and left < self.right + 5:
+                        self.x = left - 0.5 - self.hitbox[1]
+                        break
+        else:
+            if not self.climb_key or self.stamina <= 0 or not next_to_wall:
+                self.on_wall = False
+
+        if self.on_wall:
+            self.change_y = 0
+            # Лазание со swept-проверкой: игрок останавливается ровно у потолка/пола
+            if self.up_key:
+                self.y += grid.sweep_sprite_y(self, climb_speed)
+                self.stamina -= delta_time * 1.0
+            elif self.down_key:
+                self.y += grid.sweep_sprite_y(self, -climb_speed)
+                self.stamina -= delta_time * 0.7
+            else:
+                self.stamina -= delta_time * 0.4
+
+            # Если игрок уже застрял в тайле, выталкиваем его за один шаг
+            if (self.up_key or self.down_key) and grid.sprite_hits(self):
+                self.y += grid.push_sprite_out_y(self, -1 if self.up_key else 1)
+            self.stamina = max(0.0, self.stamina)
+        elif grounded:
+            self.stamina = min(max_stamina, self.stamina + delta_time * 2.5)
+
+        if not (self.dash_time_left > 0 and self.on_wall):
+            self.change_x = -move_speed if (self.left_key and not self.right_key) else (
+                move_speed if (self.right_key and not self.left_key) else 0)
+        else:
+            self.change_x = 0
+
+        if self.jump_buffer_timer > 0:
+            self.jump_buffer_timer -= delta_time
+        if (self.jump_pressed or self.jump_buffer_timer > 0) and (grounded or self.time_since_ground <= coyote_time):
+            self.change_y = jump_speed
+            self.jump_buffer_timer = 0
+            self.events |= EV_JUMPED
+
+        if pressed & IN_DASH:
+            self.perform_dash()
+
+        if self.dash_time_left > 0:
+            self.dash_time_left -= delta_time
+            if self.dash_time_left < 0:
+                self.dash_time_left = 0
+            self.move_dash(dash_speed * delta_time)
+
+        if self.dash_time_left <= 0 and self.was_dashing:
+            self.change_x = self.dash_dx * dash_post_impulse
+            self.change_y = self.dash_dy * dash_post_impulse
+        self.was_dashing = self.dash_time_left > 0
+
+        if not self.on_wall and self.dash_time_left <= 0:
+            self.apply_physics()
+
+        moving_horizontally = (self.left_key or self.right_key) and not self.on_wall and self.dash_time_left <= 0
+        if moving_horizontally and abs(self.change_x) > 0.1:
+            self.facing_right = self.right_key or (not self.left_key and self.facing_right)
@@ -0,0 +1,50 @@
+import math
+
+
+# Пространственный хеш по клеткам: объект хранится в каждой клетке, которую задевает его прямоугольник
+class SpatialHash:
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.bounds = {}
+
+    def __len__(self):
+        return len(self.bounds)
+
+    def __contains__(self, item):
+        return item in self.bounds
+
+    def cell_keys(self, left, right, bottom, top):
+        size = self.cell_size
+        for row in range(math.floor(bottom / size), math.floor(top / size) + 1):
+            for col in range(math.floor(left / size), math.floor(right / size) + 1):
+                yield col, row
+
+    def insert(self, item, left, right, bottom, top):
+        self.bounds[item] = (left, right, bottom, top)
+        for key in self.cell_keys(left, right, bottom, top):
+            self.cells.setdefault(key, []).append(item)
+
+    def remove(self, item):
+        rect = self.bounds.pop(item, None)
+        if rect is None:
+            return
+        for key in self.cell_keys(*rect):
+            bucket = self.cells.get(key)
+            if bucket is not None:
+                bucket.remove(item)
+                if not bucket:
+                    del self.cells[key]
+
+    def query(self, left, right, bottom, top):
+        # Объекты, чьи прямоугольники пересекают запрос (касание края не считается)
+        found = []
+        bounds = self.bounds
+        cells = self.cells
+        for key in self.cell_keys(left, right, bottom, top):
+            for item in cells.get(key, ()):
+                item_left, item_right, item_bottom, item_top = bounds[item]
+                if (item_left < right and left < item_right and item_bottom < top and bottom < item_top
+                        and item not in found):
+                    found.append(item)
+        return found
@@ -0,0 +1,60 @@
+import os
+import sys
+import time
+
+# Трассировка запуска: сколько заняла каждая фаза от старта процесса до первого кадра меню.
+# Отметки ставятся всегда (это одно чтение часов), отчёт печатается при Q31_STARTUP_TRACE=1
+# или с ключом --startup-trace.
+#
+# Первая фаза, «interpreter», — от старта процесса до импорта этого модуля: запуск Python
+# и всё, что импортировалось раньше. Время старта процесса берётся из /proc (Linux);
+# где его нет, отсчёт идёт от импорта модуля.
+
+enabled = os.environ.get("Q31_STARTUP_TRACE") == "1" or "--startup-trace" in sys.argv
+
+
+def process_age():
+    # Сколько секунд назад запущен процесс, или None, если узнать нельзя
+    try:
+        with open("/proc/self/stat", encoding="ascii") as f:
+            # Имя процесса в скобках может содержать пробелы: поля считаются после него
+            fields = f.read().rsplit(")", 1)[1].split()
+        started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - started
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+_age = process_age()
+_last = time.perf_counter()
+phases = [("interpreter", _age)] if _age is not None else []
+finished = False
+
+
+def mark(phase):
+    # Время с предыдущей отметки уходит в фазу phase
+    global _last
+    if finished:
+        return
+    now = time.perf_counter()
+    phases.append((phase, now - _last))
+    _last = now
+
+
+def finish(phase):
+    # Последняя фаза — до первого нарисованного кадра; дальше отметки не ставятся
+    global finished
+    if finished:
+        return
+    mark(phase)
+    finished = True
+    if enabled:
+        report()
+
+
+def report(out=sys.stderr):
+    total = 0.0
+    print(f"{'фаза':<14} {'мс':>9} {'всего мс':>10}", file=out)
+    for phase, seconds in phases:
+        total += seconds
+        print(f"{phase:<14} {seconds * 1000:>9.1f} {total * 1000:>10.1f}", file=out)
@@ -0,0 +1,80 @@
+import csv
+import os
+import sqlite3
+import threading
+
+# Статистика игроков в SQLite: первичный ключ по имени для поиска и обновления за O(log n),
+# индекс по фруктам для страниц таблицы лидеров без полной сортировки.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    name TEXT PRIMARY KEY,
+    deaths INTEGER NOT NULL DEFAULT 0,
+    fruits INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS players_by_fruits ON players (fruits DESC, name);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID;
+"""
+
+
+class StatsStore:
+    def __init__(self, path, csv_path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        # Соединение делят игровой поток и поток StatsWriter, доступ под self.lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.executescript(SCHEMA)
+        if csv_path:
+            self.import_csv(csv_path)
+
+    def import_csv(self, csv_path):
+        # Разовый перенос старого game_stats.csv
+        with self.lock:
+            done = self.conn.execute("SELECT value FROM meta WHERE key = 'csv_imported'").fetchone()
+        if done or not os.path.exists(csv_path):
+            return
+        rows = []
+        try:
+            with open(csv_path, 'r', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    name = row.get("player_name", "").strip()
+                    if name:
+                        rows.append((name, int(row.get("deaths") or 0), int(row.get("fruits_collected") or 0)))
+        except (OSError, ValueError, csv.Error):
+            return
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO players (name, deaths, fruits) VALUES (?, ?, ?) ON CONFLICT(name) DO NOTHING", rows)
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('csv_imported', ?)", (csv_path,))
+
+    def get(self, name):
+        with self.lock:
+            row = self.conn.execute("SELECT deaths, fruits FROM players WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        return {"deaths": row[0], "fruits_collected": row[1]}
+
+    def save_rows(self, rows):
+        # rows: имя → {"deaths", "fruits_collected"}; одна транзакция на пачку
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO players (name, deaths, fruits) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET deaths = excluded.deaths, fruits = excluded.fruits",
+                [(name, row["deaths"], row["fruits_collected"]) for name, row in rows.items()])
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM players").fetchone()[0]
+
+    def leaderboard(self, page, page_size):
+        # Страница по индексу players_by_fruits: читается только нужный отрезок
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT name, deaths, fruits FROM players ORDER BY fruits DESC, name LIMIT ? OFFSET ?",
+                (page_size, page * page_size)).fetchall()
+        return [{"name": name, "deaths": deaths, "fruits": fruits} for name, deaths, fruits in rows]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,63 @@
+import sqlite3
+import threading
+import time
+
+
+# Запись статистики вне игрового цикла: обновления копятся в памяти,
+# фоновый поток сбрасывает их с задержкой одной транзакцией StatsStore
+class StatsWriter:
+    def __init__(self, store, delay=1.0, max_delay=5.0):
+        self.store = store
+        self.delay = delay
+        self.max_delay = max_delay
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.closing = False
+        self.thread = None
+
+    def update(self, name, stats):
+        with self.lock:
+            self.pending[name] = {"deaths": stats["deaths"], "fruits_collected": stats["fruits_collected"]}
+            if self.thread is None and not self.closing:
+                self.thread = threading.Thread(target=self.run, name="stats-writer", daemon=True)
+                self.thread.start()
+        self.wake.set()
+
+    def pending_row(self, name):
+        with self.lock:
+            return self.pending.get(name)
+
+    def run(self):
+        while not self.closing:
+            self.wake.wait()
+            # Дебаунс: ждём затишья в delay секунд, но не дольше max_delay с первого обновления
+            started = time.monotonic()
+            while not self.closing and time.monotonic() - started < self.max_delay:
+                self.wake.clear()
+                if not self.wake.wait(self.delay):
+                    break
+            self.flush()
+
+    def flush(self):
+        with self.write_lock:
+            with self.lock:
+                rows, self.pending = self.pending, {}
+            if not rows:
+                return
+            try:
+                self.store.save_rows(rows)
+            except sqlite3.Error:
+                # Не получилось — вернём строки, если их не успели обновить заново
+                with self.lock:
+                    for name, row in rows.items():
+                        self.pending.setdefault(name, row)
+
+    def close(self):
+        self.closing = True
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
@@ -0,0 +1,347 @@
+import argparse
+import os
+import queue
+import struct
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from simulation import EV_CLIMB_START, EV_DASHED, EV_DIED
+
+# Телеметрия игры: события с позицией игрока — смерти (и шип, на котором погиб), фрукты, начала
+# рывков и лазания, позиция раз в sample_ticks тиков. game_stats хранит только итоги по игроку,
+# а отсюда видно, где умирают и какими путями ходят.
+#
+# Игровой поток пишет событие в преаллоцированные столбцы NumPy — без объектов на событие.
+# Заполненный (или за flush_interval) блок уходит фоновому потоку, тот дописывает его в файл
+# сессии и возвращает столбцы в пул.
+#
+# Формат файла (little-endian), только дозапись:
+#   заголовок  magic "QTLM", версия, время начала сессии, длины имён игрока и карты, сами имена (UTF-8)
+#   блоки      magic "QTLB", число событий n, затем столбцы подряд: время float64[n] (unix),
+#              x float32[n], y float32[n], подробность int32[n] (клетка шипа или фрукта, строка
+#              сверху, иначе -1), вид uint8[n]
+# Оборванный при выключении хвост читатель пропускает.
+#
+#   python telemetry.py --map maps/proj1.tmx --kind death --png deaths.png   — карта тепла по логам
+#   python telemetry.py --bench 20000000   — время сводки на синтетическом логе такого размера
+
+MAGIC = b"QTLM"
+BLOCK_MAGIC = b"QTLB"
+VERSION = 1
+HEADER = struct.Struct("<4sHdHH")
+BLOCK = struct.Struct("<4sI")
+COLUMNS = (("time", np.dtype("<f8")), ("x", np.dtype("<f4")), ("y", np.dtype("<f4")),
+           ("detail", np.dtype("<i4")), ("kind", np.dtype("u1")))
+EVENT_BYTES = sum(dtype.itemsize for _, dtype in COLUMNS)
+
+# Виды событий
+DEATH = 1
+FRUIT = 2
+DASH = 3
+CLIMB = 4
+POSITION = 5
+KINDS = {"death": DEATH, "fruit": FRUIT, "dash": DASH, "climb": CLIMB, "position": POSITION}
+
+telemetry_dir = Path(__file__).parent / "telemetry"
+block_events = 1024  # при 6 позициях в секунду блок уходит по flush_interval, а не по размеру
+flush_interval = 10.0  # секунд: киоск не теряет больше этого при выключении питания
+sample_ticks = 10  # позиция — 6 раз в секунду при sim_rate 60
+
+
+class Block:
+    def __init__(self, capacity=block_events):
+        self.columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in COLUMNS}
+        self.capacity = capacity
+        self.count = 0
+
+    def to_bytes(self):
+        count = self.count
+        return BLOCK.pack(BLOCK_MAGIC, count) + b"".join(self.columns[name][:count].tobytes() for name, _ in COLUMNS)
+
+
+def session_path(directory, level, started):
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(started))
+    return Path(directory) / f"{stamp}-{int(started * 1000) % 1000:03d}-{level}.tlm"
+
+
+class TelemetryLog:
+    def __init__(self, directory=telemetry_dir, player="", level=""):
+        self.player = player
+        self.level = level
+        self.started = time.time()
+        self.path = session_path(directory, level, self.started)
+        self.block = Block()
+        self.block_started = self.started
+        self.ticks = 0
+        self.free = queue.SimpleQueue()
+        self.blocks = queue.SimpleQueue()
+        self.thread = None
+        self.failed = False
+
+    def log(self, kind, x, y, detail=-1):
+        now = time.time()
+        block = self.block
+        index = block.count
+        columns = block.columns
+        columns["time"][index] = now
+        columns["x"][index] = x
+        columns["y"][index] = y
+        columns["detail"][index] = detail
+        columns["kind"][index] = kind
+        block.count = index + 1
+        if block.count == block.capacity or now - self.block_started >= flush_interval:
+            self.flush()
+
+    def record(self, sim, spike=-1):
+        # События тика симуляции (биты EV_*) и позиция живого игрока раз в sample_ticks тиков
+        events = sim.events
+        if events:
+            if events & EV_DIED:
+                self.log(DEATH, sim.x, sim.y, spike)
+            if events & EV_DASHED:
+                self.log(DASH, sim.x, sim.y)
+            if events & EV_CLIMB_START:
+                self.log(CLIMB, sim.x, sim.y)
+        if not sim.is_dead:
+            if not self.ticks % sample_ticks:
+                self.log(POSITION, sim.x, sim.y)
+            self.ticks += 1
+
+    def fruit(self, x, y, cell):
+        self.log(FRUIT, x, y, cell)
+
+    def flush(self):
+        # Текущий блок — фоновому потоку, писать дальше — в свободный из пула
+        if not self.block.count:
+            return
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="telemetry-writer", daemon=True)
+            self.thread.start()
+        self.blocks.put(self.block)
+        try:
+            self.block = self.free.get_nowait()
+        except queue.Empty:
+            self.block = Block()
+        self.block_started = time.time()
+
+    def run(self):
+        while True:
+            block = self.blocks.get()
+            if block is None:
+                return
+            self.write(block)
+            block.count = 0
+            self.free.put(block)
+
+    def write(self, block):
+        if self.failed:
+            return
+        try:
+            new = not self.path.exists()
+            if new:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "ab") as f:
+                if new:
+                    player = self.player.encode("utf-8")
+                    level = self.level.encode("utf-8")
+                    f.write(HEADER.pack(MAGIC, VERSION, self.started, len(player), len(level)) + player + level)
+                f.write(block.to_bytes())
+        except OSError as error:
+            # Телеметрия не должна прерывать игру
+            self.failed = True
+            print(f"Предупреждение: телеметрия не пишется: {error}")
+
+    def close(self):
+        self.flush()
+        if self.thread is not None:
+            self.blocks.put(None)
+            self.thread.join()
+            self.thread = None
+
+
+# ---- чтение и сводка ----
+
+def read_log(path):
+    # (игрок, карта, {столбец: массив}) по всем целым блокам файла
+    data = np.fromfile(path, dtype=np.uint8)
+    magic, version, _, player_length, level_length = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path}: не лог телеметрии или старая версия формата")
+    offset = HEADER.size
+    player = data[offset:offset + player_length].tobytes().decode("utf-8")
+    offset += player_length
+    level = data[offset:offset + level_length].tobytes().decode("utf-8")
+    offset += level_length
+    parts = {name: [] for name, _ in COLUMNS}
+    while offset + BLOCK.size <= len(data):
+        magic, count = BLOCK.unpack_from(data, offset)
+        end = offset + BLOCK.size + count * EVENT_BYTES
+        if magic != BLOCK_MAGIC or end > len(data):
+            break
+        offset += BLOCK.size
+        for name, dtype in COLUMNS:
+            size = count * dtype.itemsize
+            parts[name].append(data[offset:offset + size].view(dtype))
+            offset += size
+    return player, level, {name: np.concatenate(arrays) if arrays else np.empty(0, dtype)
+                           for (name, dtype), arrays in zip(COLUMNS, parts.values())}
+
+
+def tile_heat(columns, width, height, tile_size):
+    # Число событий по виду и клетке TMX одним bincount: массив (вид, строка сверху, столбец)
+    cols = np.floor(columns["x"] / tile_size).astype(np.int64)
+    rows = height - 1 - np.floor(columns["y"] / tile_size).astype(np.int64)
+    kinds = max(KINDS.values()) + 1
+    inside = (cols >= 0) & (cols < width) & (rows >= 0) & (rows < height) & (columns["kind"] < kinds)
+    cells = width * height
+    index = columns["kind"][inside].astype(np.int64) * cells + rows[inside] * width + cols[inside]
+    return np.bincount(index, minlength=kinds * cells).reshape(kinds, height, width)
+
+
+def detail_heat(columns, kind, cells):
+    # Событий вида на каждую клетку из подробности: например, смертей на каждом шипе
+    details = columns["detail"][(columns["kind"] == kind) & (columns["detail"] >= 0) & (columns["detail"] < cells)]
+    return np.bincount(details, minlength=cells)
+
+
+def aggregate(directory, level, width, height, tile_size, since=None):
+    # Сводка по всем сессиям карты: файлы читаются по одному, в памяти — только счётчики клеток
+    heat = np.zeros((max(KINDS.values()) + 1, height, width), dtype=np.int64)
+    deaths = np.zeros(width * height, dtype=np.int64)
+    sessions = events = 0
+    for path in sorted(Path(directory).glob("*.tlm")):
+        try:
+            _, log_level, columns = read_log(path)
+        except (OSError, ValueError, struct.error) as error:
+            print(f"Предупреждение: {path} пропущен: {error}")
+            continue
+        if log_level != level:
+            continue
+        if since is not None:
+            keep = columns["time"] >= since
+            columns = {name: values[keep] for name, values in columns.items()}
+        sessions += 1
+        events += len(columns["kind"])
+        heat += tile_heat(columns, width, height, tile_size)
+        deaths += detail_heat(columns, DEATH, width * height)
+    return {"heat": heat, "deaths": deaths, "sessions": sessions, "events": events}
+
+
+def render_map(level):
+    # Видимые слои картинкой в пикселях тайлсетов; крупные тайлы выступают вверх и вправо, как в игре
+    from PIL import Image
+    from atlas_pack import FLIPPED_DIAGONALLY, FLIPPED_HORIZONTALLY, FLIPPED_VERTICALLY, tile_images
+    from level import GID_MASK
+
+    images = tile_images(level)
+    image = Image.new("RGBA", (level.width * level.tile_width, level.height * level.tile_height), (135, 206, 235, 255))
+    for name, gids in level.layers.items():
+        if not level.layer_info[name]["visible"]:
+            continue
+        opacity = level.layer_info[name]["opacity"]
+        for index, raw_gid in enumerate(gids):
+            tile = images.get(raw_gid & GID_MASK)
+            if tile is None:
+                continue
+            if raw_gid & FLIPPED_DIAGONALLY:
+                tile = tile.transpose(Image.Transpose.TRANSPOSE)
+            if raw_gid & FLIPPED_HORIZONTALLY:
+                tile = tile.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+            if raw_gid & FLIPPED_VERTICALLY:
+                tile = tile.transpose(Image.Transpose.FLIP_TOP_BOTTOM)
+            if opacity < 1.0:
+                tile = tile.copy()
+                tile.putalpha(tile.getchannel("A").point(lambda alpha: int(alpha * opacity)))
+            col, row = index % level.width, index // level.width
+            image.alpha_composite(tile, (col * level.tile_width, (row + 1) * level.tile_height - tile.height))
+    return image
+
+
+def save_heat_png(level, heat, path):
+    # Тепло поверх карты: от прозрачного синего к непрозрачному красному по логарифму числа событий
+    from PIL import Image
+
+    image = render_map(level)
+    t = np.log1p(heat) / max(np.log1p(heat.max()), 1e-9)
+    overlay = np.zeros(heat.shape + (4,), dtype=np.uint8)
+    overlay[..., 0] = (255 * t).astype(np.uint8)
+    overlay[..., 1] = (80 * (1 - t)).astype(np.uint8)
+    overlay[..., 2] = (255 * (1 - t)).astype(np.uint8)
+    overlay[..., 3] = np.where(heat > 0, 60 + 150 * t, 0).astype(np.uint8)
+    layer = Image.fromarray(overlay).resize(image.size, Image.NEAREST)
+    image.alpha_composite(layer)
+    image.save(path)
+
+
+def write_synthetic(directory, events, level, width, height, tile_size, sessions=200):
+    # Лог «месяца киоска»: сессии блоками по block_events, как их пишет TelemetryLog
+    rng = np.random.default_rng(0)
+    per_session = max(1, events // sessions)
+    for session in range(sessions):
+        log = TelemetryLog(directory, "kiosk", level)
+        log.path = log.path.with_name(f"{session:05d}-{log.path.name}")
+        block = Block(block_events)
+        written = 0
+        while written < per_session:
+            count = min(block_events, per_session - written)
+            columns = block.columns
+            columns["time"][:count] = log.started + np.arange(count) / 6.0
+            columns["x"][:count] = rng.gamma(4.0, width * tile_size / 8, count)
+            columns["y"][:count] = rng.gamma(3.0, height * tile_size / 10, count)
+            columns["detail"][:count] = -1
+            columns["kind"][:count] = rng.choice([POSITION, DEATH, DASH, CLIMB, FRUIT], count,
+                                                  p=[0.9, 0.03, 0.04, 0.025, 0.005])
+            block.count = count
+            log.write(block)
+            written += count
+
+
+def main():
+    from level import default_map_path
+    from map_bundle import load_map
+    from simulation import tile_size
+
+    parser = argparse.ArgumentParser(description="Карты тепла по логам телеметрии игры")
+    parser.add_argument("--dir", default=str(telemetry_dir), help="папка с логами .tlm")
+    parser.add_argument("--map", default=str(default_map_path()), help="путь к TMX")
+    parser.add_argument("--kind", choices=sorted(KINDS), default="death", help="события для карты тепла")
+    parser.add_argument("--since", help="только события с этой даты (ГГГГ-ММ-ДД)")
+    parser.add_argument("--png", help="сохранить карту тепла поверх карты в PNG")
+    parser.add_argument("--bench", type=int, help="записать синтетический лог из стольких событий и свести его")
+    args = parser.parse_args()
+
+    level = load_map(args.map)
+    level_name = Path(args.map).stem
+    directory = args.dir
+    if args.bench:
+        directory = tempfile.mkdtemp(prefix="q31-telemetry-")
+        write_synthetic(directory, args.bench, level_name, level.width, level.height, tile_size)
+    since = time.mktime(time.strptime(args.since, "%Y-%m-%d")) if args.since else None
+
+    started = time.perf_counter()
+    result = aggregate(directory, level_name, level.width, level.height, tile_size, since)
+    elapsed = time.perf_counter() - started
+
+    size = sum(os.path.getsize(path) for path in Path(directory).glob("*.tlm"))
+    print(f"{directory}: сессий {result['sessions']}, событий {result['events']:,}, "
+          f"{size / 1024 / 1024:.1f} МБ, сводка {elapsed:.2f} с")
+    heat = result["heat"]
+    print("  ".join(f"{name}: {int(heat[kind].sum()):,}" for name, kind in KINDS.items()))
+    deaths = result["deaths"]
+    for cell in np.argsort(-deaths, kind="stable")[:10].tolist():
+        if not deaths[cell]:
+            break
+        print(f"  шип col {cell % level.width}, row {cell // level.width}: смертей {deaths[cell]}")
+    if args.png:
+        save_heat_png(level, heat[KINDS[args.kind]], args.png)
+    if args.bench:
+        import shutil
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
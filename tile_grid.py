@@ -0,0 +1,140 @@
+import math
+
+# Допуск, чтобы касание края после точной подстановки не считалось пересечением
+EPSILON = 1e-6
+
+# Статическая сетка занятости тайлов: строка 0 — нижняя, как и мировая ось Y
+class TileGrid:
+    def __init__(self, width, height, cell_size):
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.cells = bytearray(width * height)
+
+    def cell_range(self, low, high, size):
+        # Полуоткрытый интервал [low, high): касание края не считается пересечением
+        first = max(0, math.floor((low + EPSILON) / self.cell_size))
+        last = min(size - 1, math.ceil((high - EPSILON) / self.cell_size) - 1)
+        return first, last
+
+    def cells_in_rect(self, left, right, bottom, top):
+        col0, col1 = self.cell_range(left, right, self.width)
+        row0, row1 = self.cell_range(bottom, top, self.height)
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                yield col, row
+
+    def is_solid(self, col, row):
+        if 0 <= col < self.width and 0 <= row < self.height:
+            return self.cells[row * self.width + col] == 1
+        return False
+
+    def rect_hits(self, left, right, bottom, top):
+        # Самая частая проверка симуляции: cell_range развёрнут на месте, арифметика та же
+        size = self.cell_size
+        width = self.width
+        col0 = math.floor((left + EPSILON) / size)
+        col1 = math.ceil((right - EPSILON) / size) - 1
+        row0 = math.floor((bottom + EPSILON) / size)
+        row1 = math.ceil((top - EPSILON) / size) - 1
+        if col0 < 0:
+            col0 = 0
+        if col1 >= width:
+            col1 = width - 1
+        if row0 < 0:
+            row0 = 0
+        if row1 >= self.height:
+            row1 = self.height - 1
+        cells = self.cells
+        for row in range(row0, row1 + 1):
+            base = row * width
+            if any(cells[base + col0:base + col1 + 1]):
+                return True
+        return False
+
+    def solid_rects(self, left, right, bottom, top):
+        size = self.cell_size
+        for col, row in self.cells_in_rect(left, right, bottom, top):
+            if self.cells[row * self.width + col]:
+                yield col * size, (col + 1) * size, row * size, (row + 1) * size
+
+    def row_solid(self, row, col0, col1):
+        base = row * self.width
+        return any(self.cells[base + col0:base + col1 + 1])
+
+    def column_solid(self, col, row0, row1):
+        width = self.width
+        cells = self.cells
+        for row in range(row0, row1 + 1):
+            if cells[row * width + col]:
+                return True
+        return False
+
+    # Swept AABB: расстояние, которое прямоугольник проходит по оси до первого касания.
+    # Перебираются только клетки на пути, поэтому длинный сдвиг не проскакивает сквозь стену.
+    def sweep_x(self, left, right, bottom, top, dx):
+        size = self.cell_size
+        row0, row1 = self.cell_range(bottom, top, self.height)
+        if dx > 0:
+            first = max(0, math.floor(right / size))
+            last = min(self.width - 1, math.ceil((right + dx) / size) - 1)
+            for col in range(first, last + 1):
+                if self.column_solid(col, row0, row1):
+                    return max(0.0, min(dx, col * size - right))
+        elif dx < 0:
+            first = min(self.width - 1, math.ceil(left / size) - 1)
+            last = max(0, math.floor((left + dx) / size))
+            for col in range(first, last - 1, -1):
+                if self.column_solid(col, row0, row1):
+                    return min(0.0, max(dx, (col + 1) * size - left))
+        return dx
+
+    def sweep_y(self, left, right, bottom, top, dy):
+        size = self.cell_size
+        col0, col1 = self.cell_range(left, right, self.width)
+        if col0 > col1:
+            return dy
+        if dy > 0:
+            first = max(0, math.floor(top / size))
+            last = min(self.height - 1, math.ceil((top + dy) / size) - 1)
+            for row in range(first, last + 1):
+                if self.row_solid(row, col0, col1):
+                    return max(0.0, min(dy, row * size - top))
+        elif dy < 0:
+            first = min(self.height - 1, math.ceil(bottom / size) - 1)
+            last = max(0, math.floor((bottom + dy) / size))
+            for row in range(first, last - 1, -1):
+                if self.row_solid(row, col0, col1):
+                    return min(0.0, max(dy, (row + 1) * size - bottom))
+        return dy
+
+    def push_out_y(self, left, right, bottom, top, direction):
+        # Точный выход из пересечения за один проход по перекрытым клеткам
+        rects = list(self.solid_rects(left, right, bottom, top))
+        if not rects:
+            return 0.0
+        if direction < 0:
+            return min(rect[2] for rect in rects) - top
+        return max(rect[3] for rect in rects) - bottom
+
+    # Проверки относительно хитбокса спрайта
+    def sprite_hits(self, sprite, dx=0.0, dy=0.0):
+        return self.rect_hits(sprite.left + dx, sprite.right + dx, sprite.bottom + dy, sprite.top + dy)
+
+    def solid_left(self, sprite, distance):
+        return self.sprite_hits(sprite, dx=-distance)
+
+    def solid_right(self, sprite, distance):
+        return self.sprite_hits(sprite, dx=distance)
+
+    def solid_below(self, sprite, distance):
+        return self.sprite_hits(sprite, dy=-distance)
+
+    def sweep_sprite_x(self, sprite, dx):
+        return self.sweep_x(sprite.left, sprite.right, sprite.bottom, sprite.top, dx)
+
+    def sweep_sprite_y(self, sprite, dy):
+        return self.sweep_y(sprite.left, sprite.right, sprite.bottom, sprite.top, dy)
+
+    def push_sprite_out_y(self, sprite, direction):
+        return self.push_out_y(sprite.left, sprite.right, sprite.bottom, sprite.top, direction)